@@ -0,0 +1,94 @@
+import json
+import logging
+import os
+import metrics
+from kraken_client import FETCH_WORKERS, POOL_MAXSIZE
+from ssm_cache import get_parameters
+
+logger = logging.getLogger()
+
+# Accounts run at once. Each one fetches its market data on FETCH_WORKERS
+# threads, so by default as many run as the pool has connections for.
+ACCOUNT_CONCURRENCY: int = int(
+    os.environ.get("ACCOUNT_CONCURRENCY", max(POOL_MAXSIZE // FETCH_WORKERS, 1))
+)
+# Event fields that belong to the run rather than to one account.
+SHARED_FIELDS: tuple = ("accounts",)
+
+
+def account_events(event: dict) -> list[dict]:
+    # Every account is a DCA event of its own. Fields set on the run, e.g.
+    # currency and order_expires, apply to every account that does not set
+    # them, and each account names its key parameters in SSM.
+    shared: dict = {
+        key: value for key, value in event.items() if key not in SHARED_FIELDS
+    }
+    events: list[dict] = []
+    for account in event["accounts"]:
+        for field in ("name", "private_key_parameter", "public_key_parameter"):
+            if field not in account:
+                raise KeyError(field)
+        events.append({**shared, **account})
+    return events
+
+
+async def run_accounts(
+    events: list[dict], handle, context=None, concurrency: int = None
+) -> list[dict]:
+    # handle(event, context) is the blocking single account handler. It runs
+    # on worker threads, which share kraken_client's session, and nonces and
+    # rate limits stay per API key, so accounts only wait on each other for
+    # pooled connections.
+    import asyncio
+
+    semaphore = asyncio.Semaphore(concurrency or ACCOUNT_CONCURRENCY)
+
+    async def run(account_event: dict) -> dict:
+        async with semaphore:
+            try:
+                response: dict = await asyncio.to_thread(handle, account_event, context)
+            except Exception as e:
+                logger.error(f"Account {account_event['name']} failed: {str(e)}")
+                response = {
+                    "statusCode": 500,
+                    "body": json.dumps({"message": "Internal server error"}),
+                }
+        return {
+            "account": account_event["name"],
+            "statusCode": response["statusCode"],
+            **json.loads(response["body"]),
+        }
+
+    return list(await asyncio.gather(*(run(account) for account in events)))
+
+
+def handle_accounts_event(event: dict, handle, context=None) -> dict:
+    events: list[dict] = account_events(event)
+    if not events:
+        raise ValueError("No accounts given")
+    # One GetParameters round trip for every account's keys, the handlers then
+    # read them from the cache.
+    with metrics.phase("ssm"):
+        get_parameters(
+            [
+                account[field]
+                for account in events
+                for field in ("private_key_parameter", "public_key_parameter")
+            ]
+        )
+    # Imported here so single account runs do not load asyncio.
+    import asyncio
+
+    results: list[dict] = asyncio.run(run_accounts(events, handle, context))
+
+    succeeded: int = sum(1 for result in results if result["statusCode"] == 200)
+    if succeeded == len(results):
+        status_code, message = 200, "All accounts succeeded"
+    elif any(result["statusCode"] in (200, 207) for result in results):
+        status_code, message = 207, "Some accounts failed"
+    else:
+        status_code, message = 400, "All accounts failed"
+    return {
+        "statusCode": status_code,
+        "body": json.dumps({"message": message, "results": results}),
+    }
@@ -0,0 +1,201 @@
+import math
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import pair_metadata
+
+DEFAULT_STRATEGY: str = "fixed"
+# Runs of the EventBridge schedule, used by the time based strategies.
+DEFAULT_INTERVAL_MINUTES: float = 1440
+
+
+@dataclass
+class Allocation:
+    trading_pair: str
+    budget: float
+    # Why no order is placed for the pair this run, e.g. below its ordermin.
+    skipped: str = None
+
+
+@dataclass
+class Portfolio:
+    # Everything a strategy sees, gathered once per run.
+    pairs: list[dict]
+    cash: float
+    prices: dict[str, float]
+    holdings: dict[str, float]
+    now: float
+
+    def weights(self) -> list[float]:
+        weights: list[float] = [float(pair.get("weight", 1)) for pair in self.pairs]
+        if sum(weights) <= 0:
+            raise ValueError("Pair weights must add up to more than zero")
+        return weights
+
+    def values(self) -> list[float]:
+        return [
+            self.holdings[pair["trading_pair"]] * self.prices[pair["trading_pair"]]
+            for pair in self.pairs
+        ]
+
+
+def split(amount: float, weights: list[float]) -> list[float]:
+    total_weight: float = sum(weights)
+    return [amount * weight / total_weight for weight in weights]
+
+
+def scale_to_cash(budgets: list[float], cash: float) -> list[float]:
+    wanted: float = sum(budgets)
+    if wanted <= cash:
+        return budgets
+    return [budget * cash / wanted for budget in budgets]
+
+
+def fixed_weights(portfolio: Portfolio, settings: dict) -> list[float]:
+    # The whole balance, split by weight.
+    return split(portfolio.cash, portfolio.weights())
+
+
+def target_weights(portfolio: Portfolio, settings: dict) -> list[float]:
+    # Buys the pairs furthest below their target share of cash plus holdings
+    # first, then splits what is left by weight.
+    values: list[float] = portfolio.values()
+    total: float = portfolio.cash + sum(values)
+    targets: list[float] = split(total, portfolio.weights())
+    shortfalls: list[float] = scale_to_cash(
+        [max(target - value, 0.0) for target, value in zip(targets, values)],
+        portfolio.cash,
+    )
+    remainder: float = portfolio.cash - sum(shortfalls)
+    return [
+        shortfall + extra
+        for shortfall, extra in zip(shortfalls, split(remainder, portfolio.weights()))
+    ]
+
+
+def runs_since(start: float, now: float, interval_minutes: float) -> int:
+    return max(math.floor((now - start) / (interval_minutes * 60)) + 1, 1)
+
+
+def value_averaging(portfolio: Portfolio, settings: dict) -> list[float]:
+    # Holdings should grow by increment per run since start, so less is bought
+    # after prices rise and more after they fall. Unneeded cash is kept.
+    runs: int = runs_since(
+        float(settings["start"]),
+        portfolio.now,
+        float(settings.get("interval_minutes", DEFAULT_INTERVAL_MINUTES)),
+    )
+    targets: list[float] = split(
+        float(settings["increment"]) * runs, portfolio.weights()
+    )
+    return scale_to_cash(
+        [
+            max(target - value, 0.0)
+            for target, value in zip(targets, portfolio.values())
+        ],
+        portfolio.cash,
+    )
+
+
+def next_deposit(now: float, deposit_day: int) -> float:
+    # Midnight UTC on deposit_day of this month, or of the next one once it
+    # has passed.
+    today: datetime = datetime.fromtimestamp(now, tz=timezone.utc)
+    deposit: datetime = today.replace(
+        day=deposit_day, hour=0, minute=0, second=0, microsecond=0
+    )
+    if deposit.timestamp() <= now:
+        year, month = divmod(today.month, 12)
+        deposit = deposit.replace(year=today.year + year, month=month + 1)
+    return deposit.timestamp()
+
+
+def spread_over_deposits(portfolio: Portfolio, settings: dict) -> list[float]:
+    # An equal part of the balance each run until the next deposit arrives.
+    deposit_day: int = int(settings["deposit_day"])
+    if not 1 <= deposit_day <= 28:
+        raise ValueError("deposit_day must be between 1 and 28")
+    interval_seconds: float = (
+        float(settings.get("interval_minutes", DEFAULT_INTERVAL_MINUTES)) * 60
+    )
+    runs_left: int = max(
+        math.ceil(
+            (next_deposit(portfolio.now, deposit_day) - portfolio.now)
+            / interval_seconds
+        ),
+        1,
+    )
+    return split(portfolio.cash / runs_left, portfolio.weights())
+
+
+STRATEGIES: dict = {
+    "fixed": fixed_weights,
+    "rebalance": target_weights,
+    "value_averaging": value_averaging,
+    "spread": spread_over_deposits,
+}
+
+
+def get_holdings(
+    pairs: list[dict], balances: dict, infos: dict[str, pair_metadata.PairInfo]
+) -> dict[str, float]:
+    # A pair's "asset" overrides the base asset from AssetPairs.
+    holdings: dict[str, float] = {}
+    for pair in pairs:
+        trading_pair: str = pair["trading_pair"]
+        asset: str = pair.get("asset") or infos[trading_pair].base
+        holdings[trading_pair] = float(balances.get(asset, 0) if asset else 0)
+    return holdings
+
+
+def allocate(
+    settings: dict,
+    pairs: list[dict],
+    cash: float,
+    balances: dict,
+    bid_prices: dict[str, str],
+    now: float,
+    multipliers: dict[str, float] = None,
+) -> list[Allocation]:
+    # Budgets for every pair of a run in one pass over the balances and prices.
+    # Budgets the pair's ordermin or costmin would reject are skipped, the
+    # cash stays in the balance for the next run.
+    strategy_name: str = settings.get("strategy", DEFAULT_STRATEGY)
+    if strategy_name not in STRATEGIES:
+        raise ValueError(f"Unknown allocation strategy: {strategy_name}")
+    trading_pairs: list[str] = [pair["trading_pair"] for pair in pairs]
+    infos: dict[str, pair_metadata.PairInfo] = pair_metadata.get_pairs(trading_pairs)
+    portfolio: Portfolio = Portfolio(
+        pairs=pairs,
+        cash=cash,
+        prices={pair: float(bid_prices[pair]) for pair in trading_pairs},
+        holdings=get_holdings(pairs, balances, infos),
+        now=now,
+    )
+    budgets: list[float] = STRATEGIES[strategy_name](portfolio, settings)
+    if multipliers:
+        # Dip buying scales each pair's budget, within the cash there is.
+        budgets = scale_to_cash(
+            [
+                budget * multipliers.get(trading_pair, 1.0)
+                for trading_pair, budget in zip(trading_pairs, budgets)
+            ],
+            cash,
+        )
+
+    allocations: list[Allocation] = []
+    for trading_pair, budget in zip(trading_pairs, budgets):
+        info: pair_metadata.PairInfo = infos[trading_pair]
+        if budget <= 0:
+            allocations.append(Allocation(trading_pair, 0.0, "Nothing to buy"))
+            continue
+        try:
+            pair_metadata.format_volume(
+                budget,
+                pair_metadata.format_price(bid_prices[trading_pair], info),
+                info,
+            )
+        except ValueError as e:
+            allocations.append(Allocation(trading_pair, budget, str(e)))
+            continue
+        allocations.append(Allocation(trading_pair, budget))
+    return allocations
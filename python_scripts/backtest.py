@@ -0,0 +1,237 @@
+import argparse
+import csv
+import itertools
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass
+import numpy as np
+
+OHLC_COLUMNS: tuple = ("time", "open", "high", "low", "close", "volume")
+# Kraken's maker fee on the lowest volume tier.
+MAKER_FEE: float = 0.0025
+
+
+@dataclass
+class BacktestResult:
+    pair: str
+    order_expires: int
+    bid_offset_percent: float
+    runs: int
+    fills: int
+    fill_rate: float
+    spent: float
+    volume: float
+    cost_basis: float
+    fees: float
+    unspent: float
+
+
+def write_columns(csv_path: str, pair_dir: str) -> None:
+    # Converts one of Kraken's OHLCVT CSV downloads (time, open, high, low,
+    # close, volume, trades without a header) to one .npy file per column.
+    with open(csv_path, newline="") as file:
+        rows: list[list[str]] = [row for row in csv.reader(file) if row]
+    os.makedirs(pair_dir, exist_ok=True)
+    table = np.array([row[: len(OHLC_COLUMNS)] for row in rows], dtype=np.float64)
+    for index, column in enumerate(OHLC_COLUMNS):
+        values = table[:, index]
+        np.save(
+            os.path.join(pair_dir, f"{column}.npy"),
+            values.astype(np.int64) if column == "time" else values,
+        )
+
+
+def load_columns(pair_dir: str) -> dict:
+    # Memory-mapped, so years of minute candles are paged in on demand.
+    return {
+        column: np.load(os.path.join(pair_dir, f"{column}.npy"), mmap_mode="r")
+        for column in ("time", "low", "close")
+    }
+
+
+def round_down(values, decimals: int):
+    # Vectorised ROUND_DOWN quantization, as in pair_metadata's formatters.
+    multiplier: int = 10**decimals
+    return np.floor(values * multiplier) / multiplier
+
+
+def run_times(times, interval_minutes: float, first_run: int = None):
+    start: int = int(times[0]) if first_run is None else first_run
+    return np.arange(start, int(times[-1]), int(interval_minutes * 60), dtype=np.int64)
+
+
+def carried_fills(
+    touched, prices, budget_per_run: float, lot_decimals: int, ordermin: float
+):
+    filled = np.zeros(len(touched), dtype=bool)
+    budget: float = 0.0
+    for index in range(len(touched)):
+        budget += budget_per_run
+        if (
+            touched[index]
+            and round_down(budget / prices[index], lot_decimals) >= ordermin
+        ):
+            filled[index] = True
+            budget = 0.0
+    return filled
+
+
+def backtest_pair(
+    pair: str,
+    columns: dict,
+    order_expires: int,
+    bid_offset_percent: float = 0.0,
+    budget_per_run: float = 100.0,
+    interval_minutes: float = 1440,
+    maker_fee: float = MAKER_FEE,
+    carry_over: bool = True,
+    pair_decimals: int = 6,
+    lot_decimals: int = 8,
+    ordermin: float = 0.0,
+) -> BacktestResult:
+    times, lows, closes = columns["time"], columns["low"], columns["close"]
+    runs = run_times(times, interval_minutes)
+    # Orders still on the book when the data ends are left out.
+    runs = runs[runs + (int(order_expires) - 1) * 60 < times[-1]]
+    if len(runs) == 0:
+        raise ValueError(f"Not enough {pair} candles for one order")
+    # The bid at a run is the close of the last finished candle, as the Ticker
+    # bid is not in OHLC data.
+    run_index = np.searchsorted(times, runs, side="right") - 1
+    prices = round_down(
+        closes[run_index] * (1 - bid_offset_percent / 100), pair_decimals
+    )
+    # Same arithmetic as dca.calculate_order_expiration in UTC.
+    expiries = runs + (int(order_expires) - 1) * 60
+    window_start = run_index + 1
+    window_end = np.searchsorted(times, expiries, side="right")
+    has_window = window_end > window_start
+
+    # Lowest low while each order is on the book, in one reduceat pass over
+    # the interleaved [start, end) bounds, every other result is a window.
+    window_lows = np.minimum.reduceat(
+        lows, np.column_stack((window_start, window_end)).ravel()
+    )[::2]
+    # A post-only buy at the back of the queue needs the market to trade below
+    # its price to be sure of a fill.
+    touched = has_window & (window_lows < prices)
+
+    if carry_over:
+        # The whole balance is ordered each run, so unfilled budgets roll over
+        # to the next run until an order fills.
+        indices = np.arange(len(runs))
+        filled = touched & (
+            round_down(budget_per_run / prices, lot_decimals) >= ordermin
+        )
+        if not filled[touched].all():
+            # Some runs only reach the pair's ordermin with carried budget,
+            # which depends on earlier fills, so those are replayed in order.
+            filled = carried_fills(
+                touched, prices, budget_per_run, lot_decimals, ordermin
+            )
+        last_fill = np.maximum.accumulate(np.where(filled, indices, -1))
+        previous_fill = np.concatenate(([-1], last_fill[:-1]))
+        budgets = budget_per_run * (indices - previous_fill)
+    else:
+        budgets = np.full(len(runs), budget_per_run)
+        # Orders below the pair's ordermin are never placed.
+        filled = touched & (round_down(budgets / prices, lot_decimals) >= ordermin)
+
+    # Vectorised pair_metadata.format_volume.
+    volumes = round_down(budgets / prices, lot_decimals)
+    spent: float = float(budgets[filled].sum())
+    bought: float = float(volumes[filled].sum())
+    fills: int = int(filled.sum())
+    last_filled_run: int = int(np.flatnonzero(filled)[-1]) if fills else -1
+    return BacktestResult(
+        pair=pair,
+        order_expires=int(order_expires),
+        bid_offset_percent=float(bid_offset_percent),
+        runs=len(runs),
+        fills=fills,
+        fill_rate=fills / len(runs),
+        spent=spent,
+        volume=bought,
+        cost_basis=spent / bought if bought else float("nan"),
+        fees=spent * maker_fee,
+        unspent=(
+            float(budget_per_run * (len(runs) - 1 - last_filled_run))
+            if carry_over
+            else float(budgets[~filled].sum())
+        ),
+    )
+
+
+def sweep(
+    data_dir: str,
+    pairs: list[str],
+    order_expires_values: list[int],
+    bid_offsets: list[float],
+    **settings,
+) -> list[BacktestResult]:
+    results: list[BacktestResult] = []
+    for pair in pairs:
+        columns: dict = load_columns(os.path.join(data_dir, pair))
+        for order_expires, bid_offset in itertools.product(
+            order_expires_values, bid_offsets
+        ):
+            results.append(
+                backtest_pair(pair, columns, order_expires, bid_offset, **settings)
+            )
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Replay the DCA order logic over historical OHLC candles."
+    )
+    parser.add_argument("data_dir", help="One directory of .npy columns per pair")
+    parser.add_argument("--pairs", nargs="+", required=True)
+    parser.add_argument("--order-expires", nargs="+", type=int, default=[1380])
+    parser.add_argument("--bid-offset", nargs="+", type=float, default=[0.0])
+    parser.add_argument("--budget", type=float, default=100.0)
+    parser.add_argument("--interval-minutes", type=float, default=1440)
+    parser.add_argument("--maker-fee", type=float, default=MAKER_FEE)
+    # From AssetPairs, the defaults match the rounding before pair metadata.
+    parser.add_argument("--pair-decimals", type=int, default=6)
+    parser.add_argument("--lot-decimals", type=int, default=8)
+    parser.add_argument("--ordermin", type=float, default=0.0)
+    parser.add_argument(
+        "--import-csv", nargs=2, metavar=("CSV", "PAIR"), action="append", default=[]
+    )
+    args = parser.parse_args()
+
+    for csv_path, pair in args.import_csv:
+        write_columns(csv_path, os.path.join(args.data_dir, pair))
+
+    start: float = time.perf_counter()
+    results: list[BacktestResult] = sweep(
+        args.data_dir,
+        args.pairs,
+        args.order_expires,
+        args.bid_offset,
+        budget_per_run=args.budget,
+        interval_minutes=args.interval_minutes,
+        maker_fee=args.maker_fee,
+        pair_decimals=args.pair_decimals,
+        lot_decimals=args.lot_decimals,
+        ordermin=args.ordermin,
+    )
+    elapsed_ms: float = (time.perf_counter() - start) * 1000
+
+    header: list[str] = list(asdict(results[0]).keys()) if results else []
+    print("\t".join(header))
+    for result in results:
+        print(
+            "\t".join(
+                f"{value:.6g}" if isinstance(value, float) else str(value)
+                for value in asdict(result).values()
+            )
+        )
+    print(f"{len(results)} backtests in {elapsed_ms:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
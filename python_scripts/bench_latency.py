@@ -0,0 +1,146 @@
+import argparse
+import contextlib
+import io
+import statistics
+import sys
+import time
+import tracemalloc
+from unittest import mock
+import dca
+import kraken_client
+import order_tracker
+import pair_metadata
+import rate_limiter
+import withdraw
+from kraken_stub_server import KrakenStubServer, StubConfig
+
+FAKE_PRIVATE_KEY: str = (
+    "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg=="
+)
+FAKE_CREDENTIALS: dict = {
+    dca.PRIVATE_KEY_PARAMETER: FAKE_PRIVATE_KEY,
+    dca.PUBLIC_KEY_PARAMETER: "bench-public-key",
+    withdraw.PRIVATE_KEY_PARAMETER: FAKE_PRIVATE_KEY,
+    withdraw.PUBLIC_KEY_PARAMETER: "bench-public-key",
+    "XXBT-hardwallet": "bench-wallet",
+}
+
+SCENARIOS: dict = {
+    "dca": (
+        dca.lambda_handler,
+        {
+            "trading_pair": "XBTAUD",
+            "crypto_to_buy": "BTC",
+            "currency": "ZAUD",
+            "order_expires": "1380",
+        },
+    ),
+    "dca-batch": (
+        dca.lambda_handler,
+        {
+            "currency": "ZAUD",
+            "order_expires": "1380",
+            "pairs": [
+                {"trading_pair": "XBTAUD", "crypto_to_buy": "BTC", "weight": 0.7},
+                {"trading_pair": "ETHAUD", "crypto_to_buy": "ETH", "weight": 0.3},
+            ],
+        },
+    ),
+    "withdraw": (withdraw.lambda_handler, {"ticker": "XXBT"}),
+}
+
+
+def percentile(samples: list[float], percent: float) -> float:
+    ordered: list[float] = sorted(samples)
+    index: int = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def fake_get_parameters(names: list[str], *args, **kwargs) -> dict:
+    return {name: FAKE_CREDENTIALS[name] for name in names}
+
+
+def run_scenario(server: KrakenStubServer, name: str, invocations: int) -> dict:
+    handler, event = SCENARIOS[name]
+    latencies_ms: list[float] = []
+    failures: int = 0
+    server.reset_counters()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(invocations):
+            # Scheduled runs are hours apart, so Kraken's counter has decayed.
+            rate_limiter.reset_limiters()
+            start: float = time.perf_counter()
+            response = handler(event, None)
+            latencies_ms.append((time.perf_counter() - start) * 1000)
+            if isinstance(response, dict) and response["statusCode"] >= 300:
+                failures += 1
+    request_count: int = server.request_count
+
+    # Allocations are measured on a separate run because tracemalloc slows
+    # everything down and would distort the latency numbers.
+    with contextlib.redirect_stdout(io.StringIO()):
+        rate_limiter.reset_limiters()
+        tracemalloc.start()
+        handler(event, None)
+        allocated_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        allocation_count: int = sum(
+            stat.count for stat in tracemalloc.take_snapshot().statistics("filename")
+        )
+        tracemalloc.stop()
+
+    return {
+        "p50_ms": statistics.median(latencies_ms),
+        "p99_ms": percentile(latencies_ms, 99),
+        "requests_per_invocation": request_count / invocations,
+        "failures": failures,
+        "live_allocations": allocation_count,
+        "peak_kib": peak_bytes / 1024,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Run the Lambda handlers against a local Kraken stand-in."
+    )
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS))
+    parser.add_argument("--invocations", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_per_second=args.rate_limit,
+        balances={"ZAUD": "1000.0", "XXBT": "0.5"},
+        bids={"XBTAUD": "50000.12345678", "ETHAUD": "2500.5"},
+        seed=args.seed,
+    )
+    with KrakenStubServer(config) as server, mock.patch.object(
+        kraken_client, "KRAKEN_API_URL", server.url
+    ), mock.patch.object(dca, "get_parameters", fake_get_parameters), mock.patch.object(
+        withdraw, "get_parameters", fake_get_parameters
+    ):
+        kraken_client.close_session()
+        # Nothing is written to /tmp, the first run fetches AssetPairs.
+        order_tracker.reset_tracker(order_tracker.InMemoryOrderStore())
+        pair_metadata.reset_cache(pair_metadata.PairMetadataCache(path=""))
+        for name in args.scenarios:
+            report: dict = run_scenario(server, name, args.invocations)
+            print(
+                f"{name}: p50 {report['p50_ms']:.1f} ms, p99 {report['p99_ms']:.1f} ms, "
+                f"{report['requests_per_invocation']:.1f} requests, "
+                f"{report['live_allocations']} live allocations, "
+                f"peak {report['peak_kib']:.1f} KiB per invocation, "
+                f"{report['failures']} failed"
+            )
+        kraken_client.close_session()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
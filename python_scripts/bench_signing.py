@@ -0,0 +1,72 @@
+import argparse
+import base64
+import hashlib
+import hmac
+import sys
+import timeit
+import tracemalloc
+from urllib.parse import urlencode
+from signer import KrakenSigner
+
+PRIVATE_KEY: str = (
+    "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg=="
+)
+ORDER: dict = {
+    "nonce": "1616492376594000",
+    "ordertype": "limit",
+    "pair": "XBTAUD",
+    "price": "50000.123456",
+    "type": "buy",
+    "volume": "0.0015",
+    "oflags": "fciq",
+    "timeinforce": "GTD",
+    "expiretm": 1616495916,
+}
+
+
+def legacy_sign_request(api_path: str, data: dict) -> tuple[str, str]:
+    # What dca.get_api_sign used to do: decode and key the HMAC on every call.
+    body: str = urlencode(data)
+    api_sha256 = hashlib.sha256(data["nonce"].encode() + body.encode())
+    api_hmac = hmac.new(
+        base64.b64decode(PRIVATE_KEY),
+        api_path.encode() + api_sha256.digest(),
+        hashlib.sha512,
+    )
+    return body, base64.b64encode(api_hmac.digest()).decode()
+
+
+def peak_bytes_per_call(function) -> int:
+    tracemalloc.start()
+    function()
+    tracemalloc.reset_peak()
+    current_bytes: int = tracemalloc.get_traced_memory()[0]
+    function()
+    peak_bytes: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak_bytes - current_bytes
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Compare request signing costs.")
+    parser.add_argument("--calls", type=int, default=20000)
+    args = parser.parse_args()
+
+    signer = KrakenSigner(PRIVATE_KEY)
+    candidates: dict = {
+        "legacy": lambda: legacy_sign_request("/0/private/AddOrder", ORDER),
+        "signer": lambda: signer.sign_request("/0/private/AddOrder", ORDER),
+    }
+    assert candidates["legacy"]()[1] == candidates["signer"]()[1], "signatures differ"
+
+    for name, function in candidates.items():
+        seconds: float = min(timeit.repeat(function, number=args.calls, repeat=5))
+        print(
+            f"{name}: {seconds / args.calls * 1e6:.2f} us per signed request, "
+            f"{peak_bytes_per_call(function)} bytes peak allocation per call"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Imports a handler module in a fresh interpreter, the way a Lambda cold start
+# does, and then builds the pooled HTTP session that every invocation needs.
+STARTUP_SNIPPET: str = """
+import time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+import kraken_client
+kraken_client.get_session()
+initialised = time.perf_counter()
+print((imported - start) * 1000, (initialised - start) * 1000)
+"""
+
+
+def measure_startup(module: str) -> tuple[float, float]:
+    output: str = subprocess.run(
+        [sys.executable, "-c", STARTUP_SNIPPET.format(module=module)],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    import_ms, init_ms = output.split()
+    return float(import_ms), float(init_ms)
+
+
+def slowest_imports(module: str, count: int) -> list[tuple[int, str]]:
+    stderr: str = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    imports: list[tuple[int, str]] = []
+    for line in stderr.splitlines()[1:]:
+        _, cumulative_us, name = line.split("|")
+        # Keep the modules the handler imports directly. Deeper imports are
+        # already counted in their parent's cumulative time.
+        if len(name) - len(name.lstrip()) != 3:
+            continue
+        imports.append((int(cumulative_us), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Measure cold-start import and init time of the Lambda handlers."
+    )
+    parser.add_argument("modules", nargs="*", default=["dca", "withdraw"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=250.0)
+    parser.add_argument("--top", type=int, default=5)
+    args = parser.parse_args()
+
+    over_budget: bool = False
+    for module in args.modules:
+        samples: list[tuple[float, float]] = [
+            measure_startup(module) for _ in range(args.runs)
+        ]
+        import_ms: float = statistics.median(sample[0] for sample in samples)
+        init_ms: float = statistics.median(sample[1] for sample in samples)
+        status: str = "ok" if init_ms <= args.budget_ms else "OVER BUDGET"
+        over_budget = over_budget or init_ms > args.budget_ms
+        print(
+            f"{module}: import {import_ms:.1f} ms, import+init {init_ms:.1f} ms "
+            f"(budget {args.budget_ms:.0f} ms) {status}"
+        )
+        for cumulative_us, name in slowest_imports(module, args.top):
+            print(f"    {cumulative_us / 1000:8.1f} ms  {name}")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
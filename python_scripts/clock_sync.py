@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from dataclasses import dataclass
+from kraken_client import public_get
+
+# An estimate older than this is refreshed even if it is still within bounds.
+CLOCK_SYNC_TTL_SECONDS: float = float(os.environ.get("CLOCK_SYNC_TTL_SECONDS", "3600"))
+# Time calls per sync. Every sync narrows the estimate further, so one call
+# keeps the latency-critical path short.
+CLOCK_SYNC_SAMPLES: int = int(os.environ.get("CLOCK_SYNC_SAMPLES", "1"))
+# Assumed worst-case drift between the local clock and Kraken's.
+CLOCK_DRIFT_PPM: float = float(os.environ.get("CLOCK_DRIFT_PPM", "100"))
+# A wider estimate is synced again before it is used.
+CLOCK_MAX_UNCERTAINTY_SECONDS: float = float(
+    os.environ.get("CLOCK_MAX_UNCERTAINTY_SECONDS", "2")
+)
+# Kraken's Time endpoint reports whole seconds.
+SERVER_TIME_RESOLUTION_SECONDS: float = 1.0
+
+
+def fetch_server_unixtime() -> int:
+    response = public_get("/0/public/Time")
+    response.raise_for_status()
+    time_data: dict = response.json()
+    if time_data.get("error"):
+        raise ValueError(f"Error fetching server time: {time_data['error']}")
+    return int(time_data["result"]["unixtime"])
+
+
+@dataclass
+class ClockSample:
+    # Local wall clock times around one Time call and the server's reply.
+    sent: float
+    received: float
+    server: int
+
+    @property
+    def round_trip(self) -> float:
+        return self.received - self.sent
+
+    def offset_bounds(self) -> tuple[float, float]:
+        # Kraken read its clock somewhere between sent and received, and
+        # truncated it to whole seconds.
+        return (
+            self.server - self.received,
+            self.server + SERVER_TIME_RESOLUTION_SECONDS - self.sent,
+        )
+
+
+class ServerClock:
+    # NTP-style estimate of Kraken's clock minus the local one, kept as bounds
+    # that every sample narrows and that widen with the allowed drift.
+    def __init__(
+        self,
+        fetch_time=None,
+        ttl_seconds: float = None,
+        drift_ppm: float = None,
+        max_uncertainty_seconds: float = None,
+        clock=None,
+        monotonic=None,
+    ):
+        self._fetch_time = fetch_time or fetch_server_unixtime
+        self.ttl_seconds: float = (
+            CLOCK_SYNC_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        )
+        self.drift_ppm: float = CLOCK_DRIFT_PPM if drift_ppm is None else drift_ppm
+        self.max_uncertainty_seconds: float = (
+            CLOCK_MAX_UNCERTAINTY_SECONDS
+            if max_uncertainty_seconds is None
+            else max_uncertainty_seconds
+        )
+        self._clock = clock
+        self._monotonic = monotonic
+        self._bounds: tuple[float, float] = None
+        self._synced_at: float = None
+        self.round_trip: float = None
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return (self._clock or time.time)()
+
+    def _elapsed(self) -> float:
+        return (self._monotonic or time.monotonic)() - self._synced_at
+
+    def _current_bounds(self) -> tuple[float, float]:
+        drift: float = self._elapsed() * self.drift_ppm / 1e6
+        return self._bounds[0] - drift, self._bounds[1] + drift
+
+    def _is_stale(self) -> bool:
+        if self._bounds is None or self._elapsed() >= self.ttl_seconds:
+            return True
+        lower, upper = self._current_bounds()
+        return (upper - lower) / 2 > self.max_uncertainty_seconds
+
+    def add_sample(self, sample: ClockSample) -> None:
+        with self._lock:
+            lower, upper = sample.offset_bounds()
+            if self._bounds is not None:
+                previous_lower, previous_upper = self._current_bounds()
+                # Disjoint bounds mean the local clock was stepped, only the
+                # new sample is trusted then.
+                if max(lower, previous_lower) <= min(upper, previous_upper):
+                    lower = max(lower, previous_lower)
+                    upper = min(upper, previous_upper)
+            self._bounds = (lower, upper)
+            self._synced_at = (self._monotonic or time.monotonic)()
+            self.round_trip = sample.round_trip
+
+    def sync(self, samples: int = None) -> None:
+        for _ in range(samples or CLOCK_SYNC_SAMPLES):
+            sent: float = self._now()
+            server: int = self._fetch_time()
+            self.add_sample(ClockSample(sent, self._now(), server))
+
+    def offset(self) -> float:
+        with self._lock:
+            lower, upper = self._current_bounds()
+            return (lower + upper) / 2
+
+    def uncertainty(self) -> float:
+        with self._lock:
+            lower, upper = self._current_bounds()
+            return (upper - lower) / 2
+
+    def server_time(self) -> float:
+        # Kraken's current time without a network call while the estimate is
+        # fresh.
+        with self._lock:
+            stale: bool = self._is_stale()
+        if stale:
+            self.sync()
+        return self._now() + self.offset()
+
+
+# Module scope so the estimate survives warm Lambda invocations.
+_clock: ServerClock = None
+_clock_lock = threading.Lock()
+
+
+def get_clock() -> ServerClock:
+    global _clock
+    with _clock_lock:
+        if _clock is None:
+            _clock = ServerClock()
+        return _clock
+
+
+def reset_clock(clock: ServerClock = None) -> None:
+    global _clock
+    with _clock_lock:
+        _clock = clock
+
+
+def server_time() -> float:
+    return get_clock().server_time()
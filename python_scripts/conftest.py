@@ -1,11 +1,47 @@
 from dataclasses import dataclass
 import json
 from typing import Union
+import boto3
 import pytest
 import responses
+import clock_sync
+import indicators
+import kraken_client
+import lease
+import nonces
+import order_intents
+import order_tracker
+import pair_metadata
+import rate_limiter
+from botocore.stub import Stubber
+from kraken_stub_server import KrakenStubServer, StubConfig
 from urllib.parse import parse_qs
 
 
+def pytest_configure(config):
+    # Registered here too so the marker is known when pytest-socket is absent.
+    config.addinivalue_line(
+        "markers", "enable_socket: allow real sockets, e.g. to a local stand-in"
+    )
+
+
+TEST_PAIRS: dict = {
+    "XBTAUD": pair_metadata.PairInfo(
+        "XBTAUD", 1, 8, "0.0001", "0.5", wsname="XBT/AUD", base="XXBT"
+    ),
+    "ETHAUD": pair_metadata.PairInfo(
+        "ETHAUD", 2, 8, "0.002", "0.5", wsname="ETH/AUD", base="XETH"
+    ),
+    "ETHUSD": pair_metadata.PairInfo(
+        "ETHUSD", 2, 8, "0.002", "0.5", wsname="ETH/USD", key="XETHZUSD"
+    ),
+    "XXBTZUSD": pair_metadata.PairInfo(
+        "XXBTZUSD", 1, 8, "0.0001", "0.5", wsname="XBT/USD"
+    ),
+    "SHIBAUD": pair_metadata.PairInfo("SHIBAUD", 8, 0, "50000", "0.5"),
+}
+
+
 @dataclass
 class ResponsesCall:
     request_method: str
@@ -15,6 +51,10 @@ class ResponsesCall:
     request_urlencoded_body: Union[dict, None] = None
 
 
+def request_body_text(body) -> str:
+    return body.decode("utf-8") if isinstance(body, bytes) else body
+
+
 @pytest.fixture
 def get_calls_to_responses(mocked_responses):
     def _get_calls_to_responses(method, url) -> list[ResponsesCall]:
@@ -22,13 +62,18 @@ def get_calls_to_responses(mocked_responses):
             ResponsesCall(
                 request_method=method,
                 request_url=url,
-                request_json_body=json.loads(call.request.body.decode("utf-8"))
-                if call.request.headers.get("Content-Type", "") == "application/json"
-                else None,
-                request_urlencoded_body=parse_qs(call.request.body)
-                if call.request.headers.get("Content-Type", "")
-                == "application/x-www-form-urlencoded"
-                else None,
+                request_json_body=(
+                    json.loads(call.request.body.decode("utf-8"))
+                    if call.request.headers.get("Content-Type", "")
+                    == "application/json"
+                    else None
+                ),
+                request_urlencoded_body=(
+                    parse_qs(request_body_text(call.request.body))
+                    if call.request.headers.get("Content-Type", "")
+                    == "application/x-www-form-urlencoded"
+                    else None
+                ),
                 request_headers=call.request.headers,
             )
             for call in mocked_responses.calls
@@ -46,11 +91,65 @@ def mocked_responses():
         yield rsps
 
 
+@pytest.fixture
+def dynamodb_stub():
+    # A DynamoDB client whose calls are answered by the test, for the lease
+    # and nonce stores.
+    client = boto3.client("dynamodb", region_name="us-east-1")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+@pytest.fixture(autouse=True)
+def reset_per_key_state():
+    # Every test starts with an empty Kraken call counter and nonce history for
+    # its fake keys, tests mock the clock to earlier times than previous ones.
+    rate_limiter.reset_limiters()
+    nonces.reset_generators()
+    # Tracked orders and pair metadata stay in memory instead of /tmp files.
+    order_tracker.reset_tracker(order_tracker.InMemoryOrderStore())
+    cache = pair_metadata.PairMetadataCache(path="")
+    cache.seed(TEST_PAIRS)
+    pair_metadata.reset_cache(cache)
+    # Every test starts without a server clock estimate.
+    clock_sync.reset_clock()
+    lease.reset_store(lease.InMemoryLeaseStore())
+    order_intents.reset_queue(order_intents.InMemoryIntentQueue())
+    indicators.reset_indicators()
+
+
 @pytest.fixture(autouse=True)
 def setup_default_handlers(mocked_responses):
     mocked_responses.post(
         url="https://api.kraken.com/0/private/AddOrder",
+        json={"error": [], "result": {}},
     )
     mocked_responses.post(
         url="https://api.kraken.com/0/private/Withdraw",
     )
+
+
+@pytest.fixture
+def start_stub_server(mocked_responses, mocker):
+    servers: list[KrakenStubServer] = []
+
+    def _start_stub_server(config: StubConfig = None) -> KrakenStubServer:
+        server = KrakenStubServer(config).start()
+        servers.append(server)
+        mocked_responses.add_passthru(server.url)
+        mocker.patch.object(kraken_client, "KRAKEN_API_URL", server.url)
+        mocker.patch(
+            "dca.get_parameters",
+            return_value={
+                "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+                "kraken-public-api-key": "fake123",
+            },
+        )
+        kraken_client.close_session()
+        return server
+
+    yield _start_stub_server
+    kraken_client.close_session()
+    for server in servers:
+        server.stop()
@@ -1,184 +1,1027 @@
-import base64
-import hashlib
-import hmac
-import math
-import time
-from datetime import datetime, timedelta
-from pip._vendor import requests 
-import boto3
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from kraken_client import (
+    FETCH_WORKERS,
+    RequestException,
+    is_auth_error,
+    public_get,
+    signed_post,
+)
+from ssm_cache import get_parameter, get_parameters, invalidate
 import json
 import logging
+import os
+import time
+import zlib
+import accounts
+import allocation
+import clock_sync
+import indicators
+import lease
+import metrics
+import order_book
+import order_intents
+import order_tracker
+import pair_metadata
+import repricer
+import retry
 
 # Set up logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-def get_nonce() -> str:
-    return str(int(time.time() * 1000))
+PRIVATE_KEY_PARAMETER: str = "kraken-private-api-key"
+PUBLIC_KEY_PARAMETER: str = "kraken-public-api-key"
+MARKET_DATA_STREAM: bool = (
+    os.environ.get("MARKET_DATA_STREAM", "false").lower() == "true"
+)
+
+
+def get_server_time() -> float:
+    # Estimated from a cached clock offset, Time is only called when the
+    # estimate is missing or stale.
+    return clock_sync.server_time()
 
-def round_down_decimal_number(number: float, desired_result_decimals: int) -> float:
-    multiplier: int = 10**desired_result_decimals
-    return math.floor(number * multiplier) / multiplier
 
-def get_api_sign(api_path: str, urlencoded_body: str, nonce: str, private_key: str) -> str:
-    api_sha256: hashlib._Hash = hashlib.sha256(nonce.encode() + urlencoded_body.encode())
-    api_hmac: hmac.HMAC = hmac.new(
-        base64.b64decode(private_key),
-        api_path.encode() + api_sha256.digest(),
-        hashlib.sha512,
+def get_bid_prices(trading_pairs: list[str]) -> dict[str, str]:
+    # Bids are returned as Kraken sent them, format_order rounds them to the
+    # pair's own precision.
+    stream: order_book.BookStream = order_book.current_stream()
+    streamed_bids: dict[str, str] = (
+        stream.best_bids(trading_pairs) if stream is not None else None
     )
-    api_signature: bytes = base64.b64encode(api_hmac.digest())
-    return api_signature.decode()
+    if streamed_bids is not None:
+        return {trading_pair: str(bid) for trading_pair, bid in streamed_bids.items()}
 
-def get_server_time() -> float:
-    response = requests.get("https://api.kraken.com/0/public/Time")
+    response = public_get(f"/0/public/Ticker?pair={','.join(trading_pairs)}")
     response.raise_for_status()
-    server_time = response.json()["result"]["unixtime"]
-    return float(server_time)
+    market_data = response.json()
+    if market_data.get("error"):
+        raise ValueError(f"Error fetching ticker: {market_data['error']}")
+    result: dict = market_data["result"]
+    # Legacy pairs come back under Kraken's own name, e.g. XETHZUSD for ETHUSD.
+    missing: list[str] = [pair for pair in trading_pairs if pair not in result]
+    keys: dict[str, str] = {
+        pair: info.key for pair, info in pair_metadata.get_pairs(missing).items()
+    }
+    bid_prices: dict[str, str] = {}
+    for trading_pair in trading_pairs:
+        ticker: dict = result.get(trading_pair) or result.get(keys.get(trading_pair))
+        if ticker is None:
+            raise ValueError(f"No ticker for {trading_pair}")
+        bid_prices[trading_pair] = ticker["b"][0]
+    return bid_prices
+
 
 def get_bid_price(trading_pair: str) -> str:
-    response = requests.get(f"https://api.kraken.com/0/public/Ticker?pair={trading_pair}")
-    response.raise_for_status()
-    market_data = response.json()
-    top_market_bid: float = float(market_data["result"][trading_pair]["b"][0])
-    return str(round_down_decimal_number(top_market_bid, desired_result_decimals=6))
+    return get_bid_prices([trading_pair])[trading_pair]
+
+
+def format_order(trading_pair: str, budget: float, price: str) -> tuple[str, str]:
+    # Price and volume as Kraken accepts them for the pair: rounded down to its
+    # pair_decimals and lot_decimals, and at least its ordermin.
+    info: pair_metadata.PairInfo = pair_metadata.get_pair(trading_pair)
+    order_price: str = pair_metadata.format_price(price, info)
+    return order_price, pair_metadata.format_volume(budget, order_price, info)
 
-def get_trade_volume(budget: float, bid_price: str) -> str:
-    return str(budget / float(bid_price))
 
 def get_aws_ssm_securestring_parameter(paramname: str) -> str:
-    client = boto3.client("ssm")
-    response = client.get_parameter(Name=paramname, WithDecryption=True)
-    return response["Parameter"]["Value"]
+    return get_parameter(paramname)
+
 
 def my_balance_on_kraken(private_key: str, public_key: str) -> dict:
-    nonce: str = get_nonce()
-    url_encoded_body: str = f"nonce={nonce}"
-    api_sign: str = get_api_sign(
-        api_path="/0/private/Balance",
-        urlencoded_body=url_encoded_body,
-        nonce=nonce,
+    response = signed_post(
+        path="/0/private/Balance",
+        data={},
+        public_key=public_key,
         private_key=private_key,
     )
+    response.raise_for_status()
+    return response.json()
+
+
+def calculate_order_expiration(server_time, order_expires):
+    # Plain epoch arithmetic, local time zones and DST play no part.
+    return int(server_time) + (int(order_expires) - 1) * 60
+
+
+def fetch_market_data(trading_pair: str) -> tuple[str, float]:
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        bid_price_future = executor.submit(get_bid_price, trading_pair)
+        server_time_future = executor.submit(get_server_time)
+        pairs_future = executor.submit(pair_metadata.get_pairs, [trading_pair])
+        pairs_future.result()
+        return bid_price_future.result(), server_time_future.result()
+
 
-    response = requests.post(
-        url="https://api.kraken.com/0/private/Balance",
-        data={"nonce": nonce},
-        headers={"API-Key": public_key, "API-Sign": api_sign},
+def fetch_pre_order_data(
+    trading_pair: str, private_key: str, public_key: str
+) -> tuple[dict, str, float]:
+    # Balance, Ticker and Time are independent, so they share one round trip.
+    # Pair metadata is loaded alongside, it is usually already cached.
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        balance_future = executor.submit(
+            my_balance_on_kraken, private_key=private_key, public_key=public_key
+        )
+        bid_price_future = executor.submit(get_bid_price, trading_pair)
+        server_time_future = executor.submit(get_server_time)
+        pairs_future = executor.submit(pair_metadata.get_pairs, [trading_pair])
+        pairs_future.result()
+        return (
+            balance_future.result(),
+            bid_price_future.result(),
+            server_time_future.result(),
+        )
+
+
+def fetch_batch_pre_order_data(
+    trading_pairs: list[str], private_key: str, public_key: str
+) -> tuple[dict, dict[str, str], float]:
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        balance_future = executor.submit(
+            my_balance_on_kraken, private_key=private_key, public_key=public_key
+        )
+        bid_prices_future = executor.submit(get_bid_prices, trading_pairs)
+        server_time_future = executor.submit(get_server_time)
+        pairs_future = executor.submit(pair_metadata.get_pairs, trading_pairs)
+        pairs_future.result()
+        return (
+            balance_future.result(),
+            bid_prices_future.result(),
+            server_time_future.result(),
+        )
+
+
+def scheduled_tick(event: dict, server_time: float) -> int:
+    # The time the run was scheduled for, the same for every delivery and
+    # retry of one tick. EventBridge passes it in as "scheduled_at", e.g.
+    # "2021-03-23T09:00:00Z", the service as epoch seconds. A run without it
+    # counts as a tick of its own.
+    scheduled_at = event.get("scheduled_at")
+    if scheduled_at is None:
+        return int(server_time)
+    if isinstance(scheduled_at, str) and not scheduled_at.replace(".", "").isdigit():
+        return int(
+            datetime.fromisoformat(scheduled_at.replace("Z", "+00:00")).timestamp()
+        )
+    return int(float(scheduled_at))
+
+
+def order_userref(trading_pair: str, scheduled_at: int) -> int:
+    # The same for every attempt at one scheduled tick, so a resent AddOrder
+    # can be matched to an order that already went through. userref is a
+    # signed 32-bit integer.
+    return zlib.crc32(f"{trading_pair}:{scheduled_at}".encode()) & 0x7FFFFFFF
+
+
+def kraken_post(path: str, data: dict, private_key: str, public_key: str) -> dict:
+    response = signed_post(
+        path=path, data=data, public_key=public_key, private_key=private_key
     )
     response.raise_for_status()
     return response.json()
 
-def calculate_order_expiration(server_time, order_expires):
-    server_datetime = datetime.fromtimestamp(int(server_time))
-    expiration_datetime = server_datetime + timedelta(minutes=(int(order_expires) - 1))
-    return int(expiration_datetime.timestamp())
+
+def find_orders_by_userref(
+    userrefs: list[int],
+    since: int,
+    private_key: str,
+    public_key: str,
+    exclude_txids: list[str] = (),
+) -> dict[int, dict]:
+    # AddOrder results of the orders placed with one of userrefs at or after
+    # since, by userref. Orders of earlier ticks that share a userref are
+    # ignored, as are exclude_txids, e.g. the cancelled orders a replacement
+    # replaces. One OpenOrders and one ClosedOrders call cover every userref.
+    userref_filter: dict = {"userref": userrefs[0]} if len(userrefs) == 1 else {}
+    found: dict[int, dict] = {}
+    for path, data, key in (
+        ("/0/private/OpenOrders", userref_filter, "open"),
+        (
+            "/0/private/ClosedOrders",
+            # start is exclusive.
+            {**userref_filter, "start": int(since) - 1},
+            "closed",
+        ),
+    ):
+        orders_data: dict = kraken_post(path, data, private_key, public_key)
+        if orders_data.get("error"):
+            raise ValueError(f"Error looking up order: {orders_data['error']}")
+        orders: dict = orders_data["result"].get(key) or {}
+        for txid, order in orders.items():
+            userref: int = order.get("userref", userref_filter.get("userref"))
+            if (
+                userref not in userrefs
+                or userref in found
+                or float(order.get("opentm", since)) < since
+                or txid in exclude_txids
+            ):
+                continue
+            logger.info(f"Order {txid} with userref {userref} was already placed")
+            found[userref] = {
+                "error": [],
+                "result": {"descr": order.get("descr", {}), "txid": [txid]},
+            }
+    return found
+
+
+def find_order_by_userref(
+    userref: int,
+    since: int,
+    private_key: str,
+    public_key: str,
+    exclude_txids: list[str] = (),
+) -> dict:
+    return find_orders_by_userref(
+        [userref], since, private_key, public_key, exclude_txids
+    ).get(userref)
+
+
+def orders_of_earlier_attempt(
+    event: dict,
+    held: lease.Lease,
+    trading_pairs: list[str],
+    scheduled_at: int,
+    private_key: str,
+    public_key: str,
+) -> dict[str, dict]:
+    # A Lambda retry after a timeout keeps the request id and the tick, and
+    # the attempt that timed out may have placed orders before it was cut off.
+    # Those orders are found by their userref, by pair, instead of being
+    # placed again. Without "scheduled_at" every attempt is its own tick, so a
+    # lease that was already ours cannot be matched and nothing is placed.
+    if "scheduled_at" not in event:
+        if held is not None and held.reacquired:
+            raise lease.LeaseHeld(
+                f"An earlier attempt of this run held the lease on {held.key}"
+            )
+        return {}
+    userrefs: dict[int, str] = {
+        order_userref(pair, scheduled_at): pair for pair in trading_pairs
+    }
+    with metrics.phase("lookup"):
+        found: dict[int, dict] = find_orders_by_userref(
+            list(userrefs), scheduled_at, private_key, public_key
+        )
+    return {userrefs[userref]: order_data for userref, order_data in found.items()}
+
+
+def order_deadline(context) -> float:
+    # time.monotonic() by which retries have to be finished, None without a
+    # Lambda context.
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining_time is None:
+        return None
+    return time.monotonic() + get_remaining_time() / 1000
+
+
+def plan_order_intent(
+    crypto_to_buy: str,
+    currency: str,
+    trading_pair: str,
+    budget: float,
+    order_expires: str,
+    bid_price: str,
+    server_time: float,
+    key_parameters: list[str] = None,
+    post_only: bool = False,
+    price_policy: str = "limit",
+    scheduled_at: int = None,
+) -> order_intents.OrderIntent:
+    price, volume = format_order(trading_pair, budget, bid_price)
+    if scheduled_at is None:
+        scheduled_at = int(server_time)
+    return order_intents.OrderIntent(
+        trading_pair=trading_pair,
+        crypto_to_buy=crypto_to_buy,
+        currency=currency,
+        budget=budget,
+        price=price,
+        volume=volume,
+        expires_at=calculate_order_expiration(server_time, order_expires),
+        planned_at=server_time,
+        userref=order_userref(trading_pair, scheduled_at),
+        scheduled_at=scheduled_at,
+        key_parameters=key_parameters or get_key_parameters({}),
+        price_policy=price_policy,
+        post_only=post_only,
+    )
+
+
+def add_order(
+    data: dict,
+    userref: int,
+    since: int,
+    private_key: str,
+    public_key: str,
+    deadline: float = None,
+    exclude_txids: list[str] = (),
+) -> dict:
+    # AddOrder with retries. After an ambiguous failure the order is looked up
+    # by its userref rather than sent a second time.
+    def find_existing() -> dict:
+        return find_order_by_userref(
+            userref, since, private_key, public_key, exclude_txids
+        )
+
+    with metrics.phase("add_order"):
+        return retry.call_with_retry(
+            lambda: kraken_post(
+                "/0/private/AddOrder",
+                {**data, "userref": userref},
+                private_key,
+                public_key,
+            ),
+            retry.RetryPolicy(deadline=deadline),
+            find_existing=find_existing,
+        )
+
+
+def send_order_intent(
+    intent: order_intents.OrderIntent,
+    private_key: str,
+    public_key: str,
+    deadline: float = None,
+) -> dict:
+    logger.info(
+        f"Placing order: {intent.volume}{intent.crypto_to_buy} @ "
+        f"{intent.price}{intent.currency}"
+    )
+
+    order_data: dict = add_order(
+        {
+            "ordertype": "limit",
+            "pair": intent.trading_pair,
+            "price": intent.price,
+            "type": "buy",
+            "volume": intent.volume,
+            "oflags": repricer.POST_ONLY_FLAGS if intent.post_only else "fciq",
+            "timeinforce": "GTD",
+            "expiretm": intent.expires_at,
+        },
+        intent.userref,
+        intent.scheduled_at,
+        private_key,
+        public_key,
+        deadline,
+    )
+
+    if not order_data.get("error") and order_data.get("result", {}).get("txid"):
+        order_tracker.get_tracker().record(
+            txids=order_data["result"]["txid"],
+            pair=intent.trading_pair,
+            volume=intent.volume,
+            price=intent.price,
+            submitted_at=intent.planned_at,
+            expires_at=intent.expires_at,
+            budget=intent.budget,
+            userref=intent.userref,
+            scheduled_at=intent.scheduled_at,
+        )
+    return order_data
+
 
 def place_limit_order_on_kraken(
-    crypto_to_buy: str, currency: str, trading_pair: str, budget: float, 
-    private_key: str, public_key: str, order_expires: str
+    crypto_to_buy: str,
+    currency: str,
+    trading_pair: str,
+    budget: float,
+    private_key: str,
+    public_key: str,
+    order_expires: str,
+    bid_price: str = None,
+    server_time: float = None,
+    post_only: bool = False,
+    deadline: float = None,
+    scheduled_at: int = None,
 ) -> dict:
-    bid_price: str = get_bid_price(trading_pair)
-    volume: str = get_trade_volume(budget, bid_price)
-    nonce: str = get_nonce()
-    server_time = get_server_time()
-    order_expires_in = calculate_order_expiration(server_time, order_expires)
-    
-    url_encoded_body: str = (
-        f"nonce={nonce}&ordertype=limit&pair={trading_pair}&price={bid_price}"
-        f"&type=buy&volume={volume}&oflags=fciq&timeinforce=GTD&expiretm={order_expires_in}"
-    )
-    
-    api_sign: str = get_api_sign(
-        api_path="/0/private/AddOrder",
-        urlencoded_body=url_encoded_body,
-        nonce=nonce,
+    if bid_price is None or server_time is None:
+        bid_price, server_time = fetch_market_data(trading_pair)
+    intent: order_intents.OrderIntent = plan_order_intent(
+        crypto_to_buy=crypto_to_buy,
+        currency=currency,
+        trading_pair=trading_pair,
+        budget=budget,
+        order_expires=order_expires,
+        bid_price=bid_price,
+        server_time=server_time,
+        scheduled_at=scheduled_at,
+        post_only=post_only,
+    )
+    return send_order_intent(intent, private_key, public_key, deadline)
+
+
+def submit_order_intent(
+    intent: order_intents.OrderIntent, deadline: float = None, redelivered=False
+) -> dict:
+    # Worker side of a queued intent. Keys come from the SSM cache, and a
+    # redelivered intent is first looked up by its userref, as the previous
+    # delivery may have placed it before failing.
+    credentials: dict = get_parameters(intent.key_parameters)
+    private_key: str = credentials[intent.key_parameters[0]]
+    public_key: str = credentials[intent.key_parameters[1]]
+    if redelivered:
+        existing: dict = find_order_by_userref(
+            intent.userref, intent.scheduled_at, private_key, public_key
+        )
+        if existing is not None:
+            return existing
+    if intent.price_policy == "bid":
+        intent.price, intent.volume = format_order(
+            intent.trading_pair, intent.budget, get_bid_price(intent.trading_pair)
+        )
+    order_data: dict = send_order_intent(intent, private_key, public_key, deadline)
+    if order_data.get("error"):
+        invalidate_credentials_on_auth_error(order_data["error"], intent.key_parameters)
+    return order_data
+
+
+def query_orders(txids: list[str], private_key: str, public_key: str) -> dict:
+    response = signed_post(
+        path="/0/private/QueryOrders",
+        data={"txid": ",".join(txids), "trades": "false"},
+        public_key=public_key,
         private_key=private_key,
     )
-    
-    logger.info(f"Placing order: {volume}{crypto_to_buy} @ {bid_price}{currency}")
-    
-    response = requests.post(
-        url="https://api.kraken.com/0/private/AddOrder",
-        data={
-            "nonce": nonce,
+    response.raise_for_status()
+    orders_data: dict = response.json()
+    if orders_data.get("error"):
+        raise ValueError(f"Error querying orders: {orders_data['error']}")
+    return orders_data["result"]
+
+
+def reconcile_tracked_orders(
+    private_key: str, public_key: str, submitted_before: float
+) -> None:
+    # Runs after the orders went out, so it never delays them, and a failure
+    # only leaves the previous orders open until the next run.
+    tracker: order_tracker.OrderTracker = order_tracker.get_tracker()
+    if not tracker.has_history(submitted_before):
+        logger.info("No earlier orders tracked, open orders are unknown")
+        metrics.set_properties(fillRate=None, medianTimeToFill=None, openOrders=None)
+        return
+    try:
+        with metrics.phase("reconcile"):
+            tracker.reconcile(
+                lambda txids: query_orders(txids, private_key, public_key),
+                submitted_before=submitted_before,
+            )
+    except (RequestException, ValueError) as e:
+        logger.warning(f"Could not reconcile tracked orders: {str(e)}")
+        return
+    metrics.set_properties(
+        fillRate=tracker.fill_rate(),
+        medianTimeToFill=tracker.median_time_to_fill(),
+        openOrders=len(tracker.open_txids()),
+    )
+    tracker.forget_finished(
+        submitted_before - order_tracker.ORDER_RETENTION_DAYS * 24 * 3600
+    )
+
+
+def streaming_enabled(event: dict) -> bool:
+    return bool(event.get("stream", MARKET_DATA_STREAM))
+
+
+def start_book_stream(trading_pairs: list[str]) -> None:
+    # Bids come from the streamed book once it is fresh, until then and
+    # whenever it goes stale they come from the REST Ticker.
+    try:
+        order_book.get_stream(trading_pairs)
+    except (ImportError, RequestException, ValueError) as e:
+        logger.warning(f"Book stream unavailable, using REST prices: {str(e)}")
+
+
+def place_replacement_order(
+    order: repricer.ChasedOrder,
+    price: str,
+    volume: str,
+    private_key: str,
+    public_key: str,
+    deadline: float = None,
+) -> dict:
+    # The replacement keeps the tick's userref, so the cancelled orders before
+    # it are left out of the lookup after an ambiguous failure.
+    return add_order(
+        {
             "ordertype": "limit",
-            "pair": trading_pair,
-            "price": bid_price,
+            "pair": order.pair,
+            "price": price,
             "type": "buy",
             "volume": volume,
-            "oflags": "fciq",
+            "oflags": repricer.POST_ONLY_FLAGS,
             "timeinforce": "GTD",
-            "expiretm": order_expires_in
+            "expiretm": order.expires_at,
         },
-        headers={"API-Key": public_key, "API-Sign": api_sign},
+        order.userref,
+        order.scheduled_at,
+        private_key,
+        public_key,
+        deadline,
+        exclude_txids=order.replaced_txids,
     )
-    
-    response.raise_for_status()
-    return response.json()
 
-def lambda_handler(event: dict, context) -> dict:
+
+def repricing_deadline(settings: dict, context) -> float:
+    window_seconds: float = float(
+        settings.get("window_seconds", repricer.REPRICE_WINDOW_SECONDS)
+    )
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining_time is not None:
+        window_seconds = min(
+            window_seconds,
+            get_remaining_time() / 1000 - repricer.REPRICE_DEADLINE_MARGIN_SECONDS,
+        )
+    return time.monotonic() + window_seconds
+
+
+def reprice_placed_orders(
+    txids: list[str],
+    settings: dict,
+    private_key: str,
+    public_key: str,
+    deadline: float,
+) -> None:
+    # Follows the best bid up to max_chase_percent above the first price until
+    # the orders fill or the window ends, the orders stay post-only throughout.
+    tracker: order_tracker.OrderTracker = order_tracker.get_tracker()
+    max_chase_percent: float = float(
+        settings.get("max_chase_percent", repricer.REPRICE_MAX_CHASE_PERCENT)
+    )
+    orders: list[repricer.ChasedOrder] = [
+        repricer.ChasedOrder(
+            txid=tracked.txid,
+            pair=tracked.pair,
+            budget=tracked.budget or float(tracked.volume) * float(tracked.price),
+            price=tracked.price,
+            volume=tracked.volume,
+            ceiling=repricer.chase_ceiling(tracked.price, max_chase_percent),
+            expires_at=tracked.expires_at,
+            userref=tracked.userref,
+            scheduled_at=tracked.scheduled_at,
+        )
+        for tracked in tracker.get(txids)
+    ]
+    chaser: repricer.Repricer = repricer.Repricer(
+        private_key=private_key,
+        public_key=public_key,
+        fetch_bids=get_bid_prices,
+        query_orders=lambda txids: query_orders(txids, private_key, public_key),
+        format_order=format_order,
+        method=settings.get("method", "edit"),
+        place_order=lambda order, price, volume: place_replacement_order(
+            order, price, volume, private_key, public_key, deadline
+        ),
+        interval_seconds=float(
+            settings.get("interval_seconds", repricer.REPRICE_INTERVAL_SECONDS)
+        ),
+        on_replace=tracker.replace,
+    )
+    try:
+        with metrics.phase("reprice"):
+            chaser.run(orders, deadline)
+    except (RequestException, ValueError) as e:
+        # The orders are already on the book at their last price.
+        logger.warning(f"Re-pricing stopped early: {str(e)}")
+    metrics.set_properties(repricedOrders=sum(order.repriced for order in orders))
+
+
+def repricing_settings(event: dict) -> dict:
+    # "reprice": true uses the defaults, a dict overrides window_seconds,
+    # interval_seconds, max_chase_percent and method ("edit" or "replace").
+    settings = event.get("reprice") or {}
+    return settings if isinstance(settings, dict) else {}
+
+
+def placed_txids(order_results: list[dict]) -> list[str]:
+    return [
+        txid
+        for order_result in order_results
+        for txid in order_result.get("result", {}).get("txid", [])
+    ]
+
+
+def place_batch_limit_orders_on_kraken(
+    pairs: list[dict],
+    currency: str,
+    allocations: list[allocation.Allocation],
+    bid_prices: dict[str, str],
+    server_time: float,
+    private_key: str,
+    public_key: str,
+    order_expires: str,
+    post_only: bool = False,
+    deadline: float = None,
+    key_parameters: list[str] = None,
+    scheduled_at: int = None,
+) -> list[dict]:
+    results: list[dict] = []
+    # Orders go out one at a time so every AddOrder gets a larger nonce.
+    for pair, pair_allocation in zip(pairs, allocations):
+        trading_pair: str = pair["trading_pair"]
+        if pair_allocation.skipped:
+            logger.info(f"Skipping {trading_pair}: {pair_allocation.skipped}")
+            results.append(
+                {"trading_pair": trading_pair, "skipped": pair_allocation.skipped}
+            )
+            continue
+        try:
+            order_data: dict = place_limit_order_on_kraken(
+                crypto_to_buy=pair["crypto_to_buy"],
+                currency=currency,
+                trading_pair=trading_pair,
+                budget=pair_allocation.budget,
+                private_key=private_key,
+                public_key=public_key,
+                order_expires=order_expires,
+                bid_price=bid_prices[trading_pair],
+                server_time=server_time,
+                scheduled_at=scheduled_at,
+                post_only=post_only,
+                deadline=deadline,
+            )
+        except RequestException as e:
+            logger.error(f"Order request for {trading_pair} failed: {str(e)}")
+            results.append({"trading_pair": trading_pair, "error": [str(e)]})
+            continue
+        except ValueError as e:
+            logger.error(str(e))
+            results.append({"trading_pair": trading_pair, "error": [str(e)]})
+            continue
+        if "error" in order_data and order_data["error"]:
+            invalidate_credentials_on_auth_error(order_data["error"], key_parameters)
+            logger.error(f"Error placing {trading_pair} order: {order_data['error']}")
+            results.append({"trading_pair": trading_pair, "error": order_data["error"]})
+            continue
+        results.append({"trading_pair": trading_pair, "result": order_data["result"]})
+    return results
+
+
+def dip_multipliers(
+    event: dict, bid_prices: dict[str, str], server_time: float
+) -> dict[str, float]:
+    # Budget multipliers from the rolling indicators when the event asks for
+    # dip buying. Without history the run buys as if it had not asked.
+    if "dip_buying" not in event:
+        return None
     try:
-        crypto_to_buy: str = event["crypto_to_buy"]
-        trading_pair: str = event["trading_pair"]
-        currency: str = event["currency"]
-        order_expires: str = event["order_expires"]
-        
-        private_key: str = get_aws_ssm_securestring_parameter("kraken-private-api-key")
-        public_key: str = get_aws_ssm_securestring_parameter("kraken-public-api-key")
-        
-        balance_data = my_balance_on_kraken(private_key=private_key, public_key=public_key)
-        
-        if 'error' in balance_data and balance_data['error']:
-            raise ValueError(f"Error fetching balance: {balance_data['error']}")
-        
-        budget = float(balance_data['result'][currency])
-        
-        order_data = place_limit_order_on_kraken(
-            crypto_to_buy=crypto_to_buy,
-            currency=currency,
+        with metrics.phase("indicators"):
+            multipliers: dict[str, float] = indicators.budget_multipliers(
+                bid_prices, server_time, event["dip_buying"]
+            )
+    except (RequestException, ValueError) as e:
+        logger.warning(f"Could not update indicators: {str(e)}")
+        return None
+    logger.info(f"Budget multipliers: {multipliers}")
+    metrics.set_properties(budgetMultipliers=multipliers)
+    return multipliers
+
+
+def queued_submission(event: dict) -> bool:
+    return event.get("submit") == "queue"
+
+
+def queue_order_intents(
+    intents: list[order_intents.OrderIntent], context=None, skipped: list[dict] = None
+) -> dict:
+    intent_queue = order_intents.get_queue()
+    with metrics.phase("queue"):
+        intent_queue.send(intents)
+    # An in-process queue is drained by the run that planned it, SQS by
+    # separate drain runs.
+    if order_intents.is_in_process(intent_queue):
+        return handle_drain_event(context, skipped)
+    return {
+        "statusCode": 202,
+        "body": json.dumps(
+            {
+                "message": "Orders queued",
+                "intents": [intent.intent_id for intent in intents],
+                "results": skipped or [],
+            }
+        ),
+    }
+
+
+def handle_drain_event(context=None, skipped: list[dict] = None) -> dict:
+    intent_queue = order_intents.get_queue()
+    pool = order_intents.WorkerPool(intent_queue, submit_order_intent)
+    with metrics.phase("drain"):
+        outcomes: list[dict] = pool.drain(deadline=order_deadline(context))
+    status_code, message = order_intents.outcome_status(
+        outcomes, intent_queue.pending()
+    )
+    return {
+        "statusCode": status_code,
+        "body": json.dumps({"message": message, "results": (skipped or []) + outcomes}),
+    }
+
+
+def handle_batch_event(event: dict, context=None, held: lease.Lease = None) -> dict:
+    pairs: list[dict] = event["pairs"]
+    currency: str = event["currency"]
+    order_expires: str = event["order_expires"]
+    if not pairs:
+        raise ValueError("No trading pairs given")
+
+    key_parameters: list[str] = get_key_parameters(event)
+    with metrics.phase("ssm"):
+        credentials: dict = get_parameters(key_parameters)
+    private_key: str = credentials[key_parameters[0]]
+    public_key: str = credentials[key_parameters[1]]
+
+    with metrics.phase("fetch"):
+        balance_data, bid_prices, server_time = fetch_batch_pre_order_data(
+            trading_pairs=[pair["trading_pair"] for pair in pairs],
+            private_key=private_key,
+            public_key=public_key,
+        )
+
+    if "error" in balance_data and balance_data["error"]:
+        invalidate_credentials_on_auth_error(balance_data["error"], key_parameters)
+        raise ValueError(f"Error fetching balance: {balance_data['error']}")
+
+    allocations: list[allocation.Allocation] = allocation.allocate(
+        settings=event.get("allocation", {}),
+        pairs=pairs,
+        cash=float(balance_data["result"][currency]),
+        balances=balance_data["result"],
+        bid_prices=bid_prices,
+        now=server_time,
+        multipliers=dip_multipliers(event, bid_prices, server_time),
+    )
+    if held is not None:
+        lease.ensure_current(held)
+    scheduled_at: int = scheduled_tick(event, server_time)
+    placed_before: dict[str, dict] = orders_of_earlier_attempt(
+        event,
+        held,
+        [
+            pair["trading_pair"]
+            for pair, pair_allocation in zip(pairs, allocations)
+            if not pair_allocation.skipped
+        ],
+        scheduled_at,
+        private_key,
+        public_key,
+    )
+    earlier_results: list[dict] = [
+        {"trading_pair": trading_pair, "result": order_data["result"]}
+        for trading_pair, order_data in placed_before.items()
+    ]
+    remaining: list[int] = [
+        index
+        for index, pair in enumerate(pairs)
+        if pair["trading_pair"] not in placed_before
+    ]
+    pairs = [pairs[index] for index in remaining]
+    allocations = [allocations[index] for index in remaining]
+    if queued_submission(event):
+        intents: list[order_intents.OrderIntent] = []
+        skipped: list[dict] = list(earlier_results)
+        for pair, pair_allocation in zip(pairs, allocations):
+            if pair_allocation.skipped:
+                skipped.append(
+                    {
+                        "trading_pair": pair["trading_pair"],
+                        "skipped": pair_allocation.skipped,
+                    }
+                )
+                continue
+            intents.append(
+                plan_order_intent(
+                    crypto_to_buy=pair["crypto_to_buy"],
+                    currency=currency,
+                    trading_pair=pair["trading_pair"],
+                    budget=pair_allocation.budget,
+                    order_expires=order_expires,
+                    bid_price=bid_prices[pair["trading_pair"]],
+                    server_time=server_time,
+                    scheduled_at=scheduled_at,
+                    key_parameters=key_parameters,
+                    post_only=bool(event.get("reprice")),
+                    price_policy=event.get("price_policy", "limit"),
+                )
+            )
+        return queue_order_intents(intents, context, skipped)
+    results: list[dict] = earlier_results + place_batch_limit_orders_on_kraken(
+        pairs=pairs,
+        currency=currency,
+        allocations=allocations,
+        bid_prices=bid_prices,
+        server_time=server_time,
+        scheduled_at=scheduled_at,
+        private_key=private_key,
+        public_key=public_key,
+        order_expires=order_expires,
+        post_only=bool(event.get("reprice")),
+        deadline=order_deadline(context),
+        key_parameters=key_parameters,
+    )
+    if streaming_enabled(event):
+        start_book_stream([pair["trading_pair"] for pair in event["pairs"]])
+    if event.get("reprice"):
+        reprice_placed_orders(
+            placed_txids(results),
+            repricing_settings(event),
+            private_key,
+            public_key,
+            deadline=repricing_deadline(repricing_settings(event), context),
+        )
+    reconcile_tracked_orders(private_key, public_key, submitted_before=server_time)
+
+    failed: int = sum(1 for result in results if "error" in result)
+    placed: int = sum(1 for result in results if "result" in result)
+    if failed == 0 and placed == 0:
+        status_code, message = 200, "No orders to place"
+    elif failed == 0:
+        status_code, message = 200, "Orders placed successfully"
+    elif placed > 0:
+        status_code, message = 207, "Some orders failed"
+    else:
+        status_code, message = 400, "All orders failed"
+    return {
+        "statusCode": status_code,
+        "body": json.dumps({"message": message, "results": results}),
+    }
+
+
+def get_key_parameters(event: dict) -> list[str]:
+    # SSM names of the private and public key, accounts other than the default
+    # one name their own.
+    return [
+        event.get("private_key_parameter", PRIVATE_KEY_PARAMETER),
+        event.get("public_key_parameter", PUBLIC_KEY_PARAMETER),
+    ]
+
+
+def invalidate_credentials_on_auth_error(
+    errors: list, key_parameters: list[str] = None
+) -> None:
+    # A rotated key must not stay cached until the TTL runs out.
+    if is_auth_error(errors):
+        invalidate(key_parameters or [PRIVATE_KEY_PARAMETER, PUBLIC_KEY_PARAMETER])
+
+
+def lambda_handler(event: dict, context) -> dict:
+    metrics.start_invocation("dca")
+    response: dict = handle_event(event, context)
+    metrics.finish_invocation(statusCode=response["statusCode"])
+    return response
+
+
+def run_lease_key(event: dict) -> str:
+    # Runs of one account that spend the same balance must not overlap.
+    return event.get(
+        "lease_key", f"dca:{get_key_parameters(event)[1]}:{event['currency']}"
+    )
+
+
+def handle_single_event(event: dict, context=None, held: lease.Lease = None) -> dict:
+    crypto_to_buy: str = event["crypto_to_buy"]
+    trading_pair: str = event["trading_pair"]
+    currency: str = event["currency"]
+    order_expires: str = event["order_expires"]
+
+    key_parameters: list[str] = get_key_parameters(event)
+    with metrics.phase("ssm"):
+        credentials: dict = get_parameters(key_parameters)
+    private_key: str = credentials[key_parameters[0]]
+    public_key: str = credentials[key_parameters[1]]
+
+    with metrics.phase("fetch"):
+        balance_data, bid_price, server_time = fetch_pre_order_data(
             trading_pair=trading_pair,
-            budget=budget,
             private_key=private_key,
             public_key=public_key,
-            order_expires=order_expires,
         )
-        
-        if 'error' in order_data and order_data['error']:
-            raise ValueError(f"Error placing order: {order_data['error']}")
-        
+
+    if "error" in balance_data and balance_data["error"]:
+        invalidate_credentials_on_auth_error(balance_data["error"], key_parameters)
+        raise ValueError(f"Error fetching balance: {balance_data['error']}")
+
+    budget = float(balance_data["result"][currency])
+    multipliers: dict[str, float] = dip_multipliers(
+        event, {trading_pair: bid_price}, server_time
+    )
+    if multipliers:
+        # The whole balance is already the budget, so only a spike changes it.
+        budget *= min(multipliers[trading_pair], 1.0)
+
+    if held is not None:
+        lease.ensure_current(held)
+    scheduled_at: int = scheduled_tick(event, server_time)
+    placed_before: dict = orders_of_earlier_attempt(
+        event, held, [trading_pair], scheduled_at, private_key, public_key
+    ).get(trading_pair)
+    if placed_before is not None:
         return {
-            'statusCode': 200,
-            'body': json.dumps({
-                'message': 'Order placed successfully',
-                'result': order_data['result']
-            })
+            "statusCode": 200,
+            "body": json.dumps(
+                {"message": "Order already placed", "result": placed_before["result"]}
+            ),
         }
-    
+    if queued_submission(event):
+        return queue_order_intents(
+            [
+                plan_order_intent(
+                    crypto_to_buy=crypto_to_buy,
+                    currency=currency,
+                    trading_pair=trading_pair,
+                    budget=budget,
+                    order_expires=order_expires,
+                    bid_price=bid_price,
+                    server_time=server_time,
+                    scheduled_at=scheduled_at,
+                    key_parameters=key_parameters,
+                    post_only=bool(event.get("reprice")),
+                    price_policy=event.get("price_policy", "limit"),
+                )
+            ],
+            context,
+        )
+    order_data = place_limit_order_on_kraken(
+        crypto_to_buy=crypto_to_buy,
+        currency=currency,
+        trading_pair=trading_pair,
+        budget=budget,
+        private_key=private_key,
+        public_key=public_key,
+        order_expires=order_expires,
+        bid_price=bid_price,
+        server_time=server_time,
+        scheduled_at=scheduled_at,
+        post_only=bool(event.get("reprice")),
+        deadline=order_deadline(context),
+    )
+
+    if "error" in order_data and order_data["error"]:
+        invalidate_credentials_on_auth_error(order_data["error"], key_parameters)
+        raise ValueError(f"Error placing order: {order_data['error']}")
+
+    if streaming_enabled(event):
+        start_book_stream([trading_pair])
+    if event.get("reprice"):
+        reprice_placed_orders(
+            placed_txids([order_data]),
+            repricing_settings(event),
+            private_key,
+            public_key,
+            deadline=repricing_deadline(repricing_settings(event), context),
+        )
+
+    reconcile_tracked_orders(private_key, public_key, submitted_before=server_time)
+
+    return {
+        "statusCode": 200,
+        "body": json.dumps(
+            {"message": "Order placed successfully", "result": order_data["result"]}
+        ),
+    }
+
+
+def handle_event(event: dict, context=None) -> dict:
+    try:
+        if "accounts" in event:
+            return accounts.handle_accounts_event(event, handle_event, context)
+        if event.get("drain"):
+            return handle_drain_event(context)
+        with lease.hold(
+            run_lease_key(event),
+            lease.run_owner(context),
+            cooldown_seconds=float(event.get("cooldown_minutes", 0)) * 60,
+        ) as held:
+            if "pairs" in event:
+                return handle_batch_event(event, context, held)
+            return handle_single_event(event, context, held)
+
     except KeyError as e:
         logger.error(f"Missing required parameter: {str(e)}")
         return {
-            'statusCode': 400,
-            'body': json.dumps({'message': 'Missing required parameter', 'error': str(e)})
+            "statusCode": 400,
+            "body": json.dumps(
+                {"message": "Missing required parameter", "error": str(e)}
+            ),
         }
-    
+
+    except (lease.LeaseHeld, lease.LeaseLost) as e:
+        logger.warning(str(e))
+        return {"statusCode": 409, "body": json.dumps({"message": str(e)})}
+
     except ValueError as e:
         logger.error(str(e))
-        return {
-            'statusCode': 400,
-            'body': json.dumps({'message': str(e)})
-        }
-    
-    except requests.exceptions.RequestException as e:
+        return {"statusCode": 400, "body": json.dumps({"message": str(e)})}
+
+    except RequestException as e:
         logger.error(f"API request failed: {str(e)}")
         return {
-            'statusCode': 500,
-            'body': json.dumps({'message': 'API request failed', 'error': str(e)})
+            "statusCode": 500,
+            "body": json.dumps({"message": "API request failed", "error": str(e)}),
         }
-    
+
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         return {
-            'statusCode': 500,
-            'body': json.dumps({'message': 'Internal server error', 'error': str(e)})
+            "statusCode": 500,
+            "body": json.dumps({"message": "Internal server error", "error": str(e)}),
         }
@@ -0,0 +1,341 @@
+import argparse
+import json
+import os
+import sys
+import time
+from dataclasses import dataclass
+import numpy as np
+
+HISTORY_DIR: str = os.environ.get("HISTORY_DIR", "/tmp/kraken-history")
+# TradesHistory and Ledgers return at most 50 rows per call.
+PAGE_SIZE: int = 50
+# start is exclusive and whole seconds, rows from the last synced second are
+# fetched again and dropped as duplicates.
+RESYNC_OVERLAP_SECONDS: int = 1
+
+
+@dataclass(frozen=True)
+class TableSchema:
+    name: str
+    path: str
+    result_key: str
+    columns: dict
+    # Dictionary-encoded to int16 codes, e.g. pairs and assets.
+    categorical: tuple
+    index_column: str
+
+
+TRADES: TableSchema = TableSchema(
+    name="trades",
+    path="/0/private/TradesHistory",
+    result_key="trades",
+    columns={
+        "id": "S32",
+        "ordertxid": "S32",
+        "pair": "i2",
+        "time": "f8",
+        "type": "i2",
+        "ordertype": "i2",
+        "price": "f8",
+        "cost": "f8",
+        "fee": "f8",
+        "vol": "f8",
+    },
+    categorical=("pair", "type", "ordertype"),
+    index_column="pair",
+)
+LEDGERS: TableSchema = TableSchema(
+    name="ledgers",
+    path="/0/private/Ledgers",
+    result_key="ledger",
+    columns={
+        "id": "S32",
+        "refid": "S32",
+        "time": "f8",
+        "type": "i2",
+        "subtype": "i2",
+        "asset": "i2",
+        "amount": "f8",
+        "fee": "f8",
+        "balance": "f8",
+    },
+    categorical=("type", "subtype", "asset"),
+    index_column="asset",
+)
+
+
+class ColumnarTable:
+    # Append-only: one raw little-endian file per column plus meta.json, which
+    # holds the committed row count, the category dictionaries and the sync
+    # cursor. Rows are appended in time order, so time ranges are binary
+    # searches, and every index_column value has its own file of row numbers.
+    def __init__(self, directory: str, schema: TableSchema):
+        self.directory: str = directory
+        self.schema: TableSchema = schema
+        os.makedirs(os.path.join(directory, "index"), exist_ok=True)
+        self.meta: dict = self._load_meta()
+        self._truncate_uncommitted()
+
+    def _meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def _column_path(self, column: str) -> str:
+        return os.path.join(self.directory, f"{column}.bin")
+
+    def pending_path(self) -> str:
+        return os.path.join(self.directory, "pending.jsonl")
+
+    def _index_path(self, code: int) -> str:
+        return os.path.join(self.directory, "index", f"{code}.bin")
+
+    def _load_meta(self) -> dict:
+        try:
+            with open(self._meta_path()) as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {
+                "rows": 0,
+                "categories": {column: [] for column in self.schema.categorical},
+                "index_rows": {},
+                "cursor": None,
+                "synced_until": None,
+            }
+
+    def save_meta(self) -> None:
+        temporary_path: str = f"{self._meta_path()}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(self.meta, file, separators=(",", ":"))
+        os.replace(temporary_path, self._meta_path())
+
+    def _truncate_uncommitted(self) -> None:
+        # An append interrupted before meta.json was written leaves extra bytes.
+        for column, dtype in self.schema.columns.items():
+            path: str = self._column_path(column)
+            committed: int = self.meta["rows"] * np.dtype(dtype).itemsize
+            if os.path.exists(path) and os.path.getsize(path) > committed:
+                os.truncate(path, committed)
+        for code, rows in self.meta["index_rows"].items():
+            path = self._index_path(int(code))
+            if os.path.exists(path) and os.path.getsize(path) > rows * 8:
+                os.truncate(path, rows * 8)
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def column(self, name: str) -> np.ndarray:
+        dtype = np.dtype(self.schema.columns[name]).newbyteorder("<")
+        if len(self) == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(
+            self._column_path(name), dtype=dtype, mode="r", shape=(len(self),)
+        )
+
+    def code(self, column: str, value: str) -> int:
+        categories: list = self.meta["categories"][column]
+        return categories.index(value) if value in categories else -1
+
+    def _encode(self, column: str, values: list) -> np.ndarray:
+        categories: list = self.meta["categories"][column]
+        for value in values:
+            if value not in categories:
+                categories.append(value)
+        lookup: dict = {value: code for code, value in enumerate(categories)}
+        return np.array([lookup[value] for value in values], dtype="<i2")
+
+    def append(self, rows: list[dict]) -> int:
+        # rows are Kraken result rows with their id under "id". Rows already
+        # in the table are skipped.
+        rows = sorted(
+            {row["id"]: row for row in rows}.values(),
+            key=lambda row: float(row["time"]),
+        )
+        if rows and len(self):
+            # Duplicates can only overlap the newest rows already stored.
+            first_time: float = float(rows[0]["time"])
+            overlap: int = np.searchsorted(self.column("time"), first_time, "left")
+            known: set = set(self.column("id")[overlap:].tolist())
+            rows = [row for row in rows if row["id"].encode() not in known]
+        if not rows:
+            return 0
+        first_row: int = len(self)
+        for column, dtype in self.schema.columns.items():
+            values: list = [row.get(column) or "" for row in rows]
+            if column in self.schema.categorical:
+                array = self._encode(column, values)
+            elif dtype.startswith("S"):
+                array = np.array([value.encode() for value in values], dtype=dtype)
+            else:
+                array = np.array([float(value or 0) for value in values], dtype="<f8")
+            with open(self._column_path(column), "ab") as file:
+                file.write(array.tobytes())
+        codes = self._encode(
+            self.schema.index_column,
+            [row.get(self.schema.index_column) or "" for row in rows],
+        )
+        for code in np.unique(codes):
+            row_numbers = first_row + np.flatnonzero(codes == code).astype("<i8")
+            with open(self._index_path(int(code)), "ab") as file:
+                file.write(row_numbers.tobytes())
+            key: str = str(int(code))
+            self.meta["index_rows"][key] = self.meta["index_rows"].get(key, 0) + len(
+                row_numbers
+            )
+        self.meta["rows"] = first_row + len(rows)
+        self.save_meta()
+        return len(rows)
+
+    def rows_for(self, value: str, start: float = None, end: float = None):
+        # Row numbers for one pair or asset between start and end, inclusive.
+        code: int = self.code(self.schema.index_column, value)
+        count: int = self.meta["index_rows"].get(str(code), 0)
+        if code < 0 or count == 0:
+            return np.empty(0, dtype="<i8")
+        row_numbers = np.memmap(
+            self._index_path(code), dtype="<i8", mode="r", shape=(count,)
+        )
+        times = self.column("time")[row_numbers]
+        lower: int = 0 if start is None else np.searchsorted(times, start, "left")
+        upper: int = count if end is None else np.searchsorted(times, end, "right")
+        return row_numbers[lower:upper]
+
+
+def sync_table(table: ColumnarTable, fetch_page, now: float = None) -> int:
+    # fetch_page(params) returns the result of one TradesHistory or Ledgers
+    # call. A sync covers (synced_until, end] with a fixed end, so offsets
+    # stay put while new rows arrive, and the cursor and fetched rows are saved
+    # after every page so an interrupted sync carries on where it stopped.
+    meta: dict = table.meta
+    if meta["cursor"] is None:
+        synced_until = meta["synced_until"]
+        meta["cursor"] = {
+            "start": (
+                None
+                if synced_until is None
+                else int(synced_until) - RESYNC_OVERLAP_SECONDS
+            ),
+            "end": int(now if now is not None else time.time()),
+            "ofs": 0,
+        }
+        open(table.pending_path(), "w").close()
+        table.save_meta()
+
+    cursor: dict = meta["cursor"]
+    while True:
+        params: dict = {"end": cursor["end"], "ofs": cursor["ofs"]}
+        if cursor["start"] is not None:
+            params["start"] = cursor["start"]
+        result: dict = fetch_page(params)
+        rows: dict = result.get(table.schema.result_key) or {}
+        # A page written twice after a crash is deduplicated on append.
+        with open(table.pending_path(), "a") as file:
+            for row_id, row in rows.items():
+                file.write(json.dumps(dict(row, id=row_id)) + "\n")
+        cursor["ofs"] += len(rows)
+        table.save_meta()
+        if len(rows) < PAGE_SIZE or cursor["ofs"] >= int(result.get("count", 0)):
+            break
+
+    with open(table.pending_path()) as file:
+        pending: list[dict] = [json.loads(line) for line in file if line.strip()]
+    added: int = table.append(pending)
+    meta["synced_until"] = cursor["end"]
+    meta["cursor"] = None
+    table.save_meta()
+    os.remove(table.pending_path())
+    return added
+
+
+class HistoryStore:
+    def __init__(self, directory: str = HISTORY_DIR):
+        self.trades: ColumnarTable = ColumnarTable(
+            os.path.join(directory, TRADES.name), TRADES
+        )
+        self.ledgers: ColumnarTable = ColumnarTable(
+            os.path.join(directory, LEDGERS.name), LEDGERS
+        )
+
+    def sync(self, fetch_trades, fetch_ledgers, now: float = None) -> dict:
+        return {
+            "trades": sync_table(self.trades, fetch_trades, now),
+            "ledgers": sync_table(self.ledgers, fetch_ledgers, now),
+        }
+
+    def cost_basis(self, pair: str, start: float = None, end: float = None) -> dict:
+        rows = self.trades.rows_for(pair, start, end)
+        buys = self.trades.column("type")[rows] == self.trades.code("type", "buy")
+        sells = ~buys
+        cost = self.trades.column("cost")[rows]
+        fee = self.trades.column("fee")[rows]
+        vol = self.trades.column("vol")[rows]
+        bought: float = float(vol[buys].sum())
+        spent: float = float(cost[buys].sum() + fee[buys].sum())
+        sold: float = float(vol[sells].sum())
+        average_price: float = spent / bought if bought else None
+        proceeds: float = float(cost[sells].sum() - fee[sells].sum())
+        return {
+            "trades": int(len(rows)),
+            "bought": bought,
+            "spent": spent,
+            "fees": float(fee.sum()),
+            "average_price": average_price,
+            "sold": sold,
+            "proceeds": proceeds,
+            # Realised against the average buy price over the same period.
+            "realised_pnl": proceeds - sold * average_price if average_price else 0.0,
+            "holding": bought - sold,
+        }
+
+
+def fetch_history_page(path: str, private_key: str, public_key: str):
+    from kraken_client import signed_post
+
+    def fetch_page(params: dict) -> dict:
+        response = signed_post(
+            path=path, data=params, public_key=public_key, private_key=private_key
+        )
+        response.raise_for_status()
+        page: dict = response.json()
+        if page.get("error"):
+            raise ValueError(f"Error fetching {path}: {page['error']}")
+        return page["result"]
+
+    return fetch_page
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Sync trade and ledger history and report cost basis."
+    )
+    parser.add_argument("--dir", default=HISTORY_DIR)
+    parser.add_argument("--no-sync", action="store_true")
+    parser.add_argument("--pairs", nargs="*", default=[])
+    args = parser.parse_args()
+
+    store: HistoryStore = HistoryStore(args.dir)
+    if not args.no_sync:
+        from dca import PRIVATE_KEY_PARAMETER, PUBLIC_KEY_PARAMETER
+        from ssm_cache import get_parameters
+
+        credentials: dict = get_parameters(
+            [PRIVATE_KEY_PARAMETER, PUBLIC_KEY_PARAMETER]
+        )
+        keys: tuple = (
+            credentials[PRIVATE_KEY_PARAMETER],
+            credentials[PUBLIC_KEY_PARAMETER],
+        )
+        added: dict = store.sync(
+            fetch_history_page(TRADES.path, *keys),
+            fetch_history_page(LEDGERS.path, *keys),
+        )
+        print(f"Added {added['trades']} trades and {added['ledgers']} ledger entries")
+
+    for pair in args.pairs:
+        start: float = time.perf_counter()
+        summary: dict = store.cost_basis(pair)
+        elapsed_ms: float = (time.perf_counter() - start) * 1000
+        print(f"{pair}: {json.dumps(summary)} ({elapsed_ms:.2f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+import math
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from kraken_client import public_get
+
+# Candle length and number of candles the indicators cover, one day of hourly
+# closes by default.
+INDICATOR_INTERVAL_MINUTES: int = int(
+    os.environ.get("INDICATOR_INTERVAL_MINUTES", "60")
+)
+INDICATOR_WINDOW: int = int(os.environ.get("INDICATOR_WINDOW", "24"))
+# Pairs seeded from OHLC at once.
+INDICATOR_SEED_WORKERS: int = int(os.environ.get("INDICATOR_SEED_WORKERS", "8"))
+
+# How strongly a price below or above the mean, measured in volatilities,
+# scales the budget, and the bounds of the scaling.
+DIP_SENSITIVITY: float = 0.5
+DIP_MIN_MULTIPLIER: float = 0.5
+DIP_MAX_MULTIPLIER: float = 2.0
+# Volatility used when the window is flat, so a tiny move is not a huge dip.
+DIP_MIN_VOLATILITY: float = 0.001
+
+
+class RollingWindow:
+    # The last size values in a ring buffer, with their sum, sum of squares,
+    # minimum and maximum kept up to date in O(1) amortized per push.
+    def __init__(self, size: int):
+        if size < 1:
+            raise ValueError("Window size must be at least 1")
+        self.size: int = size
+        self._values: list[float] = [0.0] * size
+        self._count: int = 0
+        self.sum: float = 0.0
+        self.squares: float = 0.0
+        # (sequence number, value), increasing values for the minimum and
+        # decreasing ones for the maximum.
+        self._minimums: deque = deque()
+        self._maximums: deque = deque()
+
+    def __len__(self) -> int:
+        return min(self._count, self.size)
+
+    def is_full(self) -> bool:
+        return self._count >= self.size
+
+    def push(self, value: float) -> None:
+        index: int = self._count % self.size
+        if self.is_full():
+            evicted: float = self._values[index]
+            self.sum -= evicted
+            self.squares -= evicted * evicted
+        self._values[index] = value
+        self.sum += value
+        self.squares += value * value
+
+        while self._minimums and self._minimums[-1][1] >= value:
+            self._minimums.pop()
+        self._minimums.append((self._count, value))
+        while self._maximums and self._maximums[-1][1] <= value:
+            self._maximums.pop()
+        self._maximums.append((self._count, value))
+        oldest: int = self._count - self.size + 1
+        if self._minimums[0][0] < oldest:
+            self._minimums.popleft()
+        if self._maximums[0][0] < oldest:
+            self._maximums.popleft()
+
+        self._count += 1
+        # Sums that are only ever updated drift, so they are recomputed once
+        # per window, which keeps pushes O(1) on average.
+        if self._count % self.size == 0:
+            self.sum = math.fsum(self._values)
+            self.squares = math.fsum(value * value for value in self._values)
+
+    def last(self) -> float:
+        if not self._count:
+            return None
+        return self._values[(self._count - 1) % self.size]
+
+    def minimum(self) -> float:
+        return self._minimums[0][1] if self._minimums else None
+
+    def maximum(self) -> float:
+        return self._maximums[0][1] if self._maximums else None
+
+
+def mean(count: int, total: float) -> float:
+    return total / count if count else None
+
+
+def stdev(count: int, total: float, squares: float) -> float:
+    # Sample standard deviation from a count, sum and sum of squares.
+    if count < 2:
+        return None
+    variance: float = (squares - total * total / count) / (count - 1)
+    return math.sqrt(max(variance, 0.0))
+
+
+@dataclass
+class Snapshot:
+    price: float
+    sma: float
+    ema: float
+    low: float
+    high: float
+    # Standard deviation of log returns per candle.
+    volatility: float
+    samples: int
+
+
+class PairIndicators:
+    # Rolling indicators over the last window candle closes. Closed candles
+    # are kept in ring buffers, the open one on its own, so prices within it
+    # revise its close in O(1) and ticks or streamed prices can be fed in as
+    # often as they arrive.
+    def __init__(
+        self,
+        window: int = None,
+        interval_minutes: float = None,
+        ema_span: int = None,
+    ):
+        self.window: int = INDICATOR_WINDOW if window is None else window
+        if self.window < 3:
+            raise ValueError("Indicator windows need at least three candles")
+        self.interval_seconds: float = (
+            INDICATOR_INTERVAL_MINUTES if interval_minutes is None else interval_minutes
+        ) * 60
+        self.alpha: float = 2 / ((self.window if ema_span is None else ema_span) + 1)
+        self.closes: RollingWindow = RollingWindow(self.window - 1)
+        self.returns: RollingWindow = RollingWindow(self.window - 2)
+        self._candle: int = None
+        self._price: float = None
+        # EMA up to the last closed candle.
+        self._closed_ema: float = None
+        self._lock = threading.Lock()
+
+    def update(self, time: float, price: float) -> None:
+        candle: int = int(time // self.interval_seconds)
+        with self._lock:
+            if self._candle is not None and candle < self._candle:
+                return
+            if self._candle is not None and candle > self._candle:
+                if len(self.closes):
+                    self.returns.push(math.log(self._price / self.closes.last()))
+                self.closes.push(self._price)
+                self._closed_ema = self._ema()
+            self._candle = candle
+            self._price = price
+
+    def _ema(self) -> float:
+        if self._closed_ema is None:
+            return self._price
+        return self._closed_ema + self.alpha * (self._price - self._closed_ema)
+
+    def samples(self) -> int:
+        return len(self.closes) + (self._price is not None)
+
+    def is_current(self, time: float) -> bool:
+        # False once a whole candle was missed, the windows would mix candles
+        # of different lengths then.
+        return (
+            self._candle is not None
+            and int(time // self.interval_seconds) - self._candle <= 1
+        )
+
+    def is_warm(self) -> bool:
+        return self.closes.is_full()
+
+    def snapshot(self) -> Snapshot:
+        with self._lock:
+            if self._price is None:
+                return Snapshot(None, None, None, None, None, None, 0)
+            count: int = len(self.closes) + 1
+            returns: int = len(self.returns)
+            open_return: float = 0.0
+            if len(self.closes):
+                open_return = math.log(self._price / self.closes.last())
+                returns += 1
+            return Snapshot(
+                price=self._price,
+                sma=mean(count, self.closes.sum + self._price),
+                ema=self._ema(),
+                low=min(self.closes.minimum() or self._price, self._price),
+                high=max(self.closes.maximum() or self._price, self._price),
+                volatility=stdev(
+                    returns,
+                    self.returns.sum + open_return,
+                    self.returns.squares + open_return * open_return,
+                ),
+                samples=count,
+            )
+
+
+def budget_multiplier(snapshot: Snapshot, settings: dict = None) -> float:
+    # Scales the budget up when the price is below its moving average and down
+    # when it is above, by how many volatilities it is away.
+    settings = settings or {}
+    if snapshot.volatility is None:
+        return 1.0
+    reference: float = snapshot.ema if settings.get("mean") == "ema" else snapshot.sma
+    volatility: float = max(
+        snapshot.volatility,
+        float(settings.get("min_volatility", DIP_MIN_VOLATILITY)),
+    )
+    score: float = math.log(snapshot.price / reference) / volatility
+    multiplier: float = 1 - float(settings.get("sensitivity", DIP_SENSITIVITY)) * score
+    return min(
+        max(multiplier, float(settings.get("min_multiplier", DIP_MIN_MULTIPLIER))),
+        float(settings.get("max_multiplier", DIP_MAX_MULTIPLIER)),
+    )
+
+
+def fetch_ohlc(trading_pair: str, interval_minutes: int) -> list[list]:
+    response = public_get(
+        f"/0/public/OHLC?pair={trading_pair}&interval={interval_minutes}"
+    )
+    response.raise_for_status()
+    ohlc_data: dict = response.json()
+    if ohlc_data.get("error"):
+        raise ValueError(f"Error fetching OHLC: {ohlc_data['error']}")
+    # The result is keyed by Kraken's name for the pair, next to "last".
+    return next(
+        candles for key, candles in ohlc_data["result"].items() if key != "last"
+    )
+
+
+def seed(indicators: PairIndicators, candles: list[list]) -> None:
+    # Candles are [time, open, high, low, close, vwap, volume, count], the
+    # last one is still open.
+    for candle in candles[-indicators.window :]:
+        indicators.update(float(candle[0]), float(candle[4]))
+
+
+# Module scope so a warm sandbox or service process only seeds once and then
+# keeps updating.
+_indicators: dict[str, PairIndicators] = {}
+_indicators_lock = threading.Lock()
+
+
+def get_indicators(trading_pair: str) -> PairIndicators:
+    with _indicators_lock:
+        if trading_pair not in _indicators:
+            _indicators[trading_pair] = PairIndicators()
+        return _indicators[trading_pair]
+
+
+def reset_indicators(trading_pair: str = None) -> None:
+    with _indicators_lock:
+        if trading_pair is None:
+            _indicators.clear()
+        else:
+            _indicators.pop(trading_pair, None)
+
+
+def update_prices(prices: dict[str, str], now: float, fetch_candles=None) -> None:
+    # Seeds pairs seen for the first time, or not updated for a whole candle,
+    # from OHLC history, then adds the current prices.
+    fetch = fetch_candles or fetch_ohlc
+    unseeded: list[str] = [
+        pair for pair in prices if not get_indicators(pair).is_current(now)
+    ]
+    for pair in unseeded:
+        reset_indicators(pair)
+    if unseeded:
+        with ThreadPoolExecutor(
+            max_workers=min(len(unseeded), INDICATOR_SEED_WORKERS)
+        ) as executor:
+            histories: list = list(
+                executor.map(
+                    lambda pair: fetch(
+                        pair, int(get_indicators(pair).interval_seconds // 60)
+                    ),
+                    unseeded,
+                )
+            )
+        for pair, candles in zip(unseeded, histories):
+            seed(get_indicators(pair), candles)
+    for pair, price in prices.items():
+        get_indicators(pair).update(now, float(price))
+
+
+def budget_multipliers(
+    prices: dict[str, str], now: float, settings: dict = None, fetch_candles=None
+) -> dict[str, float]:
+    update_prices(prices, now, fetch_candles)
+    return {
+        pair: budget_multiplier(get_indicators(pair).snapshot(), settings)
+        for pair in prices
+    }
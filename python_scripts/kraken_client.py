@@ -0,0 +1,186 @@
+import os
+import threading
+import time
+import metrics
+import rate_limiter
+from nonces import get_nonce_generator
+from signer import get_signer
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter, Retry
+except ImportError:
+    # The Lambda python runtime ships without requests, but pip vendors it.
+    from pip._vendor import requests
+    from pip._vendor.requests.adapters import HTTPAdapter, Retry
+
+RequestException = requests.exceptions.RequestException
+
+KRAKEN_API_URL: str = os.environ.get("KRAKEN_API_URL", "https://api.kraken.com")
+CONNECT_TIMEOUT: float = float(os.environ.get("KRAKEN_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT: float = float(os.environ.get("KRAKEN_READ_TIMEOUT", "5"))
+MAX_RETRIES: int = int(os.environ.get("KRAKEN_MAX_RETRIES", "2"))
+RETRY_BACKOFF_FACTOR: float = float(os.environ.get("KRAKEN_RETRY_BACKOFF", "0.2"))
+POOL_MAXSIZE: int = int(os.environ.get("KRAKEN_POOL_MAXSIZE", "10"))
+# Requests a DCA run sends at once to fetch Balance, Ticker, Time and
+# AssetPairs, so it holds up to this many pooled connections.
+FETCH_WORKERS: int = 4
+RATE_LIMIT_RETRIES: int = int(os.environ.get("KRAKEN_RATE_LIMIT_RETRIES", "1"))
+
+RETRY_STATUS_CODES: tuple = (500, 502, 503, 504)
+AUTH_ERRORS: tuple = (
+    "EAPI:Invalid key",
+    "EAPI:Invalid signature",
+    "EGeneral:Permission denied",
+)
+
+# Lives at module scope so warm Lambda invocations reuse the open TLS connection.
+_session = None
+
+
+def create_session(
+    max_retries: int = MAX_RETRIES,
+    backoff_factor: float = RETRY_BACKOFF_FACTOR,
+    pool_maxsize: int = POOL_MAXSIZE,
+) -> requests.Session:
+    # Only GETs are retried after a response or read error. Connection errors are
+    # retried for every method because the request never reached Kraken.
+    retry: Retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+    adapter: HTTPAdapter = HTTPAdapter(
+        pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry
+    )
+    session: requests.Session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"User-Agent": "Kraken-DCA"})
+    return session
+
+
+def get_session() -> requests.Session:
+    global _session
+    if _session is None:
+        _session = create_session()
+    return _session
+
+
+def close_session() -> None:
+    global _session
+    if _session is not None:
+        _session.close()
+        _session = None
+
+
+def public_get(path: str) -> requests.Response:
+    return send_request("GET", path)
+
+
+class RateLimitWaitTooLong(RequestException):
+    # Raised before sending, so the call is safe to retry later.
+    pass
+
+
+# Private calls of one key are signed and sent one at a time, so nonces reach
+# Kraken in the order they were handed out.
+_key_locks: dict[str, threading.Lock] = {}
+_key_locks_lock = threading.Lock()
+
+
+def key_lock(api_key: str) -> threading.Lock:
+    with _key_locks_lock:
+        return _key_locks.setdefault(api_key, threading.Lock())
+
+
+def acquire_rate_limit(
+    limiter: rate_limiter.KeyRateLimiter, path: str, pair: str = None
+) -> None:
+    with metrics.phase("rate_limit_wait"):
+        try:
+            limiter.acquire(path, pair=pair)
+        except rate_limiter.WaitTooLong as e:
+            raise RateLimitWaitTooLong(str(e))
+
+
+def signed_post(
+    path: str, data: dict, public_key: str, private_key: str
+) -> requests.Response:
+    signer = get_signer(private_key)
+    limiter: rate_limiter.KeyRateLimiter = rate_limiter.get_limiter(public_key)
+    for _ in range(RATE_LIMIT_RETRIES + 1):
+        # The limiter may sleep, so it is waited for before a nonce is taken.
+        acquire_rate_limit(limiter, path, data.get("pair"))
+        with key_lock(public_key):
+            # A resend needs a fresh nonce, so the body is signed on every
+            # attempt.
+            payload: dict = {"nonce": get_nonce_generator(public_key).next(), **data}
+            with metrics.phase("sign"):
+                body, api_sign = signer.sign_request(path, payload)
+            response: requests.Response = send_request(
+                "POST",
+                path,
+                data=body,
+                headers={
+                    "API-Key": public_key,
+                    "API-Sign": api_sign,
+                    "Content-Type": "application/x-www-form-urlencoded",
+                },
+            )
+        if not is_rate_limited(response):
+            break
+        limiter.record_rate_limited(path, pair=data.get("pair"))
+    return response
+
+
+def is_rate_limited(response: requests.Response) -> bool:
+    return b"Rate limit exceeded" in response.content
+
+
+def send_request(method: str, path: str, **kwargs) -> requests.Response:
+    start: float = time.perf_counter()
+    try:
+        response: requests.Response = get_session().request(
+            method,
+            url=f"{KRAKEN_API_URL}{path}",
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+            **kwargs,
+        )
+    except RequestException as e:
+        metrics.record_request(
+            metrics.RequestRecord(
+                path=path,
+                duration_ms=(time.perf_counter() - start) * 1000,
+                errors=[type(e).__name__],
+            )
+        )
+        raise
+    if metrics.current() is not None:
+        metrics.record_request(request_record(path, response, start))
+    return response
+
+
+def request_record(path: str, response, start: float) -> metrics.RequestRecord:
+    retries = getattr(getattr(response.raw, "retries", None), "history", None) or ()
+    errors: list = []
+    if response.headers.get("Content-Type", "").startswith("application/json"):
+        try:
+            errors = response.json().get("error", [])
+        except ValueError:
+            errors = []
+    return metrics.RequestRecord(
+        path=path,
+        duration_ms=(time.perf_counter() - start) * 1000,
+        status_code=response.status_code,
+        retries=len(retries),
+        request_bytes=len(response.request.body or b""),
+        response_bytes=len(response.content),
+        errors=errors,
+    )
+
+
+def is_auth_error(errors: list) -> bool:
+    return any(str(error).startswith(AUTH_ERRORS) for error in errors)
@@ -0,0 +1,379 @@
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+@dataclass
+class StubConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    # Share of requests answered with error_status (or a Kraken error when 200).
+    error_rate: float = 0.0
+    error_status: int = 503
+    # Private calls per second allowed before EAPI:Rate limit exceeded, 0 = off.
+    rate_limit_per_second: float = 0.0
+    rate_limit_burst: int = 15
+    balances: dict = field(default_factory=lambda: {"ZAUD": "1000.0"})
+    bids: dict = field(default_factory=lambda: {"XBTAUD": "50000.12345678"})
+    asset_pairs: dict = field(
+        default_factory=lambda: {
+            "XBTAUD": {
+                "altname": "XBTAUD",
+                "wsname": "XBT/AUD",
+                "base": "XXBT",
+                "pair_decimals": 1,
+                "lot_decimals": 8,
+                "ordermin": "0.0001",
+                "costmin": "0.5",
+            },
+            "ETHAUD": {
+                "altname": "ETHAUD",
+                "wsname": "ETH/AUD",
+                "base": "XETH",
+                "pair_decimals": 2,
+                "lot_decimals": 8,
+                "ordermin": "0.002",
+                "costmin": "0.5",
+            },
+        }
+    )
+    # Orders fill as soon as they are placed, or stay open when False.
+    fill_orders: bool = True
+    # AddOrder calls that place the order but answer with a 502, like a
+    # gateway timing out after Kraken accepted it.
+    ambiguous_add_orders: int = 0
+    withdraw_fees: dict = field(default_factory=lambda: {"XXBT": "0.0002"})
+    seed: int = None
+
+
+def kraken_result(result) -> dict:
+    return {"error": [], "result": result}
+
+
+def kraken_error(*errors: str) -> dict:
+    return {"error": list(errors)}
+
+
+class KrakenStubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open, like api.kraken.com does.
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, Nagle would delay the body.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        self.server.stub.handle(self, "GET", url.path, parse_qs(url.query))
+
+    def do_POST(self):
+        length: int = int(self.headers.get("Content-Length", 0))
+        body: str = self.rfile.read(length).decode()
+        self.server.stub.handle(self, "POST", urlsplit(self.path).path, parse_qs(body))
+
+    def send_json(self, status: int, payload: dict) -> None:
+        body: bytes = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class KrakenStubServer:
+    def __init__(self, config: StubConfig = None, host: str = "127.0.0.1", port=0):
+        self.config: StubConfig = config or StubConfig()
+        self.request_count: int = 0
+        self.requests_by_path: dict[str, int] = {}
+        self.orders: list[dict] = []
+        self.withdrawals: list[dict] = []
+        self._random = random.Random(self.config.seed)
+        self._lock = threading.Lock()
+        self._rate_tokens: float = float(self.config.rate_limit_burst)
+        self._rate_updated: float = time.monotonic()
+        self._last_nonces: dict[str, int] = {}
+        self.routes: dict = {
+            ("GET", "/0/public/Time"): self.time,
+            ("GET", "/0/public/Ticker"): self.ticker,
+            ("GET", "/0/public/AssetPairs"): self.asset_pairs,
+            ("POST", "/0/private/Balance"): self.balance,
+            ("POST", "/0/private/AddOrder"): self.add_order,
+            ("POST", "/0/private/QueryOrders"): self.query_orders,
+            ("POST", "/0/private/OpenOrders"): self.open_orders,
+            ("POST", "/0/private/ClosedOrders"): self.closed_orders,
+            ("POST", "/0/private/EditOrder"): self.edit_order,
+            ("POST", "/0/private/CancelOrder"): self.cancel_order,
+            ("POST", "/0/private/WithdrawInfo"): self.withdraw_info,
+            ("POST", "/0/private/Withdraw"): self.withdraw,
+        }
+        self._httpd = ThreadingHTTPServer((host, port), KrakenStubHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.stub = self
+        self._thread: threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "KrakenStubServer":
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever,
+            kwargs={"poll_interval": 0.05},
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "KrakenStubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.request_count = 0
+            self.requests_by_path = {}
+
+    def handle(self, request, method: str, path: str, params: dict) -> None:
+        with self._lock:
+            self.request_count += 1
+            self.requests_by_path[path] = self.requests_by_path.get(path, 0) + 1
+            delay_ms: float = self.config.latency_ms + self._random.uniform(
+                -self.config.jitter_ms, self.config.jitter_ms
+            )
+            inject_error: bool = self._random.random() < self.config.error_rate
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+        route = self.routes.get((method, path))
+        if route is None:
+            request.send_json(404, kraken_error("EGeneral:Unknown method"))
+            return
+        if inject_error:
+            if self.config.error_status == 200:
+                request.send_json(200, kraken_error("EService:Unavailable"))
+            else:
+                request.send_json(self.config.error_status, {"error": []})
+            return
+        if path.startswith("/0/private/"):
+            if not request.headers.get("API-Key") or not request.headers.get(
+                "API-Sign"
+            ):
+                request.send_json(200, kraken_error("EAPI:Invalid key"))
+                return
+            if not self._take_rate_limit_token():
+                request.send_json(200, kraken_error("EAPI:Rate limit exceeded"))
+                return
+        params = {key: values[0] for key, values in params.items()}
+        if path.startswith("/0/private/") and not self._accept_nonce(
+            request.headers["API-Key"], params.get("nonce", "0")
+        ):
+            request.send_json(200, kraken_error("EAPI:Invalid nonce"))
+            return
+        if route == self.add_order and self._take_ambiguous_add_order():
+            route(params)
+            request.send_json(502, {"error": []})
+            return
+        request.send_json(200, route(params))
+
+    def _take_ambiguous_add_order(self) -> bool:
+        with self._lock:
+            if self.config.ambiguous_add_orders <= 0:
+                return False
+            self.config.ambiguous_add_orders -= 1
+            return True
+
+    def _accept_nonce(self, api_key: str, nonce: str) -> bool:
+        # Kraken rejects any nonce that is not larger than the key's last one.
+        with self._lock:
+            if int(nonce) <= self._last_nonces.get(api_key, 0):
+                return False
+            self._last_nonces[api_key] = int(nonce)
+            return True
+
+    def _take_rate_limit_token(self) -> bool:
+        if self.config.rate_limit_per_second <= 0:
+            return True
+        with self._lock:
+            now: float = time.monotonic()
+            self._rate_tokens = min(
+                float(self.config.rate_limit_burst),
+                self._rate_tokens
+                + (now - self._rate_updated) * self.config.rate_limit_per_second,
+            )
+            self._rate_updated = now
+            if self._rate_tokens < 1:
+                return False
+            self._rate_tokens -= 1
+            return True
+
+    def time(self, params: dict) -> dict:
+        now: float = time.time()
+        return kraken_result(
+            {
+                "unixtime": int(now),
+                "rfc1123": time.strftime(
+                    "%a, %d %b %y %H:%M:%S +0000", time.gmtime(now)
+                ),
+            }
+        )
+
+    def ticker(self, params: dict) -> dict:
+        result: dict = {}
+        for pair in params.get("pair", "").split(","):
+            if pair not in self.config.bids:
+                return kraken_error("EQuery:Unknown asset pair")
+            bid: str = self.config.bids[pair]
+            result[pair] = {"a": [bid, "1", "1.000"], "b": [bid, "1", "1.000"]}
+        return kraken_result(result)
+
+    def asset_pairs(self, params: dict) -> dict:
+        result: dict = {}
+        for pair in params.get("pair", "").split(","):
+            if pair not in self.config.asset_pairs:
+                return kraken_error("EQuery:Unknown asset pair")
+            result[pair] = self.config.asset_pairs[pair]
+        return kraken_result(result)
+
+    def balance(self, params: dict) -> dict:
+        return kraken_result(dict(self.config.balances))
+
+    def _takes_liquidity(self, params: dict) -> bool:
+        bid: str = self.config.bids.get(params.get("pair"), "0")
+        return "post" in params.get("oflags", "") and float(params["price"]) > float(
+            bid
+        )
+
+    def _new_order(self, params: dict) -> str:
+        with self._lock:
+            txid: str = f"OSTUB{len(self.orders):010d}"
+            status: str = "closed" if self.config.fill_orders else "open"
+            self.orders.append(dict(params, txid=txid, status=status))
+        return txid
+
+    def _find_order(self, txid: str) -> dict:
+        return next((order for order in self.orders if order["txid"] == txid), None)
+
+    def add_order(self, params: dict) -> dict:
+        if self._takes_liquidity(params):
+            return kraken_error("EOrder:Post only order")
+        txid: str = self._new_order(params)
+        description: str = (
+            f"{params.get('type')} {params.get('volume')} {params.get('pair')} "
+            f"@ {params.get('ordertype')} {params.get('price')}"
+        )
+        return kraken_result({"descr": {"order": description}, "txid": [txid]})
+
+    def query_orders(self, params: dict) -> dict:
+        # Every stub order has filled completely one second after it was placed.
+        orders: dict = {order["txid"]: order for order in self.orders}
+        result: dict = {}
+        for txid in params.get("txid", "").split(","):
+            if txid not in orders:
+                return kraken_error("EOrder:Invalid order")
+            order: dict = orders[txid]
+            opened: float = float(order["nonce"]) / 1e6
+            filled: bool = order["status"] == "closed"
+            result[txid] = {
+                "status": order["status"],
+                "opentm": opened,
+                "closetm": opened + 1 if order["status"] != "open" else 0,
+                "vol": order.get("volume"),
+                "vol_exec": order.get("volume") if filled else "0",
+                "price": order.get("price") if filled else "0",
+            }
+        return kraken_result(result)
+
+    def _orders_by_userref(self, params: dict, open_orders: bool) -> dict:
+        return {
+            order["txid"]: {
+                "status": order["status"],
+                "userref": int(order["userref"]),
+                "descr": {"pair": order.get("pair"), "price": order.get("price")},
+                "vol": order.get("volume"),
+                "opentm": float(order["nonce"]) / 1e6,
+            }
+            for order in self.orders
+            if (order["status"] == "open") == open_orders
+            and "userref" in order
+            and ("userref" not in params or order["userref"] == params["userref"])
+            # start is exclusive, as on Kraken.
+            and float(order["nonce"]) / 1e6 > float(params.get("start", 0))
+        }
+
+    def open_orders(self, params: dict) -> dict:
+        return kraken_result({"open": self._orders_by_userref(params, True)})
+
+    def closed_orders(self, params: dict) -> dict:
+        closed: dict = self._orders_by_userref(params, False)
+        return kraken_result({"closed": closed, "count": len(closed)})
+
+    def edit_order(self, params: dict) -> dict:
+        original: dict = self._find_order(params.get("txid"))
+        if original is None or original["status"] != "open":
+            return kraken_error("EOrder:Invalid order")
+        # Only post-only can be changed, the other flags are kept.
+        if params.get("oflags", "post") not in ("", "post"):
+            return kraken_error("EGeneral:Invalid arguments:oflags")
+        if self._takes_liquidity(params):
+            return kraken_error("EOrder:Post only order")
+        original["status"] = "canceled"
+        flags: list[str] = [
+            flag for flag in original.get("oflags", "").split(",") if flag != "post"
+        ]
+        if params.get("oflags"):
+            flags.append("post")
+        txid: str = self._new_order(
+            {key: value for key, value in original.items() if key != "txid"}
+            | {key: params[key] for key in ("price", "volume") if key in params}
+            | {"oflags": ",".join(flag for flag in flags if flag)}
+        )
+        return kraken_result(
+            {
+                "status": "ok",
+                "txid": txid,
+                "originaltxid": original["txid"],
+                "price": params.get("price"),
+                "volume": params.get("volume"),
+                "orders_cancelled": 1,
+            }
+        )
+
+    def cancel_order(self, params: dict) -> dict:
+        order: dict = self._find_order(params.get("txid"))
+        if order is None or order["status"] != "open":
+            return kraken_error("EOrder:Unknown order")
+        order["status"] = "canceled"
+        return kraken_result({"count": 1})
+
+    def withdraw_info(self, params: dict) -> dict:
+        asset: str = params.get("asset")
+        if asset not in self.config.withdraw_fees:
+            return kraken_error("EFunding:Unknown asset")
+        fee: str = self.config.withdraw_fees[asset]
+        amount: float = float(params.get("amount", "0"))
+        return kraken_result(
+            {
+                "method": asset,
+                "limit": self.config.balances.get(asset, "0"),
+                "amount": str(amount - float(fee)),
+                "fee": fee,
+            }
+        )
+
+    def withdraw(self, params: dict) -> dict:
+        with self._lock:
+            refid: str = f"WSTUB{len(self.withdrawals):010d}"
+            self.withdrawals.append(dict(params, refid=refid))
+        return kraken_result({"refid": refid})
@@ -0,0 +1,106 @@
+import json
+import threading
+from websockets.sync.server import serve
+from order_book import OrderBook
+
+
+class KrakenWsStubServer:
+    # Speaks enough of Kraken's v1 WebSocket API for the book channel: answers
+    # subscriptions with a snapshot and forwards published updates with the
+    # matching checksum.
+    def __init__(self, books: dict[str, dict], host: str = "127.0.0.1", port=0):
+        # books maps WebSocket pair names to {"as": [...], "bs": [...]}.
+        self.snapshots: dict[str, dict] = books
+        self.subscriptions: int = 0
+        self._books: dict[str, OrderBook] = {}
+        self._connections: list = []
+        self._channel_ids: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = serve(self._handle, host, port)
+        self._thread: threading.Thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.socket.getsockname()[:2]
+        return f"ws://{host}:{port}"
+
+    def start(self) -> "KrakenWsStubServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._thread.join(timeout=2)
+
+    def __enter__(self) -> "KrakenWsStubServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _handle(self, connection) -> None:
+        connection.send(json.dumps({"event": "systemStatus", "status": "online"}))
+        try:
+            for message in connection:
+                request: dict = json.loads(message)
+                if request.get("event") == "subscribe":
+                    self._subscribe(connection, request)
+        finally:
+            with self._lock:
+                if connection in self._connections:
+                    self._connections.remove(connection)
+
+    def _subscribe(self, connection, request: dict) -> None:
+        depth: int = request["subscription"].get("depth", 10)
+        with self._lock:
+            self.subscriptions += 1
+            self._connections.append(connection)
+        for pair in request["pair"]:
+            snapshot: dict = self.snapshots[pair]
+            with self._lock:
+                channel_id: int = self._channel_ids.setdefault(
+                    pair, len(self._channel_ids) + 1
+                )
+                book: OrderBook = OrderBook(depth)
+                book.apply_snapshot(snapshot["as"], snapshot["bs"])
+                self._books[pair] = book
+            connection.send(
+                json.dumps(
+                    {
+                        "channelID": channel_id,
+                        "channelName": f"book-{depth}",
+                        "event": "subscriptionStatus",
+                        "pair": pair,
+                        "status": "subscribed",
+                        "subscription": {"depth": depth, "name": "book"},
+                    }
+                )
+            )
+            connection.send(json.dumps([channel_id, snapshot, f"book-{depth}", pair]))
+
+    def publish(
+        self, pair: str, asks: list = (), bids: list = (), checksum: str = None
+    ) -> None:
+        # The checksum is computed from the stub's own copy of the book unless
+        # a (wrong) one is given.
+        with self._lock:
+            book: OrderBook = self._books[pair]
+            book.apply_update(list(asks), list(bids))
+            payload: dict = {"c": checksum or str(book.checksum())}
+            if asks:
+                payload["a"] = list(asks)
+            if bids:
+                payload["b"] = list(bids)
+            message: str = json.dumps(
+                [self._channel_ids[pair], payload, f"book-{book.depth}", pair]
+            )
+            connections: list = list(self._connections)
+        for connection in connections:
+            connection.send(message)
+
+    def send_heartbeat(self) -> None:
+        with self._lock:
+            connections: list = list(self._connections)
+        for connection in connections:
+            connection.send(json.dumps({"event": "heartbeat"}))
@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+# Optional DynamoDB table shared by every invocation, e.g. DynamoDB Local via
+# LEASE_TABLE_ENDPOINT. Without it leases only cover one warm sandbox or
+# service process.
+LEASE_TABLE: str = os.environ.get("LEASE_TABLE", "")
+LEASE_TABLE_ENDPOINT: str = os.environ.get("LEASE_TABLE_ENDPOINT", "")
+# Longer than a run, so a crashed run's lease lapses before the next tick.
+LEASE_TTL_SECONDS: float = float(os.environ.get("LEASE_TTL_SECONDS", "120"))
+
+
+class LeaseHeld(Exception):
+    pass
+
+
+class LeaseLost(Exception):
+    pass
+
+
+@dataclass
+class Lease:
+    key: str
+    owner: str
+    # Fencing token, larger for every new holder of the key.
+    token: int
+    expires_at: float
+    # The owner already held the lease, e.g. a Lambda retry after a timeout
+    # with the same request id. Its first attempt may have spent already.
+    reacquired: bool = False
+
+
+class InMemoryLeaseStore:
+    def __init__(self):
+        self._leases: dict[str, Lease] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, owner: str, ttl_seconds: float, now: float) -> Lease:
+        # A lease that is free, expired or already ours, or None.
+        with self._lock:
+            current: Lease = self._leases.get(key)
+            held: bool = current is not None and current.expires_at > now
+            if held and current.owner != owner:
+                return None
+            token: int = (current.token if current is not None else 0) + 1
+            self._leases[key] = Lease(key, owner, token, now + ttl_seconds)
+            return Lease(key, owner, token, now + ttl_seconds, reacquired=held)
+
+    def release(self, lease: Lease, expires_at: float) -> bool:
+        # Ends the lease at expires_at, the token is kept so it never repeats.
+        with self._lock:
+            current: Lease = self._leases.get(lease.key)
+            if current is None or current.token != lease.token:
+                return False
+            current.expires_at = expires_at
+            return True
+
+    def is_current(self, lease: Lease, now: float) -> bool:
+        with self._lock:
+            current: Lease = self._leases.get(lease.key)
+            return (
+                current is not None
+                and current.token == lease.token
+                and current.expires_at > now
+            )
+
+
+class DynamoDBLeaseStore:
+    # One item per key, written with conditional updates only. The token is
+    # incremented on every acquisition and never deleted.
+    def __init__(self, table_name: str, client=None, endpoint_url: str = None):
+        self.table_name: str = table_name
+        self._client = client
+        self._endpoint_url: str = endpoint_url or None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("dynamodb", endpoint_url=self._endpoint_url)
+        return self._client
+
+    def acquire(self, key: str, owner: str, ttl_seconds: float, now: float) -> Lease:
+        try:
+            response: dict = self.client.update_item(
+                TableName=self.table_name,
+                Key={"lease_key": {"S": key}},
+                UpdateExpression="SET #owner = :owner, expires_at = :expires "
+                "ADD fencing_token :one",
+                ConditionExpression="attribute_not_exists(expires_at) "
+                "OR expires_at <= :now OR #owner = :owner",
+                ExpressionAttributeNames={"#owner": "owner"},
+                ExpressionAttributeValues={
+                    ":owner": {"S": owner},
+                    ":expires": {"N": str(now + ttl_seconds)},
+                    ":now": {"N": str(now)},
+                    ":one": {"N": "1"},
+                },
+                # The old values tell whether the lease was ours already.
+                ReturnValues="UPDATED_OLD",
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return None
+        previous: dict = response.get("Attributes", {})
+        return Lease(
+            key,
+            owner,
+            int(previous.get("fencing_token", {}).get("N", "0")) + 1,
+            now + ttl_seconds,
+            reacquired=previous.get("owner", {}).get("S") == owner
+            and float(previous["expires_at"]["N"]) > now,
+        )
+
+    def release(self, lease: Lease, expires_at: float) -> bool:
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key={"lease_key": {"S": lease.key}},
+                UpdateExpression="SET expires_at = :expires",
+                ConditionExpression="fencing_token = :token",
+                ExpressionAttributeValues={
+                    ":expires": {"N": str(expires_at)},
+                    ":token": {"N": str(lease.token)},
+                },
+            )
+        except self.client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def is_current(self, lease: Lease, now: float) -> bool:
+        response: dict = self.client.get_item(
+            TableName=self.table_name,
+            Key={"lease_key": {"S": lease.key}},
+            ConsistentRead=True,
+        )
+        item: dict = response.get("Item")
+        return (
+            item is not None
+            and int(item["fencing_token"]["N"]) == lease.token
+            and float(item["expires_at"]["N"]) > now
+        )
+
+
+def default_store():
+    if LEASE_TABLE:
+        return DynamoDBLeaseStore(LEASE_TABLE, endpoint_url=LEASE_TABLE_ENDPOINT)
+    return InMemoryLeaseStore()
+
+
+# Module scope so a warm sandbox or service process shares its leases.
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = default_store()
+        return _store
+
+
+def reset_store(store=None) -> None:
+    global _store
+    with _store_lock:
+        _store = store
+
+
+def run_owner(context) -> str:
+    # A Lambda retry of the same event keeps its request id, so it can take
+    # over the lease its failed attempt left behind.
+    return getattr(context, "aws_request_id", None) or uuid.uuid4().hex
+
+
+@contextmanager
+def hold(
+    key: str,
+    owner: str,
+    ttl_seconds: float = None,
+    cooldown_seconds: float = 0,
+    clock=None,
+):
+    # Raises LeaseHeld while another run holds key. On a clean exit the lease
+    # is kept for cooldown_seconds, so a duplicate delivery of the same event
+    # right after the run is turned away too. After an error it is released
+    # at once.
+    now = clock or time.time
+    store = get_store()
+    lease: Lease = store.acquire(
+        key, owner, LEASE_TTL_SECONDS if ttl_seconds is None else ttl_seconds, now()
+    )
+    if lease is None:
+        raise LeaseHeld(f"Another run holds the lease on {key}")
+    try:
+        yield lease
+    except BaseException:
+        store.release(lease, now())
+        raise
+    store.release(lease, now() + cooldown_seconds)
+
+
+def ensure_current(lease: Lease, clock=None) -> None:
+    # Checked right before spending, a run whose lease expired or was taken
+    # over stops instead of racing the new holder.
+    if not get_store().is_current(lease, (clock or time.time)()):
+        raise LeaseLost(f"Lease on {lease.key} with token {lease.token} was lost")
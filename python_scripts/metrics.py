@@ -0,0 +1,135 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+
+METRICS_NAMESPACE: str = os.environ.get("METRICS_NAMESPACE", "KrakenDCA")
+METRICS_ENABLED: bool = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+
+
+@dataclass
+class RequestRecord:
+    path: str
+    duration_ms: float
+    status_code: int = None
+    retries: int = 0
+    request_bytes: int = 0
+    response_bytes: int = 0
+    errors: list = field(default_factory=list)
+
+
+class InvocationMetrics:
+    def __init__(self, function: str, namespace: str = METRICS_NAMESPACE):
+        self.function: str = function
+        self.namespace: str = namespace
+        self.started: float = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.requests: list[RequestRecord] = []
+        self.properties: dict = {}
+        # HTTP calls are recorded from the fetch stage's worker threads too.
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str):
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration_ms: float = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self.phases[name] = self.phases.get(name, 0.0) + duration_ms
+
+    def record_request(self, record: RequestRecord) -> None:
+        with self._lock:
+            self.requests.append(record)
+
+    def to_emf(self) -> dict:
+        duration_ms: float = (time.perf_counter() - self.started) * 1000
+        values: dict[str, float] = {
+            "Duration": duration_ms,
+            "HttpRequests": len(self.requests),
+            "HttpRetries": sum(record.retries for record in self.requests),
+            "HttpRequestBytes": sum(record.request_bytes for record in self.requests),
+            "HttpResponseBytes": sum(record.response_bytes for record in self.requests),
+            "KrakenErrors": sum(len(record.errors) for record in self.requests),
+        }
+        units: dict[str, str] = {
+            "Duration": "Milliseconds",
+            "HttpRequests": "Count",
+            "HttpRetries": "Count",
+            "HttpRequestBytes": "Bytes",
+            "HttpResponseBytes": "Bytes",
+            "KrakenErrors": "Count",
+        }
+        for name, phase_ms in self.phases.items():
+            metric_name: str = f"{name.title().replace('_', '')}Duration"
+            values[metric_name] = phase_ms
+            units[metric_name] = "Milliseconds"
+
+        return {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Function"]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit} for name, unit in units.items()
+                        ],
+                    }
+                ],
+            },
+            "Function": self.function,
+            **values,
+            "krakenErrorCodes": sorted(
+                {error for record in self.requests for error in record.errors}
+            ),
+            "requests": [asdict(record) for record in self.requests],
+            **self.properties,
+        }
+
+    def emit(self, **properties) -> None:
+        self.properties.update(properties)
+        # Lambda forwards stdout to CloudWatch Logs, which extracts EMF records.
+        print(json.dumps(self.to_emf()))
+
+
+_current: InvocationMetrics = None
+
+
+def start_invocation(function: str) -> InvocationMetrics:
+    global _current
+    _current = InvocationMetrics(function)
+    return _current
+
+
+def finish_invocation(**properties) -> None:
+    global _current
+    if _current is not None and METRICS_ENABLED:
+        _current.emit(**properties)
+    _current = None
+
+
+def current() -> InvocationMetrics:
+    return _current
+
+
+def set_properties(**properties) -> None:
+    if _current is not None:
+        _current.properties.update(properties)
+
+
+@contextmanager
+def phase(name: str):
+    if _current is None:
+        yield
+        return
+    with _current.phase(name):
+        yield
+
+
+def record_request(record: RequestRecord) -> None:
+    if _current is not None:
+        _current.record_request(record)
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import threading
+import time
+
+# Optional DynamoDB table shared by concurrent invocations that use one key.
+NONCE_TABLE: str = os.environ.get("NONCE_TABLE", "")
+NONCE_TABLE_ENDPOINT: str = os.environ.get("NONCE_TABLE_ENDPOINT", "")
+
+
+class InMemoryNonceStore:
+    def __init__(self):
+        self._last: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str, candidate: int) -> int:
+        with self._lock:
+            nonce: int = max(candidate, self._last.get(key, 0) + 1)
+            self._last[key] = nonce
+            return nonce
+
+
+class DynamoDBNonceStore:
+    def __init__(self, table_name: str, client=None, endpoint_url: str = None):
+        self.table_name: str = table_name
+        self._client = client
+        self._endpoint_url: str = endpoint_url or None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("dynamodb", endpoint_url=self._endpoint_url)
+        return self._client
+
+    def reserve(self, key: str, candidate: int) -> int:
+        # Items are keyed by a hash so the table never holds the API key itself.
+        item_key: dict = {"key_hash": {"S": hashlib.sha256(key.encode()).hexdigest()}}
+        try:
+            self.client.update_item(
+                TableName=self.table_name,
+                Key=item_key,
+                UpdateExpression="SET nonce = :candidate",
+                ConditionExpression="attribute_not_exists(nonce) OR nonce < :candidate",
+                ExpressionAttributeValues={":candidate": {"N": str(candidate)}},
+            )
+            return candidate
+        except self.client.exceptions.ConditionalCheckFailedException:
+            # Another invocation is ahead of our clock, so take the next value.
+            response: dict = self.client.update_item(
+                TableName=self.table_name,
+                Key=item_key,
+                UpdateExpression="ADD nonce :one",
+                ExpressionAttributeValues={":one": {"N": "1"}},
+                ReturnValues="UPDATED_NEW",
+            )
+            return int(response["Attributes"]["nonce"]["N"])
+
+
+class NonceGenerator:
+    def __init__(self, key: str = "", store=None, clock=None):
+        self.key: str = key
+        self.store = store
+        self._clock = clock
+        self._last: int = 0
+        self._lock = threading.Lock()
+
+    def now_microseconds(self) -> int:
+        return round((self._clock or time.time)() * 1_000_000)
+
+    def next(self) -> str:
+        with self._lock:
+            nonce: int = max(self.now_microseconds(), self._last + 1)
+            if self.store is not None:
+                nonce = self.store.reserve(self.key, nonce)
+            self._last = nonce
+            return str(nonce)
+
+
+def default_store():
+    if NONCE_TABLE:
+        return DynamoDBNonceStore(NONCE_TABLE, endpoint_url=NONCE_TABLE_ENDPOINT)
+    return None
+
+
+# Module scope so nonces keep increasing across warm invocations.
+_generators: dict[str, NonceGenerator] = {}
+_generators_lock = threading.Lock()
+
+
+def get_nonce_generator(api_key: str) -> NonceGenerator:
+    with _generators_lock:
+        if api_key not in _generators:
+            _generators[api_key] = NonceGenerator(api_key, store=default_store())
+        return _generators[api_key]
+
+
+def reset_generators() -> None:
+    with _generators_lock:
+        _generators.clear()
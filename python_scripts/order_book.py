@@ -0,0 +1,252 @@
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+import pair_metadata
+
+logger = logging.getLogger()
+
+KRAKEN_WS_URL: str = os.environ.get("KRAKEN_WS_URL", "wss://ws.kraken.com")
+BOOK_DEPTH: int = int(os.environ.get("BOOK_DEPTH", "10"))
+# A book that has not been updated for this long is not used for pricing.
+BOOK_MAX_AGE_SECONDS: float = float(os.environ.get("BOOK_MAX_AGE_SECONDS", "5"))
+RECONNECT_DELAY_SECONDS: float = 1.0
+# Kraken's checksum always covers the top ten levels on each side.
+CHECKSUM_LEVELS: int = 10
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def level_checksum_text(price: str, volume: str) -> str:
+    return price.replace(".", "").lstrip("0") + volume.replace(".", "").lstrip("0")
+
+
+class OrderBook:
+    # Prices and volumes are kept as Kraken's strings, the checksum is computed
+    # over their exact text.
+    def __init__(self, depth: int = BOOK_DEPTH, clock=None):
+        self.depth: int = depth
+        self.bids: dict[str, str] = {}
+        self.asks: dict[str, str] = {}
+        self.updated: float = None
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return (self._clock or time.monotonic)()
+
+    def apply_snapshot(self, asks: list[list], bids: list[list]) -> None:
+        with self._lock:
+            self.asks = {level[0]: level[1] for level in asks}
+            self.bids = {level[0]: level[1] for level in bids}
+            self.updated = self._now()
+
+    def apply_update(
+        self, asks: list[list], bids: list[list], checksum: str = None
+    ) -> None:
+        with self._lock:
+            for side, levels in ((self.asks, asks), (self.bids, bids)):
+                for level in levels:
+                    # Republished levels ("r") replace the volume like updates.
+                    price, volume = level[0], level[1]
+                    if float(volume) == 0:
+                        side.pop(price, None)
+                    else:
+                        side[price] = volume
+            # Levels pushed out of the subscribed depth are not deleted by
+            # Kraken, so the book is truncated after every update.
+            self.asks = dict(self._sorted_asks()[: self.depth])
+            self.bids = dict(self._sorted_bids()[: self.depth])
+            if checksum is not None and int(checksum) != self._checksum():
+                self.updated = None
+                raise ChecksumMismatch(f"Book checksum {checksum} does not match")
+            self.updated = self._now()
+
+    def _sorted_asks(self) -> list[tuple[str, str]]:
+        return sorted(self.asks.items(), key=lambda level: float(level[0]))
+
+    def _sorted_bids(self) -> list[tuple[str, str]]:
+        return sorted(self.bids.items(), key=lambda level: -float(level[0]))
+
+    def _checksum(self) -> int:
+        levels: list[tuple[str, str]] = (
+            self._sorted_asks()[:CHECKSUM_LEVELS]
+            + self._sorted_bids()[:CHECKSUM_LEVELS]
+        )
+        text: str = "".join(level_checksum_text(*level) for level in levels)
+        return zlib.crc32(text.encode())
+
+    def checksum(self) -> int:
+        with self._lock:
+            return self._checksum()
+
+    def best_bid(self) -> str:
+        with self._lock:
+            return self._sorted_bids()[0][0] if self.bids else None
+
+    def best_ask(self) -> str:
+        with self._lock:
+            return self._sorted_asks()[0][0] if self.asks else None
+
+    def is_fresh(self, max_age_seconds: float = BOOK_MAX_AGE_SECONDS) -> bool:
+        updated: float = self.updated
+        return updated is not None and self._now() - updated <= max_age_seconds
+
+
+class BookStream:
+    # Keeps one book per pair up to date from Kraken's WebSocket book channel
+    # on a background thread. ws_names maps REST pairs to WebSocket pair names,
+    # e.g. {"XBTAUD": "XBT/AUD"}.
+    def __init__(
+        self,
+        ws_names: dict[str, str],
+        url: str = KRAKEN_WS_URL,
+        depth: int = BOOK_DEPTH,
+        clock=None,
+    ):
+        self.ws_names: dict[str, str] = dict(ws_names)
+        self.url: str = url
+        self.depth: int = depth
+        self.books: dict[str, OrderBook] = {
+            pair: OrderBook(depth, clock=clock) for pair in ws_names
+        }
+        self._pairs_by_ws_name: dict[str, str] = {
+            ws_name: pair for pair, ws_name in ws_names.items()
+        }
+        self._stopped = threading.Event()
+        self._connection = None
+        self._thread: threading.Thread = None
+
+    def start(self) -> "BookStream":
+        # Imported here so that REST-only runs do not need websockets.
+        from websockets.sync.client import connect
+
+        self._connect = connect
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._connection is not None:
+            self._connection.close()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+
+    def wait_until_ready(self, timeout_seconds: float) -> bool:
+        deadline: float = time.monotonic() + timeout_seconds
+        while time.monotonic() < deadline:
+            if all(book.is_fresh() for book in self.books.values()):
+                return True
+            time.sleep(0.01)
+        return False
+
+    def best_bids(
+        self, pairs: list[str], max_age_seconds: float = BOOK_MAX_AGE_SECONDS
+    ) -> dict[str, str]:
+        # None when any of the books is missing or stale, callers fall back to
+        # REST then.
+        bids: dict[str, str] = {}
+        for pair in pairs:
+            book: OrderBook = self.books.get(pair)
+            if book is None or not book.is_fresh(max_age_seconds):
+                return None
+            bid: str = book.best_bid()
+            if bid is None:
+                return None
+            bids[pair] = bid
+        return bids
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                with self._connect(self.url, open_timeout=5) as connection:
+                    self._connection = connection
+                    self._subscribe(connection)
+                    for message in connection:
+                        self.handle_message(json.loads(message))
+            except ChecksumMismatch as e:
+                # A fresh subscription starts again from a snapshot.
+                logger.warning(f"Resubscribing to the book: {str(e)}")
+            except Exception as e:
+                if self._stopped.is_set():
+                    return
+                logger.warning(f"Book stream disconnected: {str(e)}")
+                self._stopped.wait(RECONNECT_DELAY_SECONDS)
+            finally:
+                self._connection = None
+
+    def _subscribe(self, connection) -> None:
+        connection.send(
+            json.dumps(
+                {
+                    "event": "subscribe",
+                    "pair": list(self.ws_names.values()),
+                    "subscription": {"name": "book", "depth": self.depth},
+                }
+            )
+        )
+
+    def handle_message(self, message) -> None:
+        # Events such as heartbeats and subscription statuses are dicts, book
+        # data arrives as [channelID, payload, (payload,) channelName, pair].
+        if not isinstance(message, list):
+            if message.get("event") == "subscriptionStatus" and message.get(
+                "errorMessage"
+            ):
+                logger.error(f"Book subscription failed: {message['errorMessage']}")
+            return
+        book: OrderBook = self.books.get(self._pairs_by_ws_name.get(message[-1]))
+        if book is None:
+            return
+        payloads: list[dict] = message[1:-2]
+        if "as" in payloads[0] or "bs" in payloads[0]:
+            book.apply_snapshot(payloads[0].get("as", []), payloads[0].get("bs", []))
+            return
+        asks: list = []
+        bids: list = []
+        checksum: str = None
+        for payload in payloads:
+            asks.extend(payload.get("a", []))
+            bids.extend(payload.get("b", []))
+            checksum = payload.get("c", checksum)
+        book.apply_update(asks, bids, checksum)
+
+
+def get_ws_names(trading_pairs: list[str]) -> dict[str, str]:
+    return {
+        pair: info.wsname
+        for pair, info in pair_metadata.get_pairs(trading_pairs).items()
+        if info.wsname
+    }
+
+
+# Module scope so a warm Lambda keeps its subscription between invocations.
+_stream: BookStream = None
+_stream_lock = threading.Lock()
+
+
+def get_stream(trading_pairs: list[str]) -> BookStream:
+    global _stream
+    with _stream_lock:
+        if _stream is None or not set(trading_pairs) <= set(_stream.ws_names):
+            if _stream is not None:
+                _stream.stop()
+            _stream = BookStream(get_ws_names(trading_pairs)).start()
+        return _stream
+
+
+def current_stream() -> BookStream:
+    return _stream
+
+
+def stop_stream() -> None:
+    global _stream
+    with _stream_lock:
+        if _stream is not None:
+            _stream.stop()
+        _stream = None
@@ -0,0 +1,465 @@
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+import clock_sync
+import retry
+from kraken_client import RequestException
+
+logger = logging.getLogger()
+
+# Optional SQS queue the planner sends intents to, e.g. ElasticMQ via
+# ORDER_QUEUE_ENDPOINT. Without it intents go to an in-process queue.
+ORDER_QUEUE_URL: str = os.environ.get("ORDER_QUEUE_URL", "")
+ORDER_DEAD_LETTER_QUEUE_URL: str = os.environ.get("ORDER_DEAD_LETTER_QUEUE_URL", "")
+ORDER_QUEUE_ENDPOINT: str = os.environ.get("ORDER_QUEUE_ENDPOINT", "")
+ORDER_WORKERS: int = int(os.environ.get("ORDER_WORKERS", "4"))
+# Deliveries before an intent that keeps failing is dead-lettered, like the
+# maxReceiveCount of an SQS redrive policy.
+ORDER_MAX_RECEIVES: int = int(os.environ.get("ORDER_MAX_RECEIVES", "3"))
+# A failed intent is hidden this long, so an outage is waited out by a later
+# drain instead of being retried in a tight loop.
+ORDER_RETRY_DELAY_SECONDS: float = float(
+    os.environ.get("ORDER_RETRY_DELAY_SECONDS", "300")
+)
+# Minimum time between two submissions with one API key.
+ORDER_KEY_PACING_SECONDS: float = float(os.environ.get("ORDER_KEY_PACING_SECONDS", "0"))
+# Long poll of an SQS receive. SQS waits at most twenty seconds, and an empty
+# long poll has checked every SQS server, unlike an empty short poll.
+ORDER_QUEUE_WAIT_SECONDS: int = int(os.environ.get("ORDER_QUEUE_WAIT_SECONDS", "2"))
+# Empty receives in a row before a drain stops.
+ORDER_EMPTY_RECEIVES: int = int(os.environ.get("ORDER_EMPTY_RECEIVES", "2"))
+# SQS takes at most ten messages per batch call.
+SQS_BATCH_SIZE: int = 10
+
+# Submit at the planned price, or at the bid when the intent is submitted.
+PRICE_POLICIES: tuple = ("limit", "bid")
+
+PLACED: str = "placed"
+# Submission failed for now, the intent is delivered again later.
+REQUEUED: str = "requeued"
+EXPIRED: str = "expired"
+DEAD_LETTERED: str = "dead_lettered"
+
+
+@dataclass
+class OrderIntent:
+    trading_pair: str
+    crypto_to_buy: str
+    currency: str
+    budget: float
+    price: str
+    volume: str
+    # expiretm of the order and Kraken's time when the intent was planned.
+    expires_at: int
+    planned_at: float
+    # The same for every delivery of the intent, so a redelivered intent can
+    # be matched to an order that already went through.
+    userref: int
+    scheduled_at: int
+    # SSM names of the private and public key, never the keys themselves.
+    key_parameters: list[str]
+    price_policy: str = "limit"
+    post_only: bool = False
+    # Kraken's time after which the intent is dropped instead of submitted.
+    deadline: float = None
+    intent_id: str = None
+
+    def __post_init__(self):
+        if self.price_policy not in PRICE_POLICIES:
+            raise ValueError(f"Unknown price policy: {self.price_policy}")
+        if self.deadline is None:
+            self.deadline = float(self.expires_at)
+        if self.intent_id is None:
+            self.intent_id = f"{self.trading_pair}:{self.userref}"
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, text: str) -> "OrderIntent":
+        return cls(**json.loads(text))
+
+
+@dataclass
+class Message:
+    intent: OrderIntent
+    receive_count: int
+    receipt: str = field(default=None, repr=False)
+
+
+class InMemoryIntentQueue:
+    # Stands in for SQS within one process. Intents are stored as JSON, so
+    # anything that would not survive SQS fails here too.
+    def __init__(self, max_receives: int = None, clock=None):
+        self.max_receives: int = (
+            ORDER_MAX_RECEIVES if max_receives is None else max_receives
+        )
+        self._clock = clock
+        # (visible_at, body, receive_count)
+        self._messages: list[tuple[float, str, int]] = []
+        self.dead_letters: list[dict] = []
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return (self._clock or time.monotonic)()
+
+    def send(self, intents: list[OrderIntent]) -> None:
+        with self._lock:
+            self._messages.extend(
+                (self._now(), intent.to_json(), 0) for intent in intents
+            )
+
+    def receive(self, max_messages: int, wait_seconds: int = 0) -> list[Message]:
+        # Nothing else sends while a run drains its own queue, so there is
+        # nothing to wait for.
+        with self._lock:
+            now: float = self._now()
+            visible: list = [m for m in self._messages if m[0] <= now][:max_messages]
+            for message in visible:
+                self._messages.remove(message)
+        return [
+            Message(OrderIntent.from_json(body), receive_count + 1)
+            for _, body, receive_count in visible
+        ]
+
+    def delete(self, message: Message) -> None:
+        # Received messages are already off the queue.
+        pass
+
+    def retry(self, message: Message, delay_seconds: float) -> None:
+        with self._lock:
+            self._messages.append(
+                (
+                    self._now() + delay_seconds,
+                    message.intent.to_json(),
+                    message.receive_count,
+                )
+            )
+
+    def dead_letter(self, message: Message, reason: str) -> None:
+        with self._lock:
+            self.dead_letters.append(
+                {"intent": asdict(message.intent), "reason": reason}
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._messages)
+
+    def pending(self) -> int:
+        # Intents still queued, visible or waiting out a retry delay.
+        return len(self)
+
+
+class SQSIntentQueue:
+    def __init__(
+        self,
+        queue_url: str,
+        dead_letter_queue_url: str = None,
+        client=None,
+        endpoint_url: str = None,
+        max_receives: int = None,
+    ):
+        self.queue_url: str = queue_url
+        self.dead_letter_queue_url: str = dead_letter_queue_url or None
+        self.max_receives: int = (
+            ORDER_MAX_RECEIVES if max_receives is None else max_receives
+        )
+        self._client = client
+        self._endpoint_url: str = endpoint_url or None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client("sqs", endpoint_url=self._endpoint_url)
+        return self._client
+
+    def send(self, intents: list[OrderIntent]) -> None:
+        for start in range(0, len(intents), SQS_BATCH_SIZE):
+            response: dict = self.client.send_message_batch(
+                QueueUrl=self.queue_url,
+                Entries=[
+                    {"Id": str(index), "MessageBody": intent.to_json()}
+                    for index, intent in enumerate(
+                        intents[start : start + SQS_BATCH_SIZE]
+                    )
+                ],
+            )
+            if response.get("Failed"):
+                raise ValueError(f"Error queueing intents: {response['Failed']}")
+
+    def receive(self, max_messages: int, wait_seconds: int = 0) -> list[Message]:
+        response: dict = self.client.receive_message(
+            QueueUrl=self.queue_url,
+            MaxNumberOfMessages=min(max_messages, SQS_BATCH_SIZE),
+            WaitTimeSeconds=min(max(int(wait_seconds), 0), 20),
+            AttributeNames=["ApproximateReceiveCount"],
+        )
+        return [
+            Message(
+                OrderIntent.from_json(message["Body"]),
+                int(message["Attributes"]["ApproximateReceiveCount"]),
+                message["ReceiptHandle"],
+            )
+            for message in response.get("Messages", [])
+        ]
+
+    def pending(self) -> int:
+        # Approximate, SQS counts its servers' copies lazily.
+        attributes: dict = self.client.get_queue_attributes(
+            QueueUrl=self.queue_url,
+            AttributeNames=[
+                "ApproximateNumberOfMessages",
+                "ApproximateNumberOfMessagesNotVisible",
+                "ApproximateNumberOfMessagesDelayed",
+            ],
+        )["Attributes"]
+        return sum(int(count) for count in attributes.values())
+
+    def delete(self, message: Message) -> None:
+        self.client.delete_message(
+            QueueUrl=self.queue_url, ReceiptHandle=message.receipt
+        )
+
+    def retry(self, message: Message, delay_seconds: float) -> None:
+        # SQS caps the visibility timeout at twelve hours.
+        self.client.change_message_visibility(
+            QueueUrl=self.queue_url,
+            ReceiptHandle=message.receipt,
+            VisibilityTimeout=min(int(delay_seconds), 43200),
+        )
+
+    def dead_letter(self, message: Message, reason: str) -> None:
+        # Without a dead-letter queue URL the message is left for the queue's
+        # own redrive policy.
+        if self.dead_letter_queue_url is None:
+            logger.warning(f"Intent {message.intent.intent_id} failed: {reason}")
+            return
+        self.client.send_message(
+            QueueUrl=self.dead_letter_queue_url,
+            MessageBody=json.dumps(
+                {"intent": asdict(message.intent), "reason": reason}
+            ),
+        )
+        self.delete(message)
+
+
+def default_queue():
+    if ORDER_QUEUE_URL:
+        return SQSIntentQueue(
+            ORDER_QUEUE_URL,
+            ORDER_DEAD_LETTER_QUEUE_URL,
+            endpoint_url=ORDER_QUEUE_ENDPOINT,
+        )
+    return InMemoryIntentQueue()
+
+
+# Module scope so intents requeued in one run are drained by the next run of
+# the same warm sandbox or service process.
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = default_queue()
+        return _queue
+
+
+def reset_queue(intent_queue=None) -> None:
+    global _queue
+    with _queue_lock:
+        _queue = intent_queue
+
+
+def is_in_process(intent_queue) -> bool:
+    return isinstance(intent_queue, InMemoryIntentQueue)
+
+
+class WorkerPool:
+    # submit(intent, deadline, redelivered) sends one intent and returns
+    # Kraken's AddOrder JSON. Intents for different API keys are submitted
+    # concurrently, those for one key one at a time and at least
+    # pacing_seconds apart, so nonces reach Kraken in order.
+    def __init__(
+        self,
+        intent_queue,
+        submit,
+        workers: int = None,
+        pacing_seconds: float = None,
+        retry_delay_seconds: float = None,
+        wait_seconds: int = None,
+        empty_receives: int = None,
+        server_clock=None,
+        clock=None,
+        sleep=None,
+    ):
+        self.queue = intent_queue
+        self._submit = submit
+        self.workers: int = ORDER_WORKERS if workers is None else workers
+        self.pacing_seconds: float = (
+            ORDER_KEY_PACING_SECONDS if pacing_seconds is None else pacing_seconds
+        )
+        self.retry_delay_seconds: float = (
+            ORDER_RETRY_DELAY_SECONDS
+            if retry_delay_seconds is None
+            else retry_delay_seconds
+        )
+        self.wait_seconds: int = (
+            ORDER_QUEUE_WAIT_SECONDS if wait_seconds is None else wait_seconds
+        )
+        self.empty_receives: int = (
+            ORDER_EMPTY_RECEIVES if empty_receives is None else empty_receives
+        )
+        self._server_clock = server_clock
+        self._clock = clock
+        self._sleep = sleep
+        self._key_locks: dict[str, threading.Lock] = {}
+        self._last_submitted: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return (self._clock or time.monotonic)()
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _pace(self, key: str) -> None:
+        last: float = self._last_submitted.get(key)
+        if last is not None:
+            wait_seconds: float = last + self.pacing_seconds - self._now()
+            if wait_seconds > 0:
+                (self._sleep or time.sleep)(wait_seconds)
+        self._last_submitted[key] = self._now()
+
+    def _fail(self, message: Message, reason: str, terminal: bool) -> dict:
+        intent: OrderIntent = message.intent
+        if terminal or message.receive_count >= self.queue.max_receives:
+            logger.error(f"Dead-lettering intent {intent.intent_id}: {reason}")
+            self.queue.dead_letter(message, reason)
+            status: str = DEAD_LETTERED
+        else:
+            logger.warning(f"Requeueing intent {intent.intent_id}: {reason}")
+            self.queue.retry(message, self.retry_delay_seconds)
+            status = REQUEUED
+        return {
+            "intent_id": intent.intent_id,
+            "trading_pair": intent.trading_pair,
+            "status": status,
+            "error": [reason],
+        }
+
+    def process(self, message: Message, deadline: float = None) -> dict:
+        # Any error is turned into an outcome, so one bad intent neither stops
+        # the drain nor loses the intents received with it.
+        try:
+            return self._process(message, deadline)
+        except Exception as e:
+            logger.exception(f"Submitting intent {message.intent.intent_id} failed")
+            try:
+                return self._fail(message, repr(e), terminal=False)
+            except Exception:
+                # SQS delivers the message again once it is visible.
+                logger.exception(f"Requeueing intent {message.intent.intent_id} failed")
+                return {
+                    "intent_id": message.intent.intent_id,
+                    "trading_pair": message.intent.trading_pair,
+                    "status": REQUEUED,
+                    "error": [repr(e)],
+                }
+
+    def _process(self, message: Message, deadline: float = None) -> dict:
+        intent: OrderIntent = message.intent
+        server_time = self._server_clock or clock_sync.server_time
+        if server_time() >= intent.deadline:
+            logger.warning(f"Dropping intent {intent.intent_id} past its deadline")
+            self.queue.delete(message)
+            return {
+                "intent_id": intent.intent_id,
+                "trading_pair": intent.trading_pair,
+                "status": EXPIRED,
+            }
+        key: str = intent.key_parameters[1]
+        with self._key_lock(key):
+            self._pace(key)
+            try:
+                order_data: dict = self._submit(
+                    intent, deadline, message.receive_count > 1
+                )
+            except RequestException as e:
+                return self._fail(message, str(e), terminal=False)
+            except ValueError as e:
+                return self._fail(message, str(e), terminal=True)
+        outcome: str = retry.classify_result(order_data)
+        if outcome != retry.OK:
+            return self._fail(
+                message, ", ".join(order_data["error"]), outcome == retry.TERMINAL
+            )
+        self.queue.delete(message)
+        return {
+            "intent_id": intent.intent_id,
+            "trading_pair": intent.trading_pair,
+            "status": PLACED,
+            "result": order_data["result"],
+        }
+
+    def _receive_wait(self, deadline: float) -> int:
+        # A long poll never runs into the time kept for the last submission.
+        if deadline is None:
+            return self.wait_seconds
+        remaining: float = deadline - self._now() - retry.RETRY_RESERVE_SECONDS
+        return max(min(self.wait_seconds, int(remaining)), 0)
+
+    def drain(self, deadline: float = None) -> list[dict]:
+        # Submits intents until empty_receives receives in a row found none
+        # or the time.monotonic() deadline is near, and returns one outcome
+        # per delivery. Intents not received by then stay queued for the next
+        # drain.
+        outcomes: list[dict] = []
+        empty: int = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while (
+                deadline is None or self._now() + retry.RETRY_RESERVE_SECONDS < deadline
+            ):
+                messages: list[Message] = self.queue.receive(
+                    self.workers, wait_seconds=self._receive_wait(deadline)
+                )
+                if not messages:
+                    empty += 1
+                    if empty >= self.empty_receives:
+                        break
+                    continue
+                empty = 0
+                outcomes.extend(
+                    executor.map(
+                        lambda message: self.process(message, deadline), messages
+                    )
+                )
+        return outcomes
+
+
+def outcome_status(outcomes: list[dict], pending: int = 0) -> tuple[int, str]:
+    # pending intents were not submitted yet, e.g. the drain ran out of time
+    # or they wait out a retry delay, so the run is not a success.
+    failed: int = sum(1 for outcome in outcomes if outcome["status"] != PLACED)
+    placed: int = len(outcomes) - failed
+    if pending > 0:
+        if placed > 0:
+            return 207, f"{pending} intents left in the queue"
+        return 503, f"{pending} intents left in the queue"
+    if failed == 0 and placed == 0:
+        return 200, "No intents to submit"
+    if failed == 0:
+        return 200, "Orders placed successfully"
+    if placed > 0:
+        return 207, "Some intents failed"
+    return 400, "All intents failed"
@@ -0,0 +1,224 @@
+import json
+import os
+import statistics
+import threading
+from dataclasses import asdict, dataclass, fields
+
+# "file" keeps state in /tmp across warm invocations, "memory" only per process.
+# Neither is durable: a Lambda cold start, or a run in another sandbox, begins
+# with an empty store and knows nothing of the orders placed before it.
+ORDER_STORE: str = os.environ.get("ORDER_STORE", "file").lower()
+ORDER_TRACKER_PATH: str = os.environ.get(
+    "ORDER_TRACKER_PATH", "/tmp/kraken-dca-orders.json"
+)
+# Finished orders are kept this long for the fill metrics, then forgotten so
+# the store stays bounded.
+ORDER_RETENTION_DAYS: float = float(os.environ.get("ORDER_RETENTION_DAYS", "30"))
+# QueryOrders accepts at most 50 txids per call.
+QUERY_ORDERS_BATCH_SIZE: int = 50
+OPEN_STATUSES: frozenset = frozenset({"pending", "open"})
+
+
+@dataclass
+class TrackedOrder:
+    txid: str
+    pair: str
+    volume: str
+    price: str
+    submitted_at: float
+    expires_at: float = None
+    status: str = "pending"
+    filled_volume: str = "0"
+    average_price: str = None
+    closed_at: float = None
+    budget: float = None
+    userref: int = None
+    scheduled_at: int = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.status in OPEN_STATUSES
+
+
+class InMemoryOrderStore:
+    def __init__(self):
+        self.orders: dict[str, TrackedOrder] = {}
+
+    def load(self) -> dict[str, TrackedOrder]:
+        return dict(self.orders)
+
+    def save(self, orders: dict[str, TrackedOrder]) -> None:
+        self.orders = dict(orders)
+
+
+class JsonFileOrderStore:
+    def __init__(self, path: str = ORDER_TRACKER_PATH):
+        self.path: str = path
+
+    def load(self) -> dict[str, TrackedOrder]:
+        try:
+            with open(self.path) as file:
+                rows: list[list] = json.load(file)["orders"]
+        except FileNotFoundError:
+            return {}
+        # Rows are stored positionally to keep the file small.
+        names: list[str] = [column.name for column in fields(TrackedOrder)]
+        return {row[0]: TrackedOrder(**dict(zip(names, row))) for row in rows}
+
+    def save(self, orders: dict[str, TrackedOrder]) -> None:
+        rows: list[list] = [list(asdict(order).values()) for order in orders.values()]
+        temporary_path: str = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({"orders": rows}, file, separators=(",", ":"))
+        os.replace(temporary_path, self.path)
+
+
+class OrderTracker:
+    def __init__(self, store=None):
+        self.store = store if store is not None else JsonFileOrderStore()
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        txids: list[str],
+        pair: str,
+        volume: str,
+        price: str,
+        submitted_at: float,
+        expires_at: float = None,
+        budget: float = None,
+        userref: int = None,
+        scheduled_at: int = None,
+    ) -> None:
+        with self._lock:
+            orders: dict[str, TrackedOrder] = self.store.load()
+            for txid in txids:
+                orders[txid] = TrackedOrder(
+                    txid=txid,
+                    pair=pair,
+                    volume=str(volume),
+                    price=str(price),
+                    submitted_at=submitted_at,
+                    expires_at=expires_at,
+                    budget=budget,
+                    userref=userref,
+                    scheduled_at=scheduled_at,
+                )
+            self.store.save(orders)
+
+    def replace(self, old_txid: str, new_txid: str, price: str, volume: str) -> None:
+        # An amended order keeps its first submission time, so time-to-fill
+        # includes the time spent chasing the price.
+        with self._lock:
+            orders: dict[str, TrackedOrder] = self.store.load()
+            order: TrackedOrder = orders.pop(old_txid)
+            order.txid, order.price, order.volume = new_txid, str(price), str(volume)
+            orders[new_txid] = order
+            self.store.save(orders)
+
+    def get(self, txids: list[str]) -> list[TrackedOrder]:
+        orders: dict[str, TrackedOrder] = self.store.load()
+        return [orders[txid] for txid in txids if txid in orders]
+
+    def open_txids(self) -> list[str]:
+        return [order.txid for order in self.store.load().values() if order.is_open]
+
+    def has_history(self, submitted_before: float) -> bool:
+        # False for a store that was empty before this run, whose count of
+        # open orders says nothing about the orders still on the book.
+        return any(
+            order.submitted_at < submitted_before
+            for order in self.store.load().values()
+        )
+
+    def reconcile(
+        self, query_orders, submitted_before: float = None
+    ) -> list[TrackedOrder]:
+        # query_orders takes a list of txids and returns QueryOrders' result.
+        # Orders from the current run can be left out, they are still open.
+        with self._lock:
+            orders: dict[str, TrackedOrder] = self.store.load()
+            open_txids: list[str] = [
+                order.txid
+                for order in orders.values()
+                if order.is_open
+                and (submitted_before is None or order.submitted_at < submitted_before)
+            ]
+            updated: list[TrackedOrder] = []
+            for start in range(0, len(open_txids), QUERY_ORDERS_BATCH_SIZE):
+                result: dict = query_orders(
+                    open_txids[start : start + QUERY_ORDERS_BATCH_SIZE]
+                )
+                for txid, info in result.items():
+                    if txid not in orders:
+                        continue
+                    order: TrackedOrder = orders[txid]
+                    order.status = info.get("status", order.status)
+                    order.filled_volume = info.get("vol_exec", order.filled_volume)
+                    order.average_price = info.get("price") or order.average_price
+                    order.closed_at = info.get("closetm") or order.closed_at
+                    updated.append(order)
+            if updated:
+                self.store.save(orders)
+            return updated
+
+    def fill_rate(self) -> float:
+        # Share of the submitted volume that filled, over orders that are done.
+        done: list[TrackedOrder] = [
+            order for order in self.store.load().values() if not order.is_open
+        ]
+        submitted: float = sum(float(order.volume) for order in done)
+        if submitted == 0:
+            return None
+        return sum(float(order.filled_volume) for order in done) / submitted
+
+    def times_to_fill(self) -> list[float]:
+        return [
+            order.closed_at - order.submitted_at
+            for order in self.store.load().values()
+            if order.status == "closed" and order.closed_at is not None
+        ]
+
+    def median_time_to_fill(self) -> float:
+        times: list[float] = self.times_to_fill()
+        return statistics.median(times) if times else None
+
+    def forget_finished(self, finished_before: float = None) -> int:
+        # Drops orders that are done, or only those that finished before
+        # finished_before, and returns how many were dropped. Orders without a
+        # close time count from their submission.
+        with self._lock:
+            orders: dict[str, TrackedOrder] = self.store.load()
+            kept: dict[str, TrackedOrder] = {
+                txid: order
+                for txid, order in orders.items()
+                if order.is_open
+                or (
+                    finished_before is not None
+                    and (order.closed_at or order.submitted_at) >= finished_before
+                )
+            }
+            if len(kept) < len(orders):
+                self.store.save(kept)
+            return len(orders) - len(kept)
+
+
+def default_store():
+    if ORDER_STORE == "memory":
+        return InMemoryOrderStore()
+    return JsonFileOrderStore(ORDER_TRACKER_PATH)
+
+
+_tracker: OrderTracker = None
+
+
+def get_tracker() -> OrderTracker:
+    global _tracker
+    if _tracker is None:
+        _tracker = OrderTracker(default_store())
+    return _tracker
+
+
+def reset_tracker(store=None) -> None:
+    global _tracker
+    _tracker = OrderTracker(store) if store is not None else None
@@ -0,0 +1,191 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+from decimal import ROUND_DOWN, Decimal
+from kraken_client import public_get
+
+PAIR_METADATA_PATH: str = os.environ.get(
+    "PAIR_METADATA_PATH", "/tmp/kraken-asset-pairs.json"
+)
+PAIR_METADATA_TTL_SECONDS: float = float(
+    os.environ.get("PAIR_METADATA_TTL_SECONDS", "86400")
+)
+
+
+@dataclass(frozen=True)
+class PairInfo:
+    pair: str
+    pair_decimals: int
+    lot_decimals: int
+    ordermin: str
+    costmin: str = None
+    tick_size: str = None
+    wsname: str = None
+    # Balance key of the asset bought, e.g. XXBT.
+    base: str = None
+    # Kraken's own name for the pair, e.g. XXBTZAUD, which keys the results of
+    # Ticker and AssetPairs.
+    key: str = None
+
+
+def pair_info_from_asset_pair(pair: str, asset_pair: dict, key: str = None) -> PairInfo:
+    return PairInfo(
+        pair=pair,
+        pair_decimals=int(asset_pair["pair_decimals"]),
+        lot_decimals=int(asset_pair["lot_decimals"]),
+        ordermin=asset_pair.get("ordermin", "0"),
+        costmin=asset_pair.get("costmin"),
+        tick_size=asset_pair.get("tick_size"),
+        wsname=asset_pair.get("wsname"),
+        base=asset_pair.get("base"),
+        key=key,
+    )
+
+
+def format_price(price, info: PairInfo) -> str:
+    # Buys round down, so the limit never crosses the bid it came from.
+    value: Decimal = Decimal(str(price)).quantize(
+        Decimal(1).scaleb(-info.pair_decimals), rounding=ROUND_DOWN
+    )
+    if info.tick_size:
+        tick: Decimal = Decimal(info.tick_size)
+        value = (value / tick).to_integral_value(rounding=ROUND_DOWN) * tick
+        value = value.quantize(Decimal(1).scaleb(-info.pair_decimals))
+    return format(value, "f")
+
+
+def format_volume(budget, price: str, info: PairInfo) -> str:
+    volume: Decimal = (Decimal(str(budget)) / Decimal(price)).quantize(
+        Decimal(1).scaleb(-info.lot_decimals), rounding=ROUND_DOWN
+    )
+    if volume < Decimal(info.ordermin):
+        raise ValueError(
+            f"Volume {format(volume, 'f')} is below the {info.pair} minimum "
+            f"order of {info.ordermin}"
+        )
+    if info.costmin and volume * Decimal(price) < Decimal(info.costmin):
+        raise ValueError(
+            f"Order cost is below the {info.pair} minimum of {info.costmin}"
+        )
+    return format(volume, "f")
+
+
+class PairMetadataCache:
+    # AssetPairs changes rarely, so it is kept in memory for warm invocations
+    # and in a file that outlives the process, each with a TTL.
+    def __init__(
+        self,
+        path: str = PAIR_METADATA_PATH,
+        ttl_seconds: float = PAIR_METADATA_TTL_SECONDS,
+        clock=None,
+    ):
+        self.path: str = path
+        self.ttl_seconds: float = ttl_seconds
+        self._clock = clock
+        self._pairs: dict[str, PairInfo] = {}
+        self._fetched_at: dict[str, float] = {}
+        self._loaded: bool = False
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        # Wall clock time, the file is read again after a cold start.
+        return (self._clock or time.time)()
+
+    def _load(self) -> None:
+        self._loaded = True
+        if not self.path:
+            return
+        try:
+            with open(self.path) as file:
+                stored: dict = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return
+        for pair, row in stored.get("pairs", {}).items():
+            self._pairs[pair] = PairInfo(**row["info"])
+            self._fetched_at[pair] = row["fetched_at"]
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        rows: dict = {
+            pair: {"info": asdict(info), "fetched_at": self._fetched_at[pair]}
+            for pair, info in self._pairs.items()
+        }
+        temporary_path: str = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({"pairs": rows}, file, separators=(",", ":"))
+        os.replace(temporary_path, self.path)
+
+    def _is_fresh(self, pair: str, now: float) -> bool:
+        return pair in self._pairs and now - self._fetched_at[pair] < self.ttl_seconds
+
+    def get_pairs(self, trading_pairs: list[str]) -> dict[str, PairInfo]:
+        with self._lock:
+            if not self._loaded:
+                self._load()
+            now: float = self._now()
+            missing: list[str] = [
+                pair for pair in trading_pairs if not self._is_fresh(pair, now)
+            ]
+            if missing:
+                for pair, info in fetch_asset_pairs(missing).items():
+                    self._pairs[pair] = info
+                    self._fetched_at[pair] = now
+                self._save()
+            unknown: list[str] = [p for p in trading_pairs if p not in self._pairs]
+            if unknown:
+                raise ValueError(f"Unknown asset pairs: {', '.join(unknown)}")
+            return {pair: self._pairs[pair] for pair in trading_pairs}
+
+    def seed(self, pairs: dict[str, PairInfo]) -> None:
+        with self._lock:
+            self._loaded = True
+            for pair, info in pairs.items():
+                self._pairs[pair] = info
+                self._fetched_at[pair] = self._now()
+
+
+def fetch_asset_pairs(trading_pairs: list[str]) -> dict[str, PairInfo]:
+    response = public_get(f"/0/public/AssetPairs?pair={','.join(trading_pairs)}")
+    response.raise_for_status()
+    pairs_data: dict = response.json()
+    if pairs_data.get("error"):
+        raise ValueError(f"Error fetching asset pairs: {pairs_data['error']}")
+    # Results are keyed by Kraken's own pair names, e.g. XXBTZUSD for XBTUSD.
+    by_name: dict = {}
+    for name, asset_pair in pairs_data["result"].items():
+        by_name[name] = (name, asset_pair)
+        by_name.setdefault(asset_pair.get("altname"), (name, asset_pair))
+    return {
+        pair: pair_info_from_asset_pair(pair, by_name[pair][1], by_name[pair][0])
+        for pair in trading_pairs
+        if pair in by_name
+    }
+
+
+_cache: PairMetadataCache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> PairMetadataCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PairMetadataCache()
+        return _cache
+
+
+def reset_cache(cache: PairMetadataCache = None) -> None:
+    global _cache
+    with _cache_lock:
+        _cache = cache
+
+
+def get_pairs(trading_pairs: list[str]) -> dict[str, PairInfo]:
+    return get_cache().get_pairs(trading_pairs)
+
+
+def get_pair(trading_pair: str) -> PairInfo:
+    return get_pairs([trading_pair])[trading_pair]
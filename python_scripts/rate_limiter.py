@@ -0,0 +1,175 @@
+import os
+import threading
+import time
+
+# Kraken's private REST counter per API key: (maximum, decay per second).
+REST_COUNTER_TIERS: dict[str, tuple[float, float]] = {
+    "starter": (15, 0.33),
+    "intermediate": (20, 0.5),
+    "pro": (20, 1.0),
+}
+# The matching engine keeps a separate counter per pair for order calls.
+TRADING_COUNTER_TIERS: dict[str, tuple[float, float]] = {
+    "starter": (60, 1.0),
+    "intermediate": (125, 2.34),
+    "pro": (180, 3.75),
+}
+KRAKEN_TIER: str = os.environ.get("KRAKEN_TIER", "starter").lower()
+RATE_LIMIT_MAX_WAIT_SECONDS: float = float(
+    os.environ.get("RATE_LIMIT_MAX_WAIT_SECONDS", "5")
+)
+
+# History calls cost two points, order calls go to the trading counter instead.
+REST_CALL_COSTS: dict[str, float] = {
+    "/0/private/Ledgers": 2,
+    "/0/private/QueryLedgers": 2,
+    "/0/private/TradesHistory": 2,
+    "/0/private/QueryTrades": 2,
+    "/0/private/AddOrder": 0,
+    "/0/private/EditOrder": 0,
+    "/0/private/CancelOrder": 0,
+}
+TRADING_CALL_COSTS: dict[str, float] = {
+    "/0/private/AddOrder": 1,
+    "/0/private/EditOrder": 1,
+    "/0/private/CancelOrder": 1,
+}
+
+
+class WaitTooLong(Exception):
+    # The call would have to wait longer than allowed, it is not sent.
+    def __init__(self, wait_seconds: float):
+        super().__init__(f"Rate limit wait of {wait_seconds:.1f}s is too long")
+        self.wait_seconds: float = wait_seconds
+
+
+class DecayingCounter:
+    def __init__(
+        self,
+        maximum: float,
+        decay_per_second: float,
+        clock=None,
+        sleep=None,
+    ):
+        self.maximum: float = maximum
+        self.decay_per_second: float = decay_per_second
+        self._clock = clock
+        self._sleep = sleep
+        self._value: float = 0.0
+        self._updated: float = self._now()
+        self._lock = threading.Lock()
+
+    def _now(self) -> float:
+        return (self._clock or time.monotonic)()
+
+    @property
+    def value(self) -> float:
+        with self._lock:
+            self._decay()
+            return self._value
+
+    def _decay(self) -> None:
+        now: float = self._now()
+        self._value = max(
+            0.0, self._value - (now - self._updated) * self.decay_per_second
+        )
+        self._updated = now
+
+    def reserve(self, cost: float, max_wait_seconds: float = None) -> float:
+        # The counter may run past its maximum: the excess is the queue of
+        # callers already waiting, so later callers wait behind them. A caller
+        # that would wait longer than max_wait_seconds is not queued.
+        with self._lock:
+            self._decay()
+            wait_seconds: float = max(
+                0.0, (self._value + cost - self.maximum) / self.decay_per_second
+            )
+            if max_wait_seconds is not None and wait_seconds > max_wait_seconds:
+                raise WaitTooLong(wait_seconds)
+            self._value += cost
+            return wait_seconds
+
+    def release(self, cost: float) -> None:
+        # Gives back a reservation whose call was never sent.
+        with self._lock:
+            self._decay()
+            self._value = max(0.0, self._value - cost)
+
+    def acquire(self, cost: float, max_wait_seconds: float) -> float:
+        if cost <= 0:
+            return 0.0
+        wait_seconds: float = self.reserve(cost, max_wait_seconds)
+        if wait_seconds > 0:
+            (self._sleep or time.sleep)(wait_seconds)
+        return wait_seconds
+
+    def saturate(self) -> None:
+        with self._lock:
+            self._decay()
+            self._value = max(self._value, self.maximum)
+
+
+class KeyRateLimiter:
+    def __init__(self, tier: str = KRAKEN_TIER, clock=None, sleep=None):
+        self.tier: str = tier
+        self._clock = clock
+        self._sleep = sleep
+        self.rest: DecayingCounter = DecayingCounter(
+            *REST_COUNTER_TIERS[tier], clock=clock, sleep=sleep
+        )
+        self.trading: dict[str, DecayingCounter] = {}
+        self._lock = threading.Lock()
+
+    def trading_counter(self, pair: str) -> DecayingCounter:
+        with self._lock:
+            if pair not in self.trading:
+                self.trading[pair] = DecayingCounter(
+                    *TRADING_COUNTER_TIERS[self.tier],
+                    clock=self._clock,
+                    sleep=self._sleep,
+                )
+            return self.trading[pair]
+
+    def acquire(
+        self,
+        path: str,
+        pair: str = None,
+        max_wait_seconds: float = RATE_LIMIT_MAX_WAIT_SECONDS,
+    ) -> float:
+        # Raises WaitTooLong instead of sending a call Kraken would reject.
+        rest_cost: float = REST_CALL_COSTS.get(path, 1)
+        waited: float = self.rest.acquire(rest_cost, max_wait_seconds)
+        if path in TRADING_CALL_COSTS:
+            try:
+                waited += self.trading_counter(pair or "").acquire(
+                    TRADING_CALL_COSTS[path], max(max_wait_seconds - waited, 0.0)
+                )
+            except WaitTooLong:
+                self.rest.release(rest_cost)
+                raise
+        return waited
+
+    def record_rate_limited(self, path: str, pair: str = None) -> None:
+        # Kraken's counter is fuller than modelled, e.g. another process shares
+        # the key, so treat it as full and make the next call wait.
+        if path in TRADING_CALL_COSTS:
+            self.trading_counter(pair or "").saturate()
+        else:
+            self.rest.saturate()
+
+
+# Module scope so the modelled counters survive warm invocations.
+_limiters: dict[str, KeyRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(api_key: str) -> KeyRateLimiter:
+    with _limiters_lock:
+        if api_key not in _limiters:
+            _limiters[api_key] = KeyRateLimiter()
+        return _limiters[api_key]
+
+
+def reset_limiters() -> None:
+    with _limiters_lock:
+        _limiters.clear()
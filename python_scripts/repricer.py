@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from kraken_client import signed_post
+
+logger = logging.getLogger()
+
+REPRICE_WINDOW_SECONDS: float = float(os.environ.get("REPRICE_WINDOW_SECONDS", "6"))
+REPRICE_INTERVAL_SECONDS: float = float(os.environ.get("REPRICE_INTERVAL_SECONDS", "1"))
+REPRICE_MAX_CHASE_PERCENT: float = float(
+    os.environ.get("REPRICE_MAX_CHASE_PERCENT", "0.5")
+)
+# Left over before the Lambda timeout for the response and the metrics record.
+REPRICE_DEADLINE_MARGIN_SECONDS: float = 1.5
+# post keeps every amended order on the maker side of the book.
+POST_ONLY_FLAGS: str = "fciq,post"
+# EditOrder only takes post, the order keeps its other flags.
+EDIT_ORDER_FLAGS: str = "post"
+
+
+@dataclass
+class ChasedOrder:
+    txid: str
+    pair: str
+    budget: float
+    price: str
+    volume: str
+    ceiling: float
+    expires_at: int = None
+    # userref and tick of the first order, a replacement keeps both.
+    userref: int = None
+    scheduled_at: int = None
+    status: str = "open"
+    filled_volume: str = "0"
+    repriced: int = 0
+    chasing: bool = True
+    # Cancelled orders this one replaced, they share its userref.
+    replaced_txids: list[str] = field(default_factory=list)
+
+
+def chase_ceiling(price: str, max_chase_percent: float) -> float:
+    return float(price) * (1 + max_chase_percent / 100)
+
+
+def chase_price(bid: str, ceiling: float) -> str:
+    # format_order rounds the ceiling down to the pair's price decimals.
+    return bid if float(bid) <= ceiling else str(ceiling)
+
+
+class Repricer:
+    # fetch_bids(pairs) -> {pair: best bid}, query_orders(txids) -> QueryOrders
+    # result and format_order(pair, budget, price) -> (price, volume) come from
+    # the caller, so rounding and order minimums match the first order. With
+    # method "replace", place_order(order, price, volume) sends the AddOrder
+    # of the replacement and returns its JSON.
+    def __init__(
+        self,
+        private_key: str,
+        public_key: str,
+        fetch_bids,
+        query_orders,
+        format_order,
+        method: str = "edit",
+        place_order=None,
+        interval_seconds: float = REPRICE_INTERVAL_SECONDS,
+        on_replace=None,
+        clock=None,
+        sleep=None,
+    ):
+        if method not in ("edit", "replace"):
+            raise ValueError(f"Unknown re-pricing method: {method}")
+        if method == "replace" and place_order is None:
+            raise ValueError("Re-pricing by replacing orders needs place_order")
+        self.private_key: str = private_key
+        self.public_key: str = public_key
+        self.fetch_bids = fetch_bids
+        self.query_orders = query_orders
+        self.format_order = format_order
+        self.method: str = method
+        self.place_order = place_order
+        self.interval_seconds: float = interval_seconds
+        self.on_replace = on_replace
+        self._clock = clock
+        self._sleep = sleep
+
+    def _now(self) -> float:
+        return (self._clock or time.monotonic)()
+
+    def run(self, orders: list[ChasedOrder], deadline: float) -> list[ChasedOrder]:
+        # deadline is on the same clock as _now, i.e. time.monotonic by default.
+        while self._now() + self.interval_seconds <= deadline:
+            if not any(order.chasing for order in orders):
+                break
+            (self._sleep or time.sleep)(self.interval_seconds)
+            chased: list[ChasedOrder] = self._refresh([o for o in orders if o.chasing])
+            if not chased:
+                break
+            bids: dict[str, str] = self.fetch_bids(sorted({o.pair for o in chased}))
+            for order in chased:
+                price, volume = self.format_order(
+                    order.pair,
+                    order.budget,
+                    chase_price(bids[order.pair], order.ceiling),
+                )
+                if float(price) > float(order.price):
+                    self.reprice(order, price, volume)
+        return orders
+
+    def _refresh(self, orders: list[ChasedOrder]) -> list[ChasedOrder]:
+        # One QueryOrders call for every order still being chased.
+        result: dict = self.query_orders([order.txid for order in orders])
+        for order in orders:
+            info: dict = result.get(order.txid, {})
+            order.status = info.get("status", order.status)
+            order.filled_volume = info.get("vol_exec", order.filled_volume)
+            # Partly filled orders are left alone, their remaining volume no
+            # longer matches the budget.
+            if order.status not in ("pending", "open") or float(order.filled_volume):
+                order.chasing = False
+        return [order for order in orders if order.chasing]
+
+    def reprice(self, order: ChasedOrder, price: str, volume: str) -> None:
+        if self.method == "edit":
+            response = signed_post(
+                path="/0/private/EditOrder",
+                data={
+                    "txid": order.txid,
+                    "pair": order.pair,
+                    "price": price,
+                    "volume": volume,
+                    "oflags": EDIT_ORDER_FLAGS,
+                },
+                public_key=self.public_key,
+                private_key=self.private_key,
+            )
+            order_data: dict = response.json()
+            if self._stop_on_error(order, order_data):
+                return
+            new_txid: str = order_data["result"]["txid"]
+        else:
+            response = signed_post(
+                path="/0/private/CancelOrder",
+                data={"txid": order.txid},
+                public_key=self.public_key,
+                private_key=self.private_key,
+            )
+            if self._stop_on_error(order, response.json()):
+                return
+            order.replaced_txids.append(order.txid)
+            order_data = self.place_order(order, price, volume)
+            if self._stop_on_error(order, order_data):
+                # The original is cancelled, nothing is left to chase.
+                order.status = "canceled"
+                return
+            new_txid = order_data["result"]["txid"][0]
+
+        logger.info(f"Re-priced {order.pair} order {order.txid} to {price}")
+        if self.on_replace is not None:
+            self.on_replace(order.txid, new_txid, price, volume)
+        order.txid, order.price, order.volume = new_txid, price, volume
+        order.repriced += 1
+
+    def _stop_on_error(self, order: ChasedOrder, order_data: dict) -> bool:
+        errors: list = order_data.get("error") or []
+        if not errors:
+            return False
+        # E.g. EOrder:Post only order when the price would take, the order
+        # stays as it is.
+        logger.warning(f"Stopped re-pricing {order.pair} order {order.txid}: {errors}")
+        order.chasing = False
+        return True
@@ -0,0 +1,145 @@
+import os
+import random
+import time
+from kraken_client import (
+    CONNECT_TIMEOUT,
+    READ_TIMEOUT,
+    RateLimitWaitTooLong,
+    RequestException,
+)
+
+RETRY_MAX_ATTEMPTS: int = int(os.environ.get("KRAKEN_RETRY_MAX_ATTEMPTS", "4"))
+RETRY_BASE_DELAY_SECONDS: float = float(
+    os.environ.get("KRAKEN_RETRY_BASE_DELAY_SECONDS", "0.25")
+)
+RETRY_MAX_DELAY_SECONDS: float = float(
+    os.environ.get("KRAKEN_RETRY_MAX_DELAY_SECONDS", "2")
+)
+# Time kept after the last backoff for the request itself, a retry that would
+# not fit before the deadline is not started. One attempt can take a connect
+# and a read timeout, so the reserve is never less than both.
+RETRY_RESERVE_SECONDS: float = max(
+    float(os.environ.get("KRAKEN_RETRY_RESERVE_SECONDS", "0")),
+    CONNECT_TIMEOUT + READ_TIMEOUT,
+)
+
+OK: str = "ok"
+# Kraken rejected the request without acting on it, it is safe to send again.
+RETRYABLE: str = "retryable"
+# The request may have been carried out, e.g. a read timeout or a 5xx from
+# the gateway, so an order has to be looked up before it is sent again.
+AMBIGUOUS: str = "ambiguous"
+TERMINAL: str = "terminal"
+
+RETRYABLE_ERRORS: tuple = (
+    "EService:Unavailable",
+    "EService:Busy",
+    "EAPI:Invalid nonce",
+)
+AMBIGUOUS_ERRORS: tuple = ("EGeneral:Internal error", "EService:Deadline elapsed")
+
+
+def classify_result(result: dict) -> str:
+    errors: list = result.get("error") or []
+    if not errors:
+        return OK
+    if all(str(error).startswith(RETRYABLE_ERRORS) for error in errors):
+        return RETRYABLE
+    if any(str(error).startswith(AMBIGUOUS_ERRORS) for error in errors):
+        return AMBIGUOUS
+    return TERMINAL
+
+
+def classify_exception(error: RequestException) -> str:
+    # Only a failed connect or a call the rate limiter held back is known
+    # not to have reached Kraken.
+    if isinstance(error, RateLimitWaitTooLong):
+        return RETRYABLE
+    response = getattr(error, "response", None)
+    if response is not None:
+        return AMBIGUOUS if response.status_code >= 500 else TERMINAL
+    if type(error).__name__ == "ConnectTimeout":
+        return RETRYABLE
+    return AMBIGUOUS
+
+
+class RetryPolicy:
+    # Full jitter exponential backoff, bounded by attempts and a
+    # time.monotonic() deadline.
+    def __init__(
+        self,
+        max_attempts: int = None,
+        base_delay_seconds: float = None,
+        max_delay_seconds: float = None,
+        deadline: float = None,
+        reserve_seconds: float = None,
+        clock=None,
+        sleep=None,
+        random_uniform=None,
+    ):
+        self.max_attempts: int = (
+            RETRY_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        )
+        self.base_delay_seconds: float = (
+            RETRY_BASE_DELAY_SECONDS
+            if base_delay_seconds is None
+            else base_delay_seconds
+        )
+        self.max_delay_seconds: float = (
+            RETRY_MAX_DELAY_SECONDS if max_delay_seconds is None else max_delay_seconds
+        )
+        self.deadline: float = deadline
+        self.reserve_seconds: float = (
+            RETRY_RESERVE_SECONDS if reserve_seconds is None else reserve_seconds
+        )
+        self._clock = clock
+        self._sleep = sleep
+        self._random_uniform = random_uniform
+
+    def delay(self, retry: int) -> float:
+        ceiling: float = min(
+            self.max_delay_seconds, self.base_delay_seconds * 2 ** (retry - 1)
+        )
+        return (self._random_uniform or random.uniform)(0, ceiling)
+
+    def wait(self, retry: int) -> bool:
+        # Sleeps before retry number retry, or returns False when it is out of
+        # attempts or time.
+        if retry >= self.max_attempts:
+            return False
+        delay: float = self.delay(retry)
+        if self.deadline is not None:
+            now: float = (self._clock or time.monotonic)()
+            if now + delay + self.reserve_seconds > self.deadline:
+                return False
+        (self._sleep or time.sleep)(delay)
+        return True
+
+
+def call_with_retry(send, policy: RetryPolicy, find_existing=None) -> dict:
+    # send() makes one request and returns Kraken's JSON, raising
+    # RequestException for transport and HTTP errors. After an ambiguous
+    # failure find_existing() looks for what the request would have created
+    # and its result is returned instead of sending again. When that check
+    # fails too, the request is not repeated.
+    retry: int = 0
+    while True:
+        error: RequestException = None
+        try:
+            result: dict = send()
+            outcome: str = classify_result(result)
+        except RequestException as e:
+            error, outcome = e, classify_exception(e)
+        if outcome in (OK, TERMINAL):
+            if error is not None:
+                raise error
+            return result
+        if outcome == AMBIGUOUS and find_existing is not None:
+            existing: dict = find_existing()
+            if existing is not None:
+                return existing
+        retry += 1
+        if not policy.wait(retry):
+            if error is not None:
+                raise error
+            return result
@@ -0,0 +1,305 @@
+import argparse
+import json
+import logging
+import math
+import os
+import random
+import re
+import signal
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger()
+
+# Time each tick gets, reported to the handlers like a Lambda's remaining time.
+SERVICE_TICK_TIMEOUT_SECONDS: float = float(
+    os.environ.get("SERVICE_TICK_TIMEOUT_SECONDS", "60")
+)
+
+RATE_UNITS: dict = {"minute": 60, "hour": 3600, "day": 86400}
+# Fixed, not calendar.month_abbr, which follows the process locale.
+MONTH_NAMES: list = [
+    "",
+    "JAN",
+    "FEB",
+    "MAR",
+    "APR",
+    "MAY",
+    "JUN",
+    "JUL",
+    "AUG",
+    "SEP",
+    "OCT",
+    "NOV",
+    "DEC",
+]
+# EventBridge numbers days of the week from SUN=1.
+DAY_NAMES: list = ["", "SUN", "MON", "TUE", "WED", "THU", "FRI", "SAT"]
+# How far ahead a cron expression is searched for its next match.
+CRON_SEARCH_DAYS: int = 366 * 5
+
+
+def parse_cron_field(text: str, low: int, high: int, names: list = None) -> set:
+    # One field of an EventBridge cron expression: *, ?, values, ranges,
+    # lists and steps, e.g. "1,15", "MON-FRI" or "*/15".
+    values: set = set()
+    for part in text.upper().split(","):
+        step: int = 1
+        if "/" in part:
+            part, step_text = part.split("/")
+            step = int(step_text)
+        if part in ("*", "?"):
+            start, end = low, high
+        elif "-" in part:
+            start, end = (cron_value(bound, names) for bound in part.split("-"))
+        else:
+            start = cron_value(part, names)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"Cron field out of range: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def cron_value(text: str, names: list = None) -> int:
+    if names and text in names:
+        return names.index(text)
+    return int(text)
+
+
+class RateSchedule:
+    def __init__(self, interval_seconds: float):
+        self.interval_seconds: float = interval_seconds
+
+    def next_after(self, now: float, previous: float = None) -> float:
+        # The first run is right away, like a newly created EventBridge rule.
+        if previous is None:
+            return now
+        # After a suspended host or a long tick, missed runs are skipped
+        # rather than replayed back to back.
+        intervals: int = max(math.ceil((now - previous) / self.interval_seconds), 1)
+        if intervals > 1:
+            logger.warning(f"Skipped {intervals - 1} missed runs")
+        return previous + intervals * self.interval_seconds
+
+
+class CronSchedule:
+    # EventBridge cron(minutes hours day-of-month month day-of-week year) in
+    # UTC, one of day-of-month and day-of-week is usually "?".
+    def __init__(self, expression: str):
+        fields: list[str] = expression.split()
+        if len(fields) != 6:
+            raise ValueError(f"Cron expressions have six fields: {expression}")
+        self.minutes: set = parse_cron_field(fields[0], 0, 59)
+        self.hours: set = parse_cron_field(fields[1], 0, 23)
+        self.days: set = parse_cron_field(fields[2], 1, 31)
+        self.months: set = parse_cron_field(fields[3], 1, 12, MONTH_NAMES)
+        self.weekdays: set = parse_cron_field(fields[4], 1, 7, DAY_NAMES)
+        self.years: set = parse_cron_field(fields[5], 1970, 2199)
+        self._any_day: bool = fields[2] in ("*", "?")
+        self._any_weekday: bool = fields[4] in ("*", "?")
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.year not in self.years or day.month not in self.months:
+            return False
+        # datetime counts MON=0, EventBridge SUN=1.
+        weekday: int = (day.weekday() + 1) % 7 + 1
+        if self._any_day:
+            return self._any_weekday or weekday in self.weekdays
+        if self._any_weekday:
+            return day.day in self.days
+        return day.day in self.days and weekday in self.weekdays
+
+    def next_after(self, now: float, previous: float = None) -> float:
+        # The first matching minute after now.
+        start: datetime = datetime.fromtimestamp(now, tz=timezone.utc).replace(
+            second=0, microsecond=0
+        ) + timedelta(minutes=1)
+        day: datetime = start.replace(hour=0, minute=0)
+        for _ in range(CRON_SEARCH_DAYS):
+            if self._day_matches(day):
+                for hour in sorted(self.hours):
+                    for minute in sorted(self.minutes):
+                        candidate: datetime = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate.timestamp()
+            day += timedelta(days=1)
+        raise ValueError("Cron expression has no future runs")
+
+
+def parse_schedule(expression: str):
+    match = re.fullmatch(r"(rate|cron)\((.*)\)", expression.strip())
+    if match is None:
+        raise ValueError(f"Unknown schedule expression: {expression}")
+    kind, body = match.groups()
+    if kind == "cron":
+        return CronSchedule(body)
+    value, unit = body.split()
+    if unit.rstrip("s") not in RATE_UNITS:
+        raise ValueError(f"Unknown rate unit: {unit}")
+    return RateSchedule(int(value) * RATE_UNITS[unit.rstrip("s")])
+
+
+class TickContext:
+    # Stands in for the Lambda context, so deadlines work as in Lambda.
+    def __init__(self, timeout_seconds: float):
+        self.deadline: float = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return int(max(self.deadline - time.monotonic(), 0) * 1000)
+
+
+@dataclass
+class Job:
+    name: str
+    handler: str
+    schedule: str
+    event: dict
+    # A random delay of up to this many minutes is added to every run, like
+    # terraform's random_integer between 23 and 24 hours.
+    jitter_minutes: float = 0
+    next_run: float = None
+    last_run: float = None
+    runs: int = 0
+    last_status: int = None
+    _schedule: object = field(default=None, repr=False)
+    _jitter: float = field(default=0.0, repr=False)
+
+    @property
+    def planned_run(self) -> float:
+        # The next run without its jitter.
+        return None if self.next_run is None else self.next_run - self._jitter
+
+    def schedule_next(self, now: float, random_uniform=None) -> float:
+        if self._schedule is None:
+            self._schedule = parse_schedule(self.schedule)
+        jitter: float = (random_uniform or random.uniform)(0, self.jitter_minutes * 60)
+        # Rates count from the planned time, so jitter does not accumulate.
+        planned: float = self._schedule.next_after(now, self.planned_run)
+        self._jitter = jitter
+        self.next_run = planned + jitter
+        return self.next_run
+
+
+def load_handlers() -> dict:
+    # Imported here so the service only loads what its jobs use.
+    import dca
+    import withdraw
+
+    return {"dca": dca.lambda_handler, "withdraw": withdraw.lambda_handler}
+
+
+class Service:
+    # Runs jobs in one process, so the connection pool, cached credentials,
+    # pair metadata and the WebSocket book survive between ticks.
+    def __init__(
+        self,
+        jobs: list[Job],
+        handlers: dict = None,
+        tick_timeout_seconds: float = None,
+        clock=None,
+        random_uniform=None,
+    ):
+        self.jobs: list[Job] = jobs
+        self.handlers: dict = handlers
+        self.tick_timeout_seconds: float = (
+            SERVICE_TICK_TIMEOUT_SECONDS
+            if tick_timeout_seconds is None
+            else tick_timeout_seconds
+        )
+        self._clock = clock
+        self._random_uniform = random_uniform
+        self.stopped = threading.Event()
+
+    def _now(self) -> float:
+        return (self._clock or time.time)()
+
+    def stop(self, *args) -> None:
+        logger.info("Stopping after the current tick")
+        self.stopped.set()
+
+    def run_job(self, job: Job) -> dict:
+        handler = self.handlers[job.handler]
+        try:
+            # Like EventBridge's event time, the same for every retry of the
+            # tick, so orders can be matched to it. Jitter is left out, so it
+            # is the time the schedule names.
+            response: dict = handler(
+                {"scheduled_at": job.planned_run, **job.event},
+                TickContext(self.tick_timeout_seconds),
+            )
+        except Exception as e:
+            logger.error(f"Job {job.name} failed: {str(e)}")
+            response = {"statusCode": 500}
+        job.runs += 1
+        job.last_run = self._now()
+        job.last_status = (response or {}).get("statusCode")
+        logger.info(f"Job {job.name} finished with status {job.last_status}")
+        return response
+
+    def run(self, max_ticks: int = None) -> None:
+        if self.handlers is None:
+            self.handlers = load_handlers()
+        for job in self.jobs:
+            if job.handler not in self.handlers:
+                raise ValueError(f"Unknown handler for job {job.name}: {job.handler}")
+            job.schedule_next(self._now(), self._random_uniform)
+        ticks: int = 0
+        try:
+            while not self.stopped.is_set():
+                job: Job = min(self.jobs, key=lambda job: job.next_run)
+                wait_seconds: float = job.next_run - self._now()
+                # A stop signal interrupts the wait.
+                if wait_seconds > 0 and self.stopped.wait(wait_seconds):
+                    break
+                self.run_job(job)
+                job.schedule_next(self._now(), self._random_uniform)
+                ticks += 1
+                if max_ticks is not None and ticks >= max_ticks:
+                    break
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        import kraken_client
+        import order_book
+
+        order_book.stop_stream()
+        kraken_client.close_session()
+
+
+def load_jobs(path: str) -> list[Job]:
+    with open(path) as file:
+        config: dict = json.load(file)
+    return [
+        Job(
+            name=job["name"],
+            handler=job.get("handler", "dca"),
+            schedule=job["schedule"],
+            event=job["event"],
+            jitter_minutes=float(job.get("jitter_minutes", 0)),
+        )
+        for job in config["jobs"]
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Run the DCA and withdraw handlers on schedules in one process."
+    )
+    parser.add_argument("config", help="JSON file with a list of jobs")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    service: Service = Service(load_jobs(args.config))
+    signal.signal(signal.SIGTERM, service.stop)
+    signal.signal(signal.SIGINT, service.stop)
+    service.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
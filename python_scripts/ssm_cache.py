@@ -0,0 +1,55 @@
+import os
+import threading
+import time
+
+SSM_CACHE_TTL_SECONDS: float = float(os.environ.get("SSM_CACHE_TTL_SECONDS", "900"))
+# GetParameters accepts at most 10 names per call.
+SSM_GET_PARAMETERS_BATCH_SIZE: int = 10
+
+# Module scope so one client and the decrypted values survive warm invocations.
+_client = None
+_cache: dict[str, tuple[str, float]] = {}
+_lock = threading.Lock()
+
+
+def get_ssm_client():
+    global _client
+    if _client is None:
+        # boto3 is the slowest import in the package, so it is only loaded once
+        # the cache actually has to call SSM.
+        import boto3
+
+        _client = boto3.client("ssm")
+    return _client
+
+
+def get_parameters(
+    names: list[str], ttl_seconds: float = SSM_CACHE_TTL_SECONDS
+) -> dict[str, str]:
+    with _lock:
+        now: float = time.monotonic()
+        missing: list[str] = [
+            name for name in names if name not in _cache or _cache[name][1] <= now
+        ]
+        for start in range(0, len(missing), SSM_GET_PARAMETERS_BATCH_SIZE):
+            response: dict = get_ssm_client().get_parameters(
+                Names=missing[start : start + SSM_GET_PARAMETERS_BATCH_SIZE],
+                WithDecryption=True,
+            )
+            if response.get("InvalidParameters"):
+                raise KeyError(", ".join(response["InvalidParameters"]))
+            for parameter in response["Parameters"]:
+                _cache[parameter["Name"]] = (parameter["Value"], now + ttl_seconds)
+        return {name: _cache[name][0] for name in names}
+
+
+def get_parameter(name: str, ttl_seconds: float = SSM_CACHE_TTL_SECONDS) -> str:
+    return get_parameters([name], ttl_seconds=ttl_seconds)[name]
+
+
+def invalidate(names: list[str] = None) -> None:
+    with _lock:
+        if names is None:
+            _cache.clear()
+        for name in names or []:
+            _cache.pop(name, None)
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import threading
+import pytest
+import dca
+from accounts import account_events, run_accounts
+from kraken_stub_server import StubConfig
+
+PRIVATE_KEY = "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg=="
+
+ACCOUNTS_EVENT: dict = {
+    "currency": "ZAUD",
+    "order_expires": "60",
+    "accounts": [
+        {
+            "name": "main",
+            "private_key_parameter": "main-private",
+            "public_key_parameter": "main-public",
+            "trading_pair": "XBTAUD",
+            "crypto_to_buy": "BTC",
+        },
+        {
+            "name": "sub",
+            "private_key_parameter": "sub-private",
+            "public_key_parameter": "sub-public",
+            "pairs": [{"trading_pair": "ETHAUD", "crypto_to_buy": "ETH"}],
+        },
+    ],
+}
+
+
+def fake_parameters(names, *args, **kwargs):
+    return {
+        name: PRIVATE_KEY if name.endswith("private") else f"key-{name}"
+        for name in names
+    }
+
+
+def test_that_shared_fields_apply_to_every_account():
+    events = account_events(ACCOUNTS_EVENT)
+
+    assert [event["order_expires"] for event in events] == ["60", "60"]
+    assert "accounts" not in events[0]
+    with pytest.raises(KeyError, match="public_key_parameter"):
+        account_events({"accounts": [{"name": "x", "private_key_parameter": "p"}]})
+
+
+def test_that_accounts_run_concurrently():
+    # Each handler waits for the other, so they only finish when run at once.
+    barrier = threading.Barrier(2, timeout=2)
+
+    def handle(event, context):
+        barrier.wait()
+        return {"statusCode": 200, "body": json.dumps({"message": event["name"]})}
+
+    results = asyncio.run(run_accounts([{"name": "a"}, {"name": "b"}], handle))
+
+    assert [(r["account"], r["message"]) for r in results] == [("a", "a"), ("b", "b")]
+
+
+@pytest.mark.enable_socket
+def test_that_every_account_orders_with_its_own_keys(start_stub_server, mocker):
+    server = start_stub_server(StubConfig(bids={"XBTAUD": "50000", "ETHAUD": "2500"}))
+    mocker.patch("dca.get_parameters", side_effect=fake_parameters)
+    get_parameters = mocker.patch(
+        "accounts.get_parameters", side_effect=fake_parameters
+    )
+
+    response = dca.lambda_handler(ACCOUNTS_EVENT, None)
+
+    assert response["statusCode"] == 200
+    results = json.loads(response["body"])["results"]
+    assert [(r["account"], r["statusCode"]) for r in results] == [
+        ("main", 200),
+        ("sub", 200),
+    ]
+    assert get_parameters.call_count == 1
+    assert sorted(order["pair"] for order in server.orders) == ["ETHAUD", "XBTAUD"]
+    assert server.requests_by_path["/0/private/Balance"] == 2
+
+
+def test_that_single_account_runs_do_not_load_asyncio():
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, dca; print('asyncio' in sys.modules)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert loaded.stdout.strip() == "False"
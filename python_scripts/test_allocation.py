@@ -0,0 +1,104 @@
+from datetime import datetime, timezone
+import pytest
+from allocation import allocate, next_deposit
+
+PAIRS = [
+    {"trading_pair": "XBTAUD", "crypto_to_buy": "BTC", "weight": 0.7},
+    {"trading_pair": "ETHAUD", "crypto_to_buy": "ETH", "weight": 0.3},
+]
+PRICES = {"XBTAUD": "50000.0", "ETHAUD": "2500.0"}
+NOW = datetime(2021, 3, 23, 9, 0, tzinfo=timezone.utc).timestamp()
+
+
+def budgets(settings, cash=100.0, balances=None, now=NOW):
+    return [
+        (allocation.budget, allocation.skipped)
+        for allocation in allocate(
+            settings, PAIRS, cash, balances or {"ZAUD": str(cash)}, PRICES, now
+        )
+    ]
+
+
+def test_that_fixed_weights_split_the_whole_balance():
+    assert budgets({}) == [
+        (pytest.approx(70.0), None),
+        (pytest.approx(30.0), None),
+    ]
+
+
+def test_that_rebalancing_buys_the_underweight_pair_first():
+    # 0.003 BTC is 150 AUD, so the target of 0.7 * 300 leaves 60 for BTC.
+    result = budgets(
+        {"strategy": "rebalance"}, balances={"ZAUD": "150", "XXBT": "0.003"}, cash=150
+    )
+
+    assert result == [(pytest.approx(60.0), None), (pytest.approx(90.0), None)]
+
+
+def test_that_rebalancing_skips_a_pair_over_its_target():
+    result = budgets(
+        {"strategy": "rebalance"}, balances={"ZAUD": "100", "XETH": "1"}, cash=100
+    )
+
+    assert result == [(pytest.approx(100.0), None), (0.0, "Nothing to buy")]
+
+
+def test_that_value_averaging_buys_up_to_the_value_path():
+    start = NOW - 2 * 86400
+    # Third run, so holdings should be worth 3 * 100, 210 of it in BTC.
+    result = budgets(
+        {"strategy": "value_averaging", "start": start, "increment": 100},
+        cash=1000,
+        balances={"ZAUD": "1000", "XXBT": "0.004", "XETH": "0.036"},
+    )
+
+    assert result == [
+        (pytest.approx(10.0), None),
+        (pytest.approx(0.0), "Nothing to buy"),
+    ]
+
+
+def test_that_value_averaging_is_capped_by_the_balance():
+    result = budgets(
+        {"strategy": "value_averaging", "start": NOW, "increment": 200}, cash=100
+    )
+
+    assert [budget for budget, _ in result] == [
+        pytest.approx(70.0),
+        pytest.approx(30.0),
+    ]
+
+
+def test_that_spreading_divides_the_balance_by_the_runs_before_the_deposit():
+    # 23 March 09:00 to 1 April is 8 days and 15 hours, so 9 daily runs.
+    result = budgets({"strategy": "spread", "deposit_day": 1}, cash=900)
+
+    assert result == [(pytest.approx(70.0), None), (pytest.approx(30.0), None)]
+    assert next_deposit(
+        datetime(2021, 12, 20, tzinfo=timezone.utc).timestamp(), 15
+    ) == (datetime(2022, 1, 15, tzinfo=timezone.utc).timestamp())
+
+
+def test_that_dip_multipliers_scale_budgets_within_the_balance():
+    allocations = allocate(
+        {}, PAIRS, 100.0, {"ZAUD": "100"}, PRICES, NOW, multipliers={"XBTAUD": 2.0}
+    )
+
+    assert [allocation.budget for allocation in allocations] == [
+        pytest.approx(100 * 140 / 170),
+        pytest.approx(100 * 30 / 170),
+    ]
+
+
+def test_that_budgets_below_the_pair_minimum_are_skipped():
+    result = budgets({}, cash=10)
+
+    assert result[0] == (pytest.approx(7.0), None)
+    assert (
+        result[1][1] == "Volume 0.00120000 is below the ETHAUD minimum order of 0.002"
+    )
+
+
+def test_that_an_unknown_strategy_raises():
+    with pytest.raises(ValueError, match="Unknown allocation strategy"):
+        budgets({"strategy": "martingale"})
@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+import dca
+from backtest import backtest_pair, load_columns, sweep, write_columns
+
+
+def random_candles(count: int, seed: int = 7) -> dict:
+    generator = np.random.default_rng(seed)
+    closes = 50000 * np.exp(np.cumsum(generator.normal(0, 0.002, count)))
+    return {
+        "time": 1616457600 + 60 * np.arange(count, dtype=np.int64),
+        "low": closes * (1 - np.abs(generator.normal(0, 0.001, count))),
+        "close": closes,
+    }
+
+
+def replay_with_dca(columns: dict, order_expires: int, budget: float) -> tuple:
+    # One order per day through dca's own functions, the unfilled balance is
+    # ordered again the next day.
+    times, lows, closes = columns["time"], columns["low"], columns["close"]
+    fills, spent, bought, balance = 0, 0.0, 0.0, 0.0
+    for run in range(int(times[0]), int(times[-1]), 86400):
+        expires = dca.calculate_order_expiration(run, order_expires)
+        if expires >= times[-1]:
+            break
+        balance += budget
+        index = int(np.searchsorted(times, run, side="right")) - 1
+        price, volume = dca.format_order("XBTAUD", balance, float(closes[index]))
+        price, volume = float(price), float(volume)
+        window = lows[(times > times[index]) & (times <= expires)]
+        if len(window) and window.min() < price:
+            fills, spent, bought, balance = (
+                fills + 1,
+                spent + balance,
+                bought + volume,
+                0.0,
+            )
+    return fills, spent, bought
+
+
+@pytest.mark.parametrize("order_expires", [30, 720, 1380])
+def test_that_the_backtest_matches_a_replay_of_the_dca_functions(order_expires):
+    columns = random_candles(60 * 24 * 30)
+
+    # XBTAUD is seeded with pair_decimals 1, lot_decimals 8 and ordermin 0.0001.
+    result = backtest_pair(
+        "XBTAUD",
+        columns,
+        order_expires,
+        budget_per_run=50,
+        pair_decimals=1,
+        lot_decimals=8,
+        ordermin=0.0001,
+    )
+
+    fills, spent, bought = replay_with_dca(columns, order_expires, budget=50)
+    assert result.fills == fills
+    assert result.spent == pytest.approx(spent)
+    assert result.volume == pytest.approx(bought)
+    assert result.cost_basis == pytest.approx(spent / bought)
+    assert result.fees == pytest.approx(spent * 0.0025)
+
+
+def test_that_unfilled_budgets_carry_over_to_the_next_fill():
+    times = 1616457600 + 3600 * np.arange(24 * 4, dtype=np.int64)
+    closes = np.full(len(times), 100.0)
+    lows = closes.copy()
+    # Only the third day trades below the order price.
+    lows[24 * 2 + 5] = 99.0
+
+    result = backtest_pair(
+        "XBTAUD",
+        {"time": times, "low": lows, "close": closes},
+        order_expires=1380,
+        budget_per_run=10,
+    )
+
+    assert (result.runs, result.fills) == (4, 1)
+    assert result.spent == 30
+    assert result.volume == pytest.approx(0.3)
+    assert result.unspent == 10
+
+
+def test_that_budgets_below_ordermin_wait_for_enough_carry_over():
+    times = 1616457600 + 3600 * np.arange(24 * 4, dtype=np.int64)
+    closes = np.full(len(times), 100.0)
+    # Every day trades below the order price.
+    lows = closes - 1
+
+    result = backtest_pair(
+        "XBTAUD",
+        {"time": times, "low": lows, "close": closes},
+        order_expires=1380,
+        budget_per_run=10,
+        ordermin=0.15,
+    )
+
+    assert (result.runs, result.fills) == (4, 2)
+    assert result.volume == pytest.approx(0.4)
+    assert result.unspent == 0
+
+
+def test_that_a_sweep_reads_memory_mapped_columns(tmp_path):
+    columns = random_candles(60 * 24 * 10)
+    csv_path = tmp_path / "XBTAUD_1.csv"
+    csv_path.write_text(
+        "".join(
+            f"{t},{c},{c},{low},{c},1.0,1\n"
+            for t, low, c in zip(columns["time"], columns["low"], columns["close"])
+        )
+    )
+    write_columns(str(csv_path), str(tmp_path / "XBTAUD"))
+
+    results = sweep(str(tmp_path), ["XBTAUD"], [60, 1380], [0.0, 0.5])
+
+    assert isinstance(load_columns(str(tmp_path / "XBTAUD"))["low"], np.memmap)
+    assert [(r.order_expires, r.bid_offset_percent) for r in results] == [
+        (60, 0.0),
+        (60, 0.5),
+        (1380, 0.0),
+        (1380, 0.5),
+    ]
+    assert results[3].fills <= results[2].fills
@@ -0,0 +1,88 @@
+import pytest
+import dca
+from clock_sync import ClockSample, ServerClock
+
+
+class FakeTime:
+    # Kraken runs 100.3 s ahead of the local clock, every Time call takes rtt.
+    def __init__(self, rtt: float = 0.2, offset: float = 100.3):
+        self.now = 1000.0
+        self.rtt = rtt
+        self.offset = offset
+        self.calls = 0
+
+    def clock(self) -> float:
+        return self.now
+
+    def fetch_time(self) -> int:
+        self.calls += 1
+        self.now += self.rtt / 2
+        server = int(self.now + self.offset)
+        self.now += self.rtt / 2
+        return server
+
+
+def make_clock(fake: FakeTime, **settings) -> ServerClock:
+    return ServerClock(
+        fetch_time=fake.fetch_time,
+        clock=fake.clock,
+        monotonic=fake.clock,
+        **settings,
+    )
+
+
+def test_that_server_time_syncs_once_and_then_needs_no_calls():
+    fake = FakeTime()
+    clock = make_clock(fake)
+
+    first = clock.server_time()
+    fake.now += 60
+    second = clock.server_time()
+
+    assert fake.calls == 1
+    assert first == pytest.approx(fake.now - 60 + 100.3, abs=0.7)
+    assert second - first == pytest.approx(60)
+
+
+def test_that_samples_at_different_phases_narrow_the_offset():
+    fake = FakeTime(rtt=0.05)
+    clock = make_clock(fake)
+
+    clock.sync(samples=1)
+    single = clock.uncertainty()
+    for step in (0.25, 0.25, 0.25):
+        fake.now += step
+        clock.sync(samples=1)
+
+    assert clock.uncertainty() < single / 2
+    assert clock.offset() == pytest.approx(100.3, abs=clock.uncertainty())
+
+
+def test_that_drift_and_age_make_the_estimate_stale():
+    fake = FakeTime()
+    clock = make_clock(
+        fake, ttl_seconds=3600, drift_ppm=1000, max_uncertainty_seconds=1
+    )
+
+    clock.server_time()
+    fake.now += 1000
+    clock.server_time()
+    assert fake.calls == 2
+
+    clock = make_clock(fake, ttl_seconds=30)
+    clock.server_time()
+    fake.now += 31
+    clock.server_time()
+    assert fake.calls == 4
+
+
+def test_that_a_stepped_local_clock_restarts_the_estimate():
+    clock = make_clock(FakeTime())
+    clock.add_sample(ClockSample(sent=10.0, received=10.1, server=110))
+    clock.add_sample(ClockSample(sent=11.0, received=11.1, server=211))
+
+    assert clock.offset() == pytest.approx(200.45)
+
+
+def test_that_order_expiry_is_plain_epoch_arithmetic():
+    assert dca.calculate_order_expiration(1616492376.9, "60") == 1616492376 + 59 * 60
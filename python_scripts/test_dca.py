@@ -1,5 +1,17 @@
-from dca import place_limit_order_on_kraken
+import json
+import time
+from types import SimpleNamespace
+import lease
+from dca import (
+    find_order_by_userref,
+    get_bid_prices,
+    lambda_handler,
+    place_limit_order_on_kraken,
+    run_lease_key,
+    scheduled_tick,
+)
 import pytest
+from kraken_stub_server import StubConfig
 
 
 @pytest.mark.parametrize(
@@ -10,18 +22,28 @@ import pytest
             "192.125678723",
             11,
             222.222,
-            "222222",
-            "192.125678",
-            "0.05725418962477259",
+            "222222000",
+            "192.12",
+            "0.05725588",
         ),
         (
             "XXBTZUSD",
             "19200.125678723",
-            0.5,
+            5,
             111.111,
-            "111111",
-            "19200.125678",
-            "2.6041496206085407e-05",
+            "111111000",
+            "19200.1",
+            "0.00026041",
+        ),
+        # Low-priced pairs keep all of their pair_decimals.
+        (
+            "SHIBAUD",
+            "0.0000123456",
+            10,
+            333.333,
+            "333333000",
+            "0.00001234",
+            "810372",
         ),
     ],
 )
@@ -47,12 +69,19 @@ def test_that_calls_to_kraken_endpoints_are_made_with_values_calculated_from_inp
             }
         },
     )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
     mocker.patch("time.time", return_value=current_time)
     place_limit_order_on_kraken(
+        crypto_to_buy="CRYPTO",
+        currency="FIAT",
         trading_pair=trading_pair,
         budget=budget,
         private_key="kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
         public_key="111",
+        order_expires="60",
     )
 
     calls = get_calls_to_responses("POST", "https://api.kraken.com/0/private/AddOrder")
@@ -74,16 +103,16 @@ def test_that_calls_to_kraken_endpoints_are_made_with_values_calculated_from_inp
             11,
             1616492376.594,
             "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
-            "l8th/OmRDGpwfHAoOCIuZF+c9X37krK1KELhRUoEcQU2Si3gHtCY/mPeIgw7saRe1fREa6vfMDIUSEs6ov+fEQ==",
+            "EPvvmE3HftAj2qZohWaadcItYxDms7dbCMQme24GdExiTYu8zeShiXHqXgJR5SD2MEXU1AolXkaHXaDHAWeBEA==",
             "fake111",
         ),
         (
             "XXBTZUSD",
             "19200.125678723",
-            0.5,
+            5,
             1111111111.594,
             "111111/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
-            "HxAjpPcHJZDU3dRdaBtZ312pqV2pD3zaeglYxpmeEjgVUUlJ62m8QQbjjmyVm2X+gc491tCdwKAIW1ACJJxvGA==",
+            "zL0qFFtJQAsfqSlOUmHqsIgJpcC5UalOPaDTfd02nyBouW1UPYAPEDlBRVFzczT4k0WIHbUIV7caj1PqO8tSVA==",
             "fake222",
         ),
     ],
@@ -110,17 +139,461 @@ def test_that_call_to_private_kraken_endpoint_is_made_with_required_auth_headers
             }
         },
     )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
 
     mocker.patch("time.time", return_value=current_time)
 
     place_limit_order_on_kraken(
+        crypto_to_buy="CRYPTO",
+        currency="FIAT",
         trading_pair=trading_pair,
         budget=budget,
         private_key=private_key,
         public_key=public_key,
+        order_expires="60",
     )
 
     calls = get_calls_to_responses("POST", "https://api.kraken.com/0/private/AddOrder")
     assert len(calls) == 1
     assert calls[0].request_headers["API-Key"] == public_key
     assert calls[0].request_headers["API-Sign"] == expected_api_Sign
+
+
+def test_that_lambda_handler_fetches_balance_ticker_and_time_once_before_ordering(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD",
+        json={"result": {"XBTAUD": {"b": ["50000.1234567"]}}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+
+    response = lambda_handler(
+        {
+            "trading_pair": "XBTAUD",
+            "crypto_to_buy": "BTC",
+            "currency": "ZAUD",
+            "order_expires": "60",
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    assert (
+        len(get_calls_to_responses("POST", "https://api.kraken.com/0/private/Balance"))
+        == 1
+    )
+    assert (
+        len(
+            get_calls_to_responses(
+                "GET", "https://api.kraken.com/0/public/Ticker?pair=XBTAUD"
+            )
+        )
+        == 1
+    )
+    assert (
+        len(get_calls_to_responses("GET", "https://api.kraken.com/0/public/Time")) == 1
+    )
+    order_calls = get_calls_to_responses(
+        "POST", "https://api.kraken.com/0/private/AddOrder"
+    )
+    assert len(order_calls) == 1
+    assert order_calls[0].request_urlencoded_body["price"] == ["50000.1"]
+    assert order_calls[0].request_urlencoded_body["expiretm"] == [
+        str(1616492376 + 59 * 60)
+    ]
+
+
+def test_that_batch_event_places_one_order_per_pair_with_weighted_budgets(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD,ETHAUD",
+        json={
+            "result": {"XBTAUD": {"b": ["50000"]}, "ETHAUD": {"b": ["2500"]}},
+            "error": [],
+        },
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+
+    response = lambda_handler(
+        {
+            "currency": "ZAUD",
+            "order_expires": "60",
+            "pairs": [
+                {"trading_pair": "XBTAUD", "crypto_to_buy": "BTC", "weight": 3},
+                {"trading_pair": "ETHAUD", "crypto_to_buy": "ETH", "weight": 1},
+            ],
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    assert (
+        len(get_calls_to_responses("POST", "https://api.kraken.com/0/private/Balance"))
+        == 1
+    )
+    order_calls = get_calls_to_responses(
+        "POST", "https://api.kraken.com/0/private/AddOrder"
+    )
+    assert [call.request_urlencoded_body["pair"] for call in order_calls] == [
+        ["XBTAUD"],
+        ["ETHAUD"],
+    ]
+    assert order_calls[0].request_urlencoded_body["volume"] == ["0.00150000"]
+    assert order_calls[1].request_urlencoded_body["volume"] == ["0.01000000"]
+    assert [
+        result["trading_pair"] for result in json.loads(response["body"])["results"]
+    ] == [
+        "XBTAUD",
+        "ETHAUD",
+    ]
+
+
+def test_that_batch_event_skips_pairs_the_allocation_leaves_out(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100", "XETH": "1.0"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD,ETHAUD",
+        json={
+            "result": {"XBTAUD": {"b": ["50000"]}, "ETHAUD": {"b": ["2500"]}},
+            "error": [],
+        },
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+
+    response = lambda_handler(
+        {
+            "currency": "ZAUD",
+            "order_expires": "60",
+            "allocation": {"strategy": "rebalance"},
+            "pairs": [
+                {"trading_pair": "XBTAUD", "crypto_to_buy": "BTC", "weight": 1},
+                {"trading_pair": "ETHAUD", "crypto_to_buy": "ETH", "weight": 1},
+            ],
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    order_calls = get_calls_to_responses(
+        "POST", "https://api.kraken.com/0/private/AddOrder"
+    )
+    assert [call.request_urlencoded_body["volume"] for call in order_calls] == [
+        ["0.00200000"]
+    ]
+    assert json.loads(response["body"])["results"][1] == {
+        "trading_pair": "ETHAUD",
+        "skipped": "Nothing to buy",
+    }
+
+
+def test_that_a_repeated_event_within_the_cooldown_is_turned_away(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD",
+        json={"result": {"XBTAUD": {"b": ["50000"]}}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+    event = {
+        "trading_pair": "XBTAUD",
+        "crypto_to_buy": "BTC",
+        "currency": "ZAUD",
+        "order_expires": "60",
+        "cooldown_minutes": "60",
+    }
+
+    assert lambda_handler(event, None)["statusCode"] == 200
+    assert lambda_handler(event, None)["statusCode"] == 409
+    assert (
+        len(get_calls_to_responses("POST", "https://api.kraken.com/0/private/AddOrder"))
+        == 1
+    )
+
+
+def test_that_a_queued_batch_is_drained_by_the_run_that_planned_it(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD,ETHAUD",
+        json={
+            "result": {"XBTAUD": {"b": ["50000"]}, "ETHAUD": {"b": ["2500"]}},
+            "error": [],
+        },
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    mocked_responses.replace(
+        "POST",
+        "https://api.kraken.com/0/private/AddOrder",
+        json={"error": [], "result": {"txid": ["OTX"]}},
+    )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+
+    response = lambda_handler(
+        {
+            "currency": "ZAUD",
+            "order_expires": "60",
+            "submit": "queue",
+            "pairs": [
+                {"trading_pair": "XBTAUD", "crypto_to_buy": "BTC", "weight": 3},
+                {"trading_pair": "ETHAUD", "crypto_to_buy": "ETH", "weight": 1},
+            ],
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    order_calls = get_calls_to_responses(
+        "POST", "https://api.kraken.com/0/private/AddOrder"
+    )
+    assert sorted(
+        call.request_urlencoded_body["volume"][0] for call in order_calls
+    ) == [
+        "0.00150000",
+        "0.01000000",
+    ]
+    assert sorted(
+        (result["trading_pair"], result["status"])
+        for result in json.loads(response["body"])["results"]
+    ) == [("ETHAUD", "placed"), ("XBTAUD", "placed")]
+
+
+def test_that_dip_buying_shifts_the_budget_to_the_pair_below_its_average(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD,ETHAUD",
+        json={
+            "result": {"XBTAUD": {"b": ["50000"]}, "ETHAUD": {"b": ["2500"]}},
+            "error": [],
+        },
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    for pair, close in (("XBTAUD", "55000"), ("ETHAUD", "2500")):
+        mocked_responses.get(
+            url=f"https://api.kraken.com/0/public/OHLC?pair={pair}&interval=60",
+            json={
+                "result": {
+                    pair: [
+                        [1616492376 - hours * 3600, "0", "0", "0", close, "0", "0", 0]
+                        for hours in range(24, 0, -1)
+                    ],
+                    "last": 0,
+                },
+                "error": [],
+            },
+        )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+
+    response = lambda_handler(
+        {
+            "currency": "ZAUD",
+            "order_expires": "60",
+            "dip_buying": {},
+            "pairs": [
+                {"trading_pair": "XBTAUD", "crypto_to_buy": "BTC", "weight": 1},
+                {"trading_pair": "ETHAUD", "crypto_to_buy": "ETH", "weight": 1},
+            ],
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    order_calls = get_calls_to_responses(
+        "POST", "https://api.kraken.com/0/private/AddOrder"
+    )
+    assert [call.request_urlencoded_body["volume"] for call in order_calls] == [
+        ["0.00133333"],
+        ["0.01333333"],
+    ]
+
+
+def test_that_ticker_results_under_kraken_pair_names_are_found(mocked_responses):
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=ETHUSD,XBTAUD",
+        json={
+            "result": {"XETHZUSD": {"b": ["2000.5"]}, "XBTAUD": {"b": ["50000.1"]}},
+            "error": [],
+        },
+    )
+
+    assert get_bid_prices(["ETHUSD", "XBTAUD"]) == {
+        "ETHUSD": "2000.5",
+        "XBTAUD": "50000.1",
+    }
+
+
+def test_that_the_tick_comes_from_the_scheduled_time():
+    assert scheduled_tick({"scheduled_at": "2021-03-23T09:00:00Z"}, 5.0) == 1616490000
+    assert scheduled_tick({"scheduled_at": 1616490000.5}, 5.0) == 1616490000
+    assert scheduled_tick({}, 1616492376.594) == 1616492376
+
+
+def test_that_an_order_of_an_earlier_tick_with_the_same_userref_is_ignored(
+    mocked_responses,
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/OpenOrders",
+        json={"result": {"open": {}}, "error": []},
+    )
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/ClosedOrders",
+        json={
+            "result": {"closed": {"OLD": {"opentm": 1616400000.1, "descr": {}}}},
+            "error": [],
+        },
+    )
+
+    assert (
+        find_order_by_userref(
+            7,
+            1616490000,
+            "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "fake123",
+        )
+        is None
+    )
+
+
+RETRIED_EVENT: dict = {
+    "trading_pair": "XBTAUD",
+    "crypto_to_buy": "BTC",
+    "currency": "ZAUD",
+    "order_expires": "60",
+    "scheduled_at": "2021-03-23T09:00:00Z",
+}
+
+
+def time_out_after_placing(event: dict, request_id: str) -> None:
+    # The first attempt placed its order, then the Lambda timed out while it
+    # still held the lease.
+    lease.get_store().acquire(run_lease_key(event), request_id, 120, time.time())
+    place_limit_order_on_kraken(
+        crypto_to_buy="BTC",
+        currency="ZAUD",
+        trading_pair="XBTAUD",
+        budget=100.0,
+        private_key="kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+        public_key="fake123",
+        order_expires="60",
+        bid_price="50000",
+        server_time=time.time(),
+        scheduled_at=scheduled_tick(event, 0),
+    )
+
+
+@pytest.mark.enable_socket
+def test_that_a_retry_after_a_timeout_finds_the_order_instead_of_placing_it_again(
+    start_stub_server,
+):
+    server = start_stub_server(StubConfig(fill_orders=False))
+    time_out_after_placing(RETRIED_EVENT, "request-1")
+
+    response = lambda_handler(
+        RETRIED_EVENT, SimpleNamespace(aws_request_id="request-1")
+    )
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["message"] == "Order already placed"
+    assert len(server.orders) == 1
+    assert server.requests_by_path["/0/private/AddOrder"] == 1
+
+
+@pytest.mark.enable_socket
+def test_that_a_retry_without_a_scheduled_time_places_nothing(start_stub_server):
+    server = start_stub_server(StubConfig(fill_orders=False))
+    event = {
+        key: value for key, value in RETRIED_EVENT.items() if key != "scheduled_at"
+    }
+    time_out_after_placing(event, "request-1")
+
+    response = lambda_handler(event, SimpleNamespace(aws_request_id="request-1"))
+
+    assert response["statusCode"] == 409
+    assert server.requests_by_path["/0/private/AddOrder"] == 1
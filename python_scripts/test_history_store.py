@@ -0,0 +1,119 @@
+import pytest
+from history_store import HistoryStore, sync_table
+
+
+def make_trades(count: int, first_time: int = 1616457600, pair: str = "XBTAUD"):
+    return {
+        f"T{pair}{first_time + index:010d}": {
+            "ordertxid": f"O{index}",
+            "pair": pair,
+            "time": float(first_time + index * 86400),
+            "type": "sell" if index % 10 == 9 else "buy",
+            "ordertype": "limit",
+            "price": "50000.0",
+            "cost": "100.0",
+            "fee": "0.25",
+            "vol": "0.002",
+        }
+        for index in range(count)
+    }
+
+
+class FakeKraken:
+    # Pages like TradesHistory: newest first, start exclusive, end inclusive.
+    def __init__(self, trades: dict):
+        self.trades: dict = trades
+        self.calls: list[dict] = []
+        self.fail_after: int = None
+
+    def __call__(self, params: dict) -> dict:
+        if self.fail_after is not None and len(self.calls) >= self.fail_after:
+            raise ConnectionError("connection reset")
+        self.calls.append(params)
+        matching = sorted(
+            (
+                (trade_id, trade)
+                for trade_id, trade in self.trades.items()
+                if trade["time"] <= params["end"]
+                and ("start" not in params or trade["time"] > params["start"])
+            ),
+            key=lambda item: -item[1]["time"],
+        )
+        page = matching[params["ofs"] : params["ofs"] + 50]
+        return {"count": len(matching), "trades": dict(page)}
+
+
+def empty_ledgers(params: dict) -> dict:
+    return {"count": 0, "ledger": {}}
+
+
+def test_that_a_first_sync_stores_every_page_in_time_order(tmp_path):
+    kraken = FakeKraken(make_trades(120))
+    store = HistoryStore(str(tmp_path))
+
+    added = store.sync(kraken, empty_ledgers, now=2e9)
+
+    assert added == {"trades": 120, "ledgers": 0}
+    assert [call["ofs"] for call in kraken.calls] == [0, 50, 100]
+    times = store.trades.column("time")
+    assert (times[1:] > times[:-1]).all()
+
+
+def test_that_a_resync_only_fetches_new_rows(tmp_path):
+    trades = make_trades(120)
+    kraken = FakeKraken(trades)
+    store = HistoryStore(str(tmp_path))
+    store.sync(kraken, empty_ledgers, now=1616457600 + 119 * 86400)
+    trades.update(make_trades(3, first_time=1616457600 + 119 * 86400 + 1))
+    kraken.calls.clear()
+
+    added = HistoryStore(str(tmp_path)).sync(kraken, empty_ledgers, now=2e9)
+
+    assert added["trades"] == 3
+    assert len(kraken.calls) == 1
+    assert kraken.calls[0]["start"] == 1616457600 + 119 * 86400 - 1
+    assert len(HistoryStore(str(tmp_path)).trades) == 123
+
+
+def test_that_an_interrupted_sync_resumes_from_its_cursor(tmp_path):
+    kraken = FakeKraken(make_trades(120))
+    kraken.fail_after = 2
+    with pytest.raises(ConnectionError):
+        sync_table(HistoryStore(str(tmp_path)).trades, kraken, now=2e9)
+    kraken.fail_after = None
+
+    store = HistoryStore(str(tmp_path))
+    added = sync_table(store.trades, kraken, now=3e9)
+
+    assert added == 120
+    assert [call["ofs"] for call in kraken.calls] == [0, 50, 100]
+    assert {call["end"] for call in kraken.calls} == {2000000000}
+
+
+def test_that_cost_basis_uses_the_pair_index_and_time_range(tmp_path):
+    trades = make_trades(30)
+    trades.update(make_trades(5, first_time=1616457601, pair="ETHAUD"))
+    store = HistoryStore(str(tmp_path))
+    store.sync(FakeKraken(trades), empty_ledgers, now=2e9)
+
+    summary = store.cost_basis("XBTAUD", end=1616457600 + 9 * 86400)
+
+    assert summary["trades"] == 10
+    assert summary["bought"] == pytest.approx(9 * 0.002)
+    assert summary["spent"] == pytest.approx(9 * 100.25)
+    assert summary["average_price"] == pytest.approx(100.25 / 0.002)
+    assert summary["sold"] == pytest.approx(0.002)
+    assert store.cost_basis("ETHAUD")["trades"] == 5
+    assert store.cost_basis("DOTAUD")["trades"] == 0
+
+
+def test_that_uncommitted_appends_are_discarded_on_open(tmp_path):
+    store = HistoryStore(str(tmp_path))
+    store.sync(FakeKraken(make_trades(10)), empty_ledgers, now=2e9)
+    with open(tmp_path / "trades" / "time.bin", "ab") as file:
+        file.write(b"\0" * 8 * 3)
+
+    reopened = HistoryStore(str(tmp_path))
+
+    assert len(reopened.trades.column("time")) == 10
+    assert (tmp_path / "trades" / "time.bin").stat().st_size == 80
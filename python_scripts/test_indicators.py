@@ -0,0 +1,114 @@
+import math
+import numpy as np
+import pytest
+from indicators import (
+    PairIndicators,
+    RollingWindow,
+    Snapshot,
+    budget_multiplier,
+    fetch_ohlc,
+    get_indicators,
+    update_prices,
+)
+
+
+def test_that_the_rolling_window_matches_a_recomputed_window():
+    values = np.random.default_rng(1).normal(100, 10, 500)
+    window = RollingWindow(7)
+
+    for index, value in enumerate(values):
+        window.push(float(value))
+        expected = values[max(index - 6, 0) : index + 1]
+        assert window.sum == pytest.approx(expected.sum())
+        assert window.squares == pytest.approx((expected**2).sum())
+        assert window.minimum() == expected.min()
+        assert window.maximum() == expected.max()
+
+
+def test_that_indicators_match_a_recomputed_window_of_closes():
+    closes = np.random.default_rng(2).lognormal(10, 0.02, 50)
+    pair = PairIndicators(window=10, interval_minutes=60, ema_span=5)
+
+    for hour, close in enumerate(closes):
+        pair.update(hour * 3600, float(close))
+    snapshot = pair.snapshot()
+
+    window = closes[-10:]
+    ema = closes[0]
+    for close in closes[1:]:
+        ema += 2 / 6 * (close - ema)
+    assert snapshot.sma == pytest.approx(window.mean())
+    assert snapshot.ema == pytest.approx(ema)
+    assert snapshot.low == window.min()
+    assert snapshot.high == window.max()
+    assert snapshot.volatility == pytest.approx(np.diff(np.log(window)).std(ddof=1))
+    assert snapshot.samples == 10
+    assert pair.is_warm()
+
+
+def test_that_prices_within_a_candle_revise_its_close():
+    pair = PairIndicators(window=3, interval_minutes=60)
+    pair.update(0, 100.0)
+    pair.update(3600, 110.0)
+    pair.update(3700, 90.0)
+    pair.update(3500, 500.0)
+
+    snapshot = pair.snapshot()
+
+    assert snapshot.price == 90.0
+    assert snapshot.sma == 95.0
+    assert (snapshot.low, snapshot.high) == (90.0, 100.0)
+
+
+def test_that_a_price_below_the_mean_raises_the_budget():
+    snapshot = Snapshot(
+        price=99.0, sma=100.0, ema=100.0, low=95, high=105, volatility=0.02, samples=24
+    )
+
+    assert budget_multiplier(snapshot) == pytest.approx(1 - 0.5 * math.log(0.99) / 0.02)
+    assert budget_multiplier(snapshot, {"max_multiplier": 1.2}) == 1.2
+
+
+def test_that_a_price_above_the_mean_lowers_the_budget_to_its_floor():
+    snapshot = Snapshot(
+        price=120.0, sma=100.0, ema=100.0, low=95, high=120, volatility=0.02, samples=24
+    )
+
+    assert budget_multiplier(snapshot) == 0.5
+
+
+def test_that_the_budget_is_kept_without_a_volatility():
+    assert budget_multiplier(Snapshot(100.0, 100.0, 100.0, 100, 100, None, 1)) == 1.0
+
+
+def test_that_pairs_are_seeded_once_and_again_after_a_missed_candle():
+    fetched = []
+
+    def fetch_candles(pair, interval_minutes):
+        fetched.append((pair, interval_minutes))
+        return [[hour * 3600, "0", "0", "0", "100", "0", "0", 0] for hour in range(30)]
+
+    update_prices({"XBTAUD": "101"}, 29 * 3600 + 10, fetch_candles)
+    update_prices({"XBTAUD": "102"}, 30 * 3600, fetch_candles)
+
+    assert fetched == [("XBTAUD", 60)]
+    assert get_indicators("XBTAUD").snapshot().price == 102.0
+
+    update_prices({"XBTAUD": "103"}, 40 * 3600, fetch_candles)
+
+    assert len(fetched) == 2
+
+
+def test_that_ohlc_candles_are_read_from_the_pair_key(mocked_responses):
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/OHLC?pair=XBTAUD&interval=60",
+        json={
+            "result": {
+                "XXBTZAUD": [[0, "1", "2", "0.5", "1.5", "1", "3", 4]],
+                "last": 0,
+            },
+            "error": [],
+        },
+    )
+
+    assert fetch_ohlc("XBTAUD", 60) == [[0, "1", "2", "0.5", "1.5", "1", "3", 4]]
@@ -0,0 +1,93 @@
+import kraken_client
+from kraken_client import create_session, get_session, public_get, signed_post
+
+
+def test_that_the_same_session_is_reused_across_calls():
+    assert get_session() is get_session()
+
+
+def test_that_a_new_session_is_created_after_closing():
+    first_session = get_session()
+    kraken_client.close_session()
+    assert get_session() is not first_session
+
+
+def test_that_only_get_requests_are_retried_on_server_errors():
+    adapter = create_session(max_retries=3).get_adapter("https://api.kraken.com")
+    assert adapter.max_retries.total == 3
+    assert adapter.max_retries.allowed_methods == frozenset({"GET"})
+    assert 503 in adapter.max_retries.status_forcelist
+
+
+def test_that_public_and_private_calls_share_one_session(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1}, "error": []},
+    )
+    spy = mocker.spy(kraken_client, "create_session")
+    kraken_client.close_session()
+
+    public_get("/0/public/Time")
+    signed_post(
+        "/0/private/AddOrder",
+        {"pair": "XBTAUD"},
+        "fake123",
+        "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+    )
+
+    assert spy.call_count == 1
+    assert (
+        len(get_calls_to_responses("GET", "https://api.kraken.com/0/public/Time")) == 1
+    )
+    assert (
+        len(get_calls_to_responses("POST", "https://api.kraken.com/0/private/AddOrder"))
+        == 1
+    )
+
+
+def test_that_requests_are_sent_with_timeouts(mocked_responses, mocker):
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1}, "error": []},
+    )
+    spy = mocker.spy(get_session(), "request")
+
+    public_get("/0/public/Time")
+
+    assert spy.call_args.kwargs["timeout"] == (
+        kraken_client.CONNECT_TIMEOUT,
+        kraken_client.READ_TIMEOUT,
+    )
+
+
+def test_that_rate_limited_calls_are_resent_with_a_new_nonce_and_signature(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"error": ["EAPI:Rate limit exceeded"]},
+    )
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"error": [], "result": {}},
+    )
+    sleep = mocker.patch("time.sleep")
+
+    response = kraken_client.signed_post(
+        "/0/private/Balance",
+        data={},
+        public_key="fake123",
+        private_key="kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+    )
+
+    assert response.json() == {"error": [], "result": {}}
+    assert sleep.call_count == 1
+    calls = get_calls_to_responses("POST", "https://api.kraken.com/0/private/Balance")
+    assert len(calls) == 2
+    assert (
+        calls[0].request_urlencoded_body["nonce"]
+        != calls[1].request_urlencoded_body["nonce"]
+    )
+    assert calls[0].request_headers["API-Sign"] != calls[1].request_headers["API-Sign"]
@@ -0,0 +1,104 @@
+import json
+import pytest
+import dca
+import kraken_client
+import withdraw
+from kraken_stub_server import StubConfig
+
+pytestmark = pytest.mark.enable_socket
+
+DCA_EVENT: dict = {
+    "trading_pair": "XBTAUD",
+    "crypto_to_buy": "BTC",
+    "currency": "ZAUD",
+    "order_expires": "60",
+}
+
+
+def test_that_a_dca_run_against_the_stub_places_one_order(start_stub_server):
+    server = start_stub_server()
+
+    response = dca.lambda_handler(DCA_EVENT, None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["result"]["txid"] == ["OSTUB0000000000"]
+    assert server.requests_by_path == {
+        "/0/private/Balance": 1,
+        "/0/public/Ticker": 1,
+        "/0/public/Time": 1,
+        "/0/private/AddOrder": 1,
+    }
+    assert server.orders[0]["price"] == "50000.1"
+
+
+def test_that_injected_server_errors_fail_the_run(start_stub_server):
+    start_stub_server(StubConfig(error_rate=1.0, error_status=503))
+
+    response = dca.lambda_handler(DCA_EVENT, None)
+
+    assert response["statusCode"] == 500
+
+
+def test_that_injected_kraken_errors_are_reported(start_stub_server):
+    start_stub_server(StubConfig(error_rate=1.0, error_status=200))
+
+    response = dca.lambda_handler(DCA_EVENT, None)
+
+    assert response["statusCode"] == 400
+    assert "EService:Unavailable" in json.loads(response["body"])["message"]
+
+
+def test_that_private_calls_over_the_rate_limit_are_rejected(start_stub_server, mocker):
+    start_stub_server(StubConfig(rate_limit_per_second=0.001, rate_limit_burst=1))
+    mocker.patch.object(kraken_client, "RATE_LIMIT_RETRIES", 0)
+
+    dca.lambda_handler(DCA_EVENT, None)
+    response = dca.lambda_handler(DCA_EVENT, None)
+
+    assert response["statusCode"] == 400
+    assert "EAPI:Rate limit exceeded" in json.loads(response["body"])["message"]
+
+
+def test_that_calls_in_the_same_microsecond_get_increasing_nonces(
+    start_stub_server, mocker
+):
+    server = start_stub_server()
+    mocker.patch("time.time", return_value=1616492376.594)
+
+    response = dca.lambda_handler(DCA_EVENT, None)
+
+    assert response["statusCode"] == 200
+    assert server.orders[0]["nonce"] == "1616492376594001"
+
+
+def test_that_an_ambiguous_add_order_is_found_instead_of_placed_twice(
+    start_stub_server, mocker
+):
+    server = start_stub_server(StubConfig(ambiguous_add_orders=1))
+    mocker.patch("retry.time.sleep")
+
+    response = dca.lambda_handler(DCA_EVENT, None)
+
+    assert response["statusCode"] == 200
+    assert json.loads(response["body"])["result"]["txid"] == ["OSTUB0000000000"]
+    assert len(server.orders) == 1
+    assert server.requests_by_path["/0/private/AddOrder"] == 1
+    assert server.requests_by_path["/0/private/ClosedOrders"] == 1
+
+
+def test_that_planned_withdrawals_run_against_the_stub(start_stub_server, mocker):
+    server = start_stub_server(StubConfig(balances={"XXBT": "0.5", "ZAUD": "10"}))
+    mocker.patch(
+        "withdraw.get_parameters",
+        return_value={
+            "XXBT-hardwallet": "btc_wallet",
+            "kraken-private-withdraw-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-withdraw-api-key": "fake123",
+        },
+    )
+
+    response = withdraw.lambda_handler({"assets": [{"ticker": "XXBT"}]}, None)
+
+    assert response["statusCode"] == 200
+    assert server.withdrawals[0]["amount"] == "0.5"
+    assert server.requests_by_path["/0/private/WithdrawInfo"] == 1
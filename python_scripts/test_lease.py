@@ -0,0 +1,133 @@
+import pytest
+from lease import (
+    DynamoDBLeaseStore,
+    InMemoryLeaseStore,
+    Lease,
+    LeaseHeld,
+    LeaseLost,
+    ensure_current,
+    hold,
+    reset_store,
+)
+
+
+def test_that_a_held_lease_turns_other_owners_away():
+    store = InMemoryLeaseStore()
+
+    assert store.acquire("key", "a", 60, now=100.0).reacquired is False
+    assert store.acquire("key", "b", 60, now=120.0) is None
+    again = store.acquire("key", "a", 60, now=120.0)
+    assert (again.token, again.reacquired) == (2, True)
+
+
+def test_that_an_expired_lease_is_taken_over_with_a_larger_token():
+    store = InMemoryLeaseStore()
+    first = store.acquire("key", "a", 60, now=100.0)
+
+    second = store.acquire("key", "b", 60, now=161.0)
+
+    assert second.token > first.token
+    assert not store.is_current(first, now=161.0)
+    assert not store.release(first, 161.0)
+    assert store.is_current(second, now=161.0)
+
+
+def test_that_the_dynamodb_store_tells_a_lease_it_already_held(dynamodb_stub):
+    client, stubber = dynamodb_stub
+    stubber.add_response(
+        "update_item",
+        {
+            "Attributes": {
+                "owner": {"S": "a"},
+                "fencing_token": {"N": "3"},
+                "expires_at": {"N": "150"},
+            }
+        },
+    )
+
+    assert DynamoDBLeaseStore("leases", client=client).acquire(
+        "key", "a", 120, now=100.0
+    ) == Lease("key", "a", 4, 220.0, reacquired=True)
+
+
+def test_that_a_clean_run_keeps_the_lease_for_the_cooldown():
+    with hold("key", "a", ttl_seconds=60, cooldown_seconds=300, clock=lambda: 100.0):
+        pass
+
+    with pytest.raises(LeaseHeld):
+        with hold("key", "b", ttl_seconds=60, clock=lambda: 399.0):
+            pass
+    with hold("key", "b", ttl_seconds=60, clock=lambda: 400.0) as held:
+        assert held.owner == "b"
+
+
+def test_that_a_failed_run_releases_the_lease_at_once():
+    with pytest.raises(ValueError):
+        with hold(
+            "key", "a", ttl_seconds=60, cooldown_seconds=300, clock=lambda: 100.0
+        ):
+            raise ValueError("failed")
+
+    with hold("key", "b", ttl_seconds=60, clock=lambda: 100.5) as held:
+        assert held.token == 2
+
+
+def test_that_a_run_stops_once_its_lease_was_taken_over():
+    store = InMemoryLeaseStore()
+    reset_store(store)
+    with hold("key", "a", ttl_seconds=60, clock=lambda: 100.0) as held:
+        store.acquire("key", "b", 60, now=161.0)
+
+        with pytest.raises(LeaseLost):
+            ensure_current(held, clock=lambda: 161.0)
+
+
+def test_that_the_dynamodb_store_returns_the_incremented_token(dynamodb_stub):
+    client, stubber = dynamodb_stub
+    stubber.add_response(
+        "update_item",
+        {
+            "Attributes": {
+                "owner": {"S": "b"},
+                "fencing_token": {"N": "6"},
+                "expires_at": {"N": "90"},
+            }
+        },
+    )
+
+    assert DynamoDBLeaseStore("leases", client=client).acquire(
+        "key", "a", 120, now=100.0
+    ) == Lease("key", "a", 7, 220.0)
+
+
+def test_that_the_dynamodb_store_turns_away_while_another_run_holds_the_key(
+    dynamodb_stub,
+):
+    client, stubber = dynamodb_stub
+    stubber.add_client_error(
+        "update_item", service_error_code="ConditionalCheckFailedException"
+    )
+
+    assert (
+        DynamoDBLeaseStore("leases", client=client).acquire("key", "b", 120, now=100.0)
+        is None
+    )
+
+
+def test_that_the_dynamodb_store_checks_the_token_with_a_consistent_read(
+    dynamodb_stub,
+):
+    client, stubber = dynamodb_stub
+    stubber.add_response(
+        "get_item",
+        {"Item": {"fencing_token": {"N": "8"}, "expires_at": {"N": "300"}}},
+        {
+            "TableName": "leases",
+            "Key": {"lease_key": {"S": "key"}},
+            "ConsistentRead": True,
+        },
+    )
+
+    assert not DynamoDBLeaseStore("leases", client=client).is_current(
+        Lease("key", "a", 7, 220.0), now=150.0
+    )
@@ -0,0 +1,116 @@
+import json
+import pytest
+import metrics
+from dca import lambda_handler
+from kraken_client import public_get
+
+
+@pytest.fixture(autouse=True)
+def no_leftover_invocation():
+    yield
+    metrics.finish_invocation()
+
+
+def test_that_repeated_phases_are_summed(mocker):
+    mocker.patch("time.perf_counter", side_effect=[0.0, 1.0, 1.5, 2.0, 2.25])
+    invocation = metrics.start_invocation("dca")
+
+    with metrics.phase("sign"):
+        pass
+    with metrics.phase("sign"):
+        pass
+
+    assert invocation.phases == {"sign": 750.0}
+
+
+def test_that_phases_outside_an_invocation_are_ignored():
+    with metrics.phase("sign"):
+        pass
+
+    assert metrics.current() is None
+
+
+def test_that_emf_record_declares_every_metric_it_contains():
+    invocation = metrics.start_invocation("dca")
+    with metrics.phase("add_order"):
+        pass
+    metrics.record_request(
+        metrics.RequestRecord(
+            path="/0/private/AddOrder",
+            duration_ms=12.5,
+            status_code=200,
+            retries=1,
+            request_bytes=100,
+            response_bytes=50,
+            errors=["EOrder:Insufficient funds"],
+        )
+    )
+
+    record = invocation.to_emf()
+
+    declared = record["_aws"]["CloudWatchMetrics"][0]
+    assert declared["Dimensions"] == [["Function"]]
+    assert record["Function"] == "dca"
+    for metric in declared["Metrics"]:
+        assert metric["Name"] in record
+    assert record["AddOrderDuration"] >= 0
+    assert record["HttpRetries"] == 1
+    assert record["HttpRequestBytes"] == 100
+    assert record["krakenErrorCodes"] == ["EOrder:Insufficient funds"]
+
+
+def test_that_http_calls_record_status_size_and_kraken_errors(mocked_responses):
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"error": ["EService:Unavailable"]},
+    )
+    invocation = metrics.start_invocation("dca")
+
+    public_get("/0/public/Time")
+
+    assert len(invocation.requests) == 1
+    assert invocation.requests[0].path == "/0/public/Time"
+    assert invocation.requests[0].status_code == 200
+    assert invocation.requests[0].response_bytes > 0
+    assert invocation.requests[0].errors == ["EService:Unavailable"]
+
+
+def test_that_lambda_handler_prints_one_emf_record(mocked_responses, mocker, capsys):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD",
+        json={"result": {"XBTAUD": {"b": ["50000"]}}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+
+    lambda_handler(
+        {
+            "trading_pair": "XBTAUD",
+            "crypto_to_buy": "BTC",
+            "currency": "ZAUD",
+            "order_expires": "60",
+        },
+        None,
+    )
+
+    lines = capsys.readouterr().out.strip().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record["statusCode"] == 200
+    assert record["HttpRequests"] == 4
+    for phase in ("Ssm", "Fetch", "Sign", "AddOrder"):
+        assert f"{phase}Duration" in record
+    assert metrics.current() is None
@@ -0,0 +1,66 @@
+import pytest
+from nonces import (
+    DynamoDBNonceStore,
+    InMemoryNonceStore,
+    NonceGenerator,
+    get_nonce_generator,
+)
+
+
+def test_that_nonces_have_microsecond_resolution():
+    generator = NonceGenerator(clock=lambda: 1616492376.594321)
+
+    assert generator.next() == "1616492376594321"
+
+
+def test_that_nonces_increase_when_the_clock_stands_still():
+    generator = NonceGenerator(clock=lambda: 100.0)
+
+    assert [generator.next() for _ in range(3)] == [
+        "100000000",
+        "100000001",
+        "100000002",
+    ]
+
+
+def test_that_nonces_increase_when_the_clock_goes_backwards():
+    times = iter([100.0, 99.0])
+    generator = NonceGenerator(clock=lambda: next(times))
+
+    assert generator.next() == "100000000"
+    assert generator.next() == "100000001"
+
+
+def test_that_generators_sharing_a_store_never_hand_out_the_same_nonce():
+    store = InMemoryNonceStore()
+    first = NonceGenerator("key", store=store, clock=lambda: 100.0)
+    second = NonceGenerator("key", store=store, clock=lambda: 100.0)
+
+    handed_out = [first.next(), second.next(), first.next(), second.next()]
+
+    assert handed_out == sorted(handed_out, key=int)
+    assert len(set(handed_out)) == 4
+
+
+def test_that_generators_are_kept_per_key():
+    assert get_nonce_generator("a") is get_nonce_generator("a")
+    assert get_nonce_generator("a") is not get_nonce_generator("b")
+
+
+def test_that_the_dynamodb_store_keeps_a_nonce_ahead_of_the_table(dynamodb_stub):
+    client, stubber = dynamodb_stub
+    stubber.add_response("update_item", {})
+
+    assert DynamoDBNonceStore("nonces", client=client).reserve("key", 500) == 500
+
+
+def test_that_the_dynamodb_store_increments_when_another_invocation_is_ahead(
+    dynamodb_stub,
+):
+    client, stubber = dynamodb_stub
+    stubber.add_client_error(
+        "update_item", service_error_code="ConditionalCheckFailedException"
+    )
+    stubber.add_response("update_item", {"Attributes": {"nonce": {"N": "901"}}})
+
+    assert DynamoDBNonceStore("nonces", client=client).reserve("key", 500) == 901
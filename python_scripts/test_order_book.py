@@ -0,0 +1,133 @@
+import time
+import zlib
+import pytest
+import dca
+import order_book
+from order_book import BookStream, ChecksumMismatch, OrderBook
+
+SNAPSHOT: dict = {
+    "as": [
+        ["50010.10000", "0.50000000", "1616492376.1"],
+        ["50020.00000", "1.25000000", "1616492376.2"],
+    ],
+    "bs": [
+        ["50000.10000", "0.10000000", "1616492376.3"],
+        ["49990.00000", "2.00000000", "1616492376.4"],
+    ],
+}
+
+
+def wait_for(condition, timeout_seconds: float = 2) -> None:
+    deadline: float = time.monotonic() + timeout_seconds
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.005)
+
+
+def test_that_the_checksum_covers_asks_then_bids_without_dots_or_leading_zeros():
+    book = OrderBook()
+    book.apply_snapshot(SNAPSHOT["as"], SNAPSHOT["bs"])
+
+    # Each level is price then volume, e.g. "50010.10000" becomes "5001010000".
+    expected_text: str = (
+        "5001010000"
+        "50000000"
+        "5002000000"
+        "125000000"
+        "5000010000"
+        "10000000"
+        "4999000000"
+        "200000000"
+    )
+    assert book.checksum() == zlib.crc32(expected_text.encode())
+
+
+def test_that_updates_change_delete_and_truncate_levels():
+    book = OrderBook(depth=2)
+    book.apply_snapshot(SNAPSHOT["as"], SNAPSHOT["bs"])
+
+    book.apply_update(
+        asks=[["50010.10000", "0.00000000", "1"]],
+        bids=[["50005.00000", "0.30000000", "1"], ["49995.00000", "1.0", "1"]],
+    )
+
+    assert book.best_ask() == "50020.00000"
+    assert book.best_bid() == "50005.00000"
+    assert set(book.bids) == {"50005.00000", "50000.10000"}
+
+
+def test_that_a_wrong_checksum_marks_the_book_stale():
+    book = OrderBook()
+    book.apply_snapshot(SNAPSHOT["as"], SNAPSHOT["bs"])
+
+    with pytest.raises(ChecksumMismatch):
+        book.apply_update([], [["50001.00000", "1.00000000", "1"]], checksum="1")
+
+    assert not book.is_fresh()
+
+
+def test_that_split_ask_and_bid_payloads_are_applied_together():
+    stream = BookStream({"XBTAUD": "XBT/AUD"})
+    stream.handle_message([1, SNAPSHOT, "book-10", "XBT/AUD"])
+    book = stream.books["XBTAUD"]
+    expected = OrderBook()
+    expected.apply_snapshot(SNAPSHOT["as"], SNAPSHOT["bs"])
+    expected.apply_update(
+        [["50015.00000", "1.00000000", "1"]], [["50001.00000", "1.00000000", "1"]]
+    )
+
+    stream.handle_message(
+        [
+            1,
+            {"a": [["50015.00000", "1.00000000", "1"]]},
+            {"b": [["50001.00000", "1.00000000", "1"]], "c": str(expected.checksum())},
+            "book-10",
+            "XBT/AUD",
+        ]
+    )
+
+    assert book.best_ask() == "50010.10000"
+    assert book.best_bid() == "50001.00000"
+
+
+def test_that_stale_books_are_not_used_for_pricing():
+    now: list[float] = [100.0]
+    stream = BookStream({"XBTAUD": "XBT/AUD"}, clock=lambda: now[0])
+    stream.handle_message([1, SNAPSHOT, "book-10", "XBT/AUD"])
+
+    assert stream.best_bids(["XBTAUD"]) == {"XBTAUD": "50000.10000"}
+    now[0] += order_book.BOOK_MAX_AGE_SECONDS + 1
+    assert stream.best_bids(["XBTAUD"]) is None
+
+
+def test_that_dca_prices_come_from_a_fresh_streamed_book(mocker, mocked_responses):
+    stream = BookStream({"XBTAUD": "XBT/AUD"})
+    stream.handle_message(
+        [1, {"as": [], "bs": [["50000.1234567", "1.0", "1"]]}, "book-10", "XBT/AUD"]
+    )
+    mocker.patch.object(order_book, "_stream", stream)
+
+    assert dca.get_bid_prices(["XBTAUD"]) == {"XBTAUD": "50000.1234567"}
+    assert len(mocked_responses.calls) == 0
+
+
+@pytest.mark.enable_socket
+def test_that_the_stream_follows_a_local_kraken_websocket():
+    from kraken_ws_stub_server import KrakenWsStubServer
+
+    with KrakenWsStubServer({"XBT/AUD": SNAPSHOT}) as server:
+        stream = BookStream({"XBTAUD": "XBT/AUD"}, url=server.url).start()
+        try:
+            assert stream.wait_until_ready(timeout_seconds=2)
+            assert stream.best_bids(["XBTAUD"]) == {"XBTAUD": "50000.10000"}
+
+            server.send_heartbeat()
+            server.publish("XBT/AUD", bids=[["50003.00000", "0.20000000", "2"]])
+            wait_for(lambda: stream.books["XBTAUD"].best_bid() == "50003.00000")
+
+            # A corrupted update forces a new subscription and snapshot.
+            server.publish("XBT/AUD", bids=[["50004.0", "0.1", "3"]], checksum="1")
+            wait_for(lambda: server.subscriptions == 2)
+            wait_for(lambda: stream.best_bids(["XBTAUD"]) is not None)
+        finally:
+            stream.stop()
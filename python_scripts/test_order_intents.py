@@ -0,0 +1,301 @@
+import threading
+import time
+import boto3
+import pytest
+from botocore.stub import Stubber
+from kraken_client import RequestException
+from order_intents import (
+    DEAD_LETTERED,
+    EXPIRED,
+    PLACED,
+    REQUEUED,
+    InMemoryIntentQueue,
+    Message,
+    OrderIntent,
+    SQSIntentQueue,
+    WorkerPool,
+    outcome_status,
+)
+
+
+def make_intent(trading_pair="XBTAUD", public_key_parameter="public", **fields):
+    return OrderIntent(
+        **{
+            "trading_pair": trading_pair,
+            "crypto_to_buy": "BTC",
+            "currency": "ZAUD",
+            "budget": 100.0,
+            "price": "50000.0",
+            "volume": "0.00200000",
+            "expires_at": 1000,
+            "planned_at": 100.0,
+            "userref": 7,
+            "scheduled_at": 0,
+            "key_parameters": ["private", public_key_parameter],
+            **fields,
+        }
+    )
+
+
+def placed(intent, deadline, redelivered):
+    return {"error": [], "result": {"txid": [f"{intent.trading_pair}-TX"]}}
+
+
+def test_that_intents_survive_a_round_trip_through_json():
+    intent = make_intent(price_policy="bid")
+
+    assert OrderIntent.from_json(intent.to_json()) == intent
+    assert intent.intent_id == "XBTAUD:7"
+    assert intent.deadline == 1000.0
+
+
+def test_that_unknown_price_policies_are_rejected():
+    with pytest.raises(ValueError):
+        make_intent(price_policy="market")
+
+
+def test_that_a_requeued_intent_is_hidden_for_the_retry_delay():
+    now = [0.0]
+    queue = InMemoryIntentQueue(clock=lambda: now[0])
+    queue.send([make_intent()])
+    (message,) = queue.receive(10)
+
+    queue.retry(message, 60)
+
+    assert queue.receive(10) == []
+    now[0] = 60.0
+    (redelivered,) = queue.receive(10)
+    assert redelivered.receive_count == 2
+
+
+def test_that_the_pool_reports_an_outcome_per_intent():
+    queue = InMemoryIntentQueue()
+    queue.send([make_intent("XBTAUD"), make_intent("ETHAUD", userref=8)])
+
+    outcomes = WorkerPool(queue, placed, server_clock=lambda: 500.0).drain()
+
+    assert sorted(outcome["trading_pair"] for outcome in outcomes) == [
+        "ETHAUD",
+        "XBTAUD",
+    ]
+    assert all(outcome["status"] == PLACED for outcome in outcomes)
+    assert len(queue) == 0
+    assert outcome_status(outcomes) == (200, "Orders placed successfully")
+
+
+def test_that_intents_past_their_deadline_are_dropped():
+    queue = InMemoryIntentQueue()
+    queue.send([make_intent(deadline=400.0)])
+
+    outcomes = WorkerPool(queue, placed, server_clock=lambda: 500.0).drain()
+
+    assert outcomes == [
+        {"intent_id": "XBTAUD:7", "trading_pair": "XBTAUD", "status": EXPIRED}
+    ]
+
+
+def test_that_an_outage_requeues_the_intent_until_it_is_dead_lettered():
+    now = [0.0]
+    queue = InMemoryIntentQueue(max_receives=2, clock=lambda: now[0])
+    queue.send([make_intent()])
+    redelivered = []
+
+    def unavailable(intent, deadline, was_redelivered):
+        redelivered.append(was_redelivered)
+        raise RequestException("Connection refused")
+
+    pool = WorkerPool(
+        queue, unavailable, retry_delay_seconds=60, server_clock=lambda: 500.0
+    )
+
+    assert [outcome["status"] for outcome in pool.drain()] == [REQUEUED]
+    now[0] = 60.0
+    assert [outcome["status"] for outcome in pool.drain()] == [DEAD_LETTERED]
+    assert redelivered == [False, True]
+    assert queue.dead_letters[0]["reason"] == "Connection refused"
+
+
+def test_that_intents_left_in_the_queue_fail_the_run():
+    queue = InMemoryIntentQueue()
+    queue.send([make_intent()])
+
+    def unavailable(intent, deadline, redelivered):
+        raise RequestException("Connection refused")
+
+    outcomes = WorkerPool(queue, unavailable, server_clock=lambda: 500.0).drain()
+
+    assert queue.pending() == 1
+    assert outcome_status(outcomes, queue.pending()) == (
+        503,
+        "1 intents left in the queue",
+    )
+    assert outcome_status([], 2) == (503, "2 intents left in the queue")
+    assert outcome_status([{"status": PLACED}], 1)[0] == 207
+
+
+def test_that_rejected_intents_are_dead_lettered_at_once():
+    queue = InMemoryIntentQueue()
+    queue.send([make_intent()])
+
+    outcomes = WorkerPool(
+        queue,
+        lambda intent, deadline, redelivered: {"error": ["EOrder:Insufficient funds"]},
+        server_clock=lambda: 500.0,
+    ).drain()
+
+    assert outcomes[0]["status"] == DEAD_LETTERED
+    assert outcome_status(outcomes) == (400, "All intents failed")
+
+
+def test_that_an_unexpected_error_requeues_the_intent_and_keeps_the_others():
+    queue = InMemoryIntentQueue(max_receives=2)
+    queue.send([make_intent("XBTAUD"), make_intent("ETHAUD", userref=8)])
+
+    def submit(intent, deadline, redelivered):
+        if intent.trading_pair == "XBTAUD":
+            raise KeyError("txid")
+        return placed(intent, deadline, redelivered)
+
+    outcomes = WorkerPool(
+        queue, submit, retry_delay_seconds=0, server_clock=lambda: 500.0
+    ).drain()
+
+    assert sorted(outcome["status"] for outcome in outcomes) == [
+        DEAD_LETTERED,
+        PLACED,
+        REQUEUED,
+    ]
+    assert queue.dead_letters[0]["intent"]["trading_pair"] == "XBTAUD"
+
+
+def test_that_the_drain_goes_on_after_an_empty_receive():
+    queue = InMemoryIntentQueue()
+    receives = []
+    receive = queue.receive
+
+    def receive_late(max_messages, wait_seconds=0):
+        receives.append(wait_seconds)
+        if len(receives) == 1:
+            queue.send([make_intent()])
+            return []
+        return receive(max_messages, wait_seconds)
+
+    queue.receive = receive_late
+
+    outcomes = WorkerPool(
+        queue, placed, wait_seconds=2, server_clock=lambda: 500.0
+    ).drain()
+
+    assert [outcome["status"] for outcome in outcomes] == [PLACED]
+    assert receives == [2, 2, 2, 2]
+
+
+def test_that_the_long_poll_ends_before_the_deadline(mocker):
+    mocker.patch("retry.RETRY_RESERVE_SECONDS", 3.0)
+    queue = mocker.Mock(receive=mocker.Mock(return_value=[]))
+
+    WorkerPool(queue, placed, wait_seconds=20, clock=lambda: 0.0).drain(deadline=8.5)
+
+    queue.receive.assert_called_with(4, wait_seconds=5)
+
+
+def test_that_intents_for_one_key_are_submitted_one_at_a_time():
+    active: dict = {}
+    overlapped: dict = {}
+    lock = threading.Lock()
+
+    def submit(intent, deadline, redelivered):
+        key = intent.key_parameters[1]
+        with lock:
+            active[key] = active.get(key, 0) + 1
+            overlapped[key] = max(overlapped.get(key, 0), active[key])
+        time.sleep(0.02)
+        with lock:
+            active[key] -= 1
+        return placed(intent, deadline, redelivered)
+
+    queue = InMemoryIntentQueue()
+    queue.send(
+        [
+            make_intent("XBTAUD", "a", userref=1),
+            make_intent("ETHAUD", "a", userref=2),
+            make_intent("XBTAUD", "b", userref=3),
+            make_intent("ETHAUD", "b", userref=4),
+        ]
+    )
+
+    WorkerPool(queue, submit, workers=4, server_clock=lambda: 500.0).drain()
+
+    assert overlapped == {"a": 1, "b": 1}
+
+
+@pytest.fixture
+def sqs_stub():
+    client = boto3.client("sqs", region_name="us-east-1")
+    with Stubber(client) as stubber:
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def test_that_the_sqs_queue_reads_the_receive_count(sqs_stub):
+    client, stubber = sqs_stub
+    intent = make_intent()
+    stubber.add_response(
+        "receive_message",
+        {
+            "Messages": [
+                {
+                    "Body": intent.to_json(),
+                    "ReceiptHandle": "receipt",
+                    "Attributes": {"ApproximateReceiveCount": "2"},
+                }
+            ]
+        },
+        {
+            "QueueUrl": "queue-url",
+            "MaxNumberOfMessages": 4,
+            "WaitTimeSeconds": 2,
+            "AttributeNames": ["ApproximateReceiveCount"],
+        },
+    )
+
+    (message,) = SQSIntentQueue("queue-url", client=client).receive(4, 2)
+
+    assert message.intent == intent
+    assert message.receive_count == 2
+    assert message.receipt == "receipt"
+
+
+def test_that_the_sqs_queue_moves_failed_intents_to_the_dead_letter_queue(sqs_stub):
+    client, stubber = sqs_stub
+    stubber.add_response("send_message", {})
+    stubber.add_response(
+        "delete_message", {}, {"QueueUrl": "queue-url", "ReceiptHandle": "receipt"}
+    )
+    queue = SQSIntentQueue("queue-url", "dead-letter-url", client=client)
+
+    queue.dead_letter(Message(make_intent(), 3, "receipt"), "rejected")
+
+
+def test_that_the_sqs_queue_counts_hidden_and_delayed_intents_as_pending(sqs_stub):
+    client, stubber = sqs_stub
+    stubber.add_response(
+        "get_queue_attributes",
+        {
+            "Attributes": {
+                "ApproximateNumberOfMessages": "1",
+                "ApproximateNumberOfMessagesNotVisible": "2",
+                "ApproximateNumberOfMessagesDelayed": "0",
+            }
+        },
+        {
+            "QueueUrl": "queue-url",
+            "AttributeNames": [
+                "ApproximateNumberOfMessages",
+                "ApproximateNumberOfMessagesNotVisible",
+                "ApproximateNumberOfMessagesDelayed",
+            ],
+        },
+    )
+
+    assert SQSIntentQueue("queue-url", client=client).pending() == 3
@@ -0,0 +1,196 @@
+import pytest
+import metrics
+import order_tracker
+from dca import lambda_handler, reconcile_tracked_orders
+from order_tracker import InMemoryOrderStore, JsonFileOrderStore, OrderTracker
+
+
+def closed(volume: str, opentm: float, closetm: float) -> dict:
+    return {
+        "status": "closed",
+        "opentm": opentm,
+        "closetm": closetm,
+        "vol": volume,
+        "vol_exec": volume,
+        "price": "100.0",
+    }
+
+
+@pytest.mark.parametrize("store_type", ["memory", "file"])
+def test_that_reconcile_updates_open_orders_from_one_query(store_type, tmp_path):
+    store = (
+        InMemoryOrderStore()
+        if store_type == "memory"
+        else JsonFileOrderStore(str(tmp_path / "orders.json"))
+    )
+    tracker = OrderTracker(store)
+    tracker.record(["OA"], "XBTAUD", "0.002", "50000", submitted_at=1000)
+    tracker.record(["OB"], "XBTAUD", "0.002", "50000", submitted_at=2000)
+    queries: list = []
+
+    def query_orders(txids):
+        queries.append(txids)
+        return {
+            "OA": closed("0.002", 1000, 1600),
+            "OB": {"status": "expired", "vol": "0.002", "vol_exec": "0.001"},
+        }
+
+    tracker.reconcile(query_orders)
+
+    assert queries == [["OA", "OB"]]
+    assert tracker.open_txids() == []
+    assert tracker.fill_rate() == pytest.approx(0.75)
+    assert tracker.times_to_fill() == [600]
+
+
+def test_that_reconcile_skips_finished_and_new_orders():
+    tracker = OrderTracker(InMemoryOrderStore())
+    tracker.record(["OLD"], "XBTAUD", "1", "100", submitted_at=1000)
+    tracker.record(["NEW"], "XBTAUD", "1", "100", submitted_at=2000)
+    tracker.reconcile(lambda txids: {"OLD": closed("1", 1000, 1010)})
+    queries: list = []
+
+    tracker.reconcile(lambda txids: queries.append(txids) or {}, submitted_before=2000)
+
+    assert queries == []
+    assert tracker.open_txids() == ["NEW"]
+
+
+def test_that_only_orders_finished_before_the_cutoff_are_forgotten():
+    tracker = OrderTracker(InMemoryOrderStore())
+    tracker.record(["OLD", "RECENT", "OPEN"], "XBTAUD", "1", "100", submitted_at=0)
+    tracker.reconcile(
+        lambda txids: {"OLD": closed("1", 0, 1000), "RECENT": closed("1", 0, 3000)}
+    )
+
+    assert tracker.forget_finished(finished_before=2000) == 1
+    assert [order.txid for order in tracker.get(["OLD", "RECENT", "OPEN"])] == [
+        "RECENT",
+        "OPEN",
+    ]
+    assert tracker.forget_finished() == 1
+
+
+def test_that_an_empty_store_leaves_open_orders_unknown(mocker):
+    query_orders = mocker.patch("dca.query_orders")
+    order_tracker.get_tracker().record(["ONEW"], "XBTAUD", "1", "1", 100)
+    invocation = metrics.start_invocation("dca")
+    try:
+        reconcile_tracked_orders("private", "public", submitted_before=100)
+    finally:
+        metrics.finish_invocation()
+
+    query_orders.assert_not_called()
+    assert invocation.properties["openOrders"] is None
+
+
+def test_that_reconcile_queries_at_most_fifty_txids_at_a_time():
+    tracker = OrderTracker(InMemoryOrderStore())
+    tracker.record([f"O{i}" for i in range(120)], "XBTAUD", "1", "100", 1000)
+    queries: list = []
+
+    tracker.reconcile(lambda txids: queries.append(txids) or {})
+
+    assert [len(txids) for txids in queries] == [50, 50, 20]
+
+
+def test_that_the_handler_records_orders_and_reconciles_earlier_ones(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    tracker = order_tracker.get_tracker()
+    tracker.record(["OEXPIRED"], "XBTAUD", "0.002", "49000", submitted_at=0)
+    tracker.reconcile(
+        lambda txids: {"OEXPIRED": dict(closed("0", 0, 60), status="expired")}
+    )
+    tracker.record(["OPREVIOUS"], "XBTAUD", "0.002", "49000", submitted_at=1616488776)
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD",
+        json={"result": {"XBTAUD": {"b": ["50000"]}}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    mocked_responses.replace(
+        "POST",
+        "https://api.kraken.com/0/private/AddOrder",
+        json={"error": [], "result": {"txid": ["ONEW"]}},
+    )
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/QueryOrders",
+        json={"error": [], "result": {"OPREVIOUS": closed("0.002", 0, 1616489376)}},
+    )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+
+    response = lambda_handler(
+        {
+            "trading_pair": "XBTAUD",
+            "crypto_to_buy": "BTC",
+            "currency": "ZAUD",
+            "order_expires": "60",
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    query_calls = get_calls_to_responses(
+        "POST", "https://api.kraken.com/0/private/QueryOrders"
+    )
+    assert len(query_calls) == 1
+    assert query_calls[0].request_urlencoded_body["txid"] == ["OPREVIOUS"]
+    assert tracker.open_txids() == ["ONEW"]
+    assert tracker.median_time_to_fill() == 600
+    # Past the retention period, the expired order is forgotten.
+    assert [order.txid for order in tracker.get(["OEXPIRED", "OPREVIOUS"])] == [
+        "OPREVIOUS"
+    ]
+
+
+def test_that_a_failed_reconcile_does_not_fail_the_order(mocked_responses, mocker):
+    order_tracker.get_tracker().record(["OPREVIOUS"], "XBTAUD", "1", "1", 0)
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"ZAUD": "100"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Ticker?pair=XBTAUD",
+        json={"result": {"XBTAUD": {"b": ["50000"]}}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/QueryOrders",
+        json={"error": ["EService:Unavailable"]},
+    )
+    mocker.patch(
+        "dca.get_parameters",
+        return_value={
+            "kraken-private-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-api-key": "fake123",
+        },
+    )
+
+    response = lambda_handler(
+        {
+            "trading_pair": "XBTAUD",
+            "crypto_to_buy": "BTC",
+            "currency": "ZAUD",
+            "order_expires": "60",
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    assert order_tracker.get_tracker().open_txids() == ["OPREVIOUS"]
@@ -0,0 +1,71 @@
+import pytest
+import pair_metadata
+from pair_metadata import PairInfo, PairMetadataCache, format_price, format_volume
+
+XBTAUD = PairInfo("XBTAUD", 1, 8, "0.0001", "0.5", wsname="XBT/AUD")
+ASSET_PAIRS_URL = "https://api.kraken.com/0/public/AssetPairs"
+
+
+def asset_pairs_result() -> dict:
+    return {
+        "error": [],
+        "result": {
+            "XXBTZAUD": {
+                "altname": "XBTAUD",
+                "wsname": "XBT/AUD",
+                "pair_decimals": 1,
+                "lot_decimals": 8,
+                "ordermin": "0.0001",
+                "costmin": "0.5",
+                "tick_size": "0.1",
+            }
+        },
+    }
+
+
+def test_that_prices_and_volumes_round_down_to_the_pair_decimals():
+    assert format_price("50000.19", XBTAUD) == "50000.1"
+    assert format_price(0.3, PairInfo("X", 5, 8, "1", tick_size="0.00002")) == (
+        "0.30000"
+    )
+    assert format_price("0.30003", PairInfo("X", 5, 8, "1", tick_size="0.00002")) == (
+        "0.30002"
+    )
+    # 100 / 30000.1 is 0.0033333222..., a float division would print more digits.
+    assert format_volume(100, "30000.1", XBTAUD) == "0.00333332"
+
+
+def test_that_orders_below_the_pair_minimums_are_rejected():
+    with pytest.raises(ValueError, match="minimum order of 0.0001"):
+        format_volume(4, "50000.1", XBTAUD)
+    with pytest.raises(ValueError, match="minimum of 5"):
+        format_volume(4, "10.0", PairInfo("DOTAUD", 4, 8, "0.1", "5"))
+
+
+def test_that_asset_pairs_are_fetched_once_and_persisted_with_a_ttl(
+    mocked_responses, tmp_path
+):
+    mocked_responses.get(ASSET_PAIRS_URL, json=asset_pairs_result())
+    now = [1000.0]
+    path = str(tmp_path / "pairs.json")
+    cache = PairMetadataCache(path=path, ttl_seconds=60, clock=lambda: now[0])
+
+    assert cache.get_pairs(["XBTAUD"])["XBTAUD"].tick_size == "0.1"
+    assert cache.get_pairs(["XBTAUD"])["XBTAUD"].key == "XXBTZAUD"
+    cache.get_pairs(["XBTAUD"])
+    # A new process reads the file instead of calling AssetPairs.
+    reloaded = PairMetadataCache(path=path, ttl_seconds=60, clock=lambda: now[0])
+    assert reloaded.get_pairs(["XBTAUD"])["XBTAUD"].wsname == "XBT/AUD"
+    assert len(mocked_responses.calls) == 1
+
+    now[0] += 60
+    reloaded.get_pairs(["XBTAUD"])
+    assert len(mocked_responses.calls) == 2
+
+
+def test_that_unknown_pairs_raise(mocked_responses):
+    mocked_responses.get(ASSET_PAIRS_URL, json=asset_pairs_result())
+    pair_metadata.reset_cache(PairMetadataCache(path=""))
+
+    with pytest.raises(ValueError, match="Unknown asset pairs: DOGEAUD"):
+        pair_metadata.get_pairs(["XBTAUD", "DOGEAUD"])
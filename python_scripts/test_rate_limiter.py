@@ -0,0 +1,147 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+import pytest
+import rate_limiter
+from kraken_client import RateLimitWaitTooLong, signed_post
+from rate_limiter import DecayingCounter, KeyRateLimiter, WaitTooLong
+
+
+class FakeClock:
+    def __init__(self):
+        self.now: float = 0.0
+        self.sleeps: list[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_that_calls_within_the_maximum_do_not_wait(clock):
+    counter = DecayingCounter(15, 0.33, clock=clock, sleep=clock.sleep)
+
+    for _ in range(15):
+        counter.acquire(1, max_wait_seconds=60)
+
+    assert clock.sleeps == []
+
+
+def test_that_calls_over_the_maximum_wait_for_the_counter_to_decay(clock):
+    counter = DecayingCounter(2, 0.5, clock=clock, sleep=clock.sleep)
+
+    for _ in range(4):
+        counter.acquire(1, max_wait_seconds=60)
+
+    assert clock.sleeps == [2.0, 2.0]
+
+
+def test_that_the_counter_decays_between_calls(clock):
+    counter = DecayingCounter(2, 0.5, clock=clock, sleep=clock.sleep)
+    counter.acquire(2, max_wait_seconds=60)
+
+    clock.now += 4
+
+    assert counter.value == 0
+    counter.acquire(1, max_wait_seconds=60)
+    assert clock.sleeps == []
+
+
+def test_that_a_call_over_the_wait_cap_is_refused_without_queueing(clock):
+    counter = DecayingCounter(1, 0.1, clock=clock, sleep=clock.sleep)
+    counter.acquire(1, max_wait_seconds=3)
+
+    with pytest.raises(WaitTooLong):
+        counter.acquire(1, max_wait_seconds=3)
+
+    assert clock.sleeps == []
+    assert counter.value == 1
+
+
+def test_that_order_calls_use_a_trading_counter_per_pair(clock):
+    limiter = KeyRateLimiter("starter", clock=clock, sleep=clock.sleep)
+
+    for _ in range(60):
+        limiter.acquire("/0/private/AddOrder", pair="XBTAUD")
+    limiter.acquire("/0/private/AddOrder", pair="ETHAUD")
+
+    assert limiter.rest.value == 0
+    assert limiter.trading_counter("XBTAUD").value == 60
+    assert limiter.trading_counter("ETHAUD").value == 1
+    assert clock.sleeps == []
+
+
+def test_that_history_calls_cost_two_points(clock):
+    limiter = KeyRateLimiter("starter", clock=clock, sleep=clock.sleep)
+
+    limiter.acquire("/0/private/TradesHistory")
+    limiter.acquire("/0/private/Balance")
+
+    assert limiter.rest.value == 3
+
+
+def test_that_a_rate_limit_error_makes_the_next_call_wait(clock):
+    limiter = KeyRateLimiter("pro", clock=clock, sleep=clock.sleep)
+
+    limiter.record_rate_limited("/0/private/Balance")
+    limiter.acquire("/0/private/Balance", max_wait_seconds=60)
+
+    assert clock.sleeps == [1.0]
+
+
+def test_that_limiters_are_kept_per_key():
+    assert rate_limiter.get_limiter("a") is rate_limiter.get_limiter("a")
+    assert rate_limiter.get_limiter("a") is not rate_limiter.get_limiter("b")
+
+
+PRIVATE_KEY = "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg=="
+
+
+def test_that_private_calls_are_paced_by_the_key_limiter(mocked_responses, mocker):
+    mocker.patch("kraken_client.RATE_LIMIT_RETRIES", 0)
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"error": ["EAPI:Rate limit exceeded"]},
+    )
+    signed_post("/0/private/Balance", {}, "k", PRIVATE_KEY)
+
+    assert rate_limiter.get_limiter("k").rest.value > 14
+
+
+def test_that_a_signed_call_over_the_wait_cap_is_not_sent(mocked_responses):
+    counter = rate_limiter.get_limiter("k").trading_counter("XBTAUD")
+    counter.saturate()
+    # Callers already queued for a minute's worth of points.
+    counter.reserve(counter.decay_per_second * 60)
+
+    with pytest.raises(RateLimitWaitTooLong):
+        signed_post("/0/private/AddOrder", {"pair": "XBTAUD"}, "k", PRIVATE_KEY)
+
+    assert len(mocked_responses.calls) == 0
+
+
+def test_that_nonces_are_sent_in_the_order_they_are_taken(mocked_responses):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"error": [], "result": {}},
+    )
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(
+                lambda _: signed_post("/0/private/Balance", {}, "k", PRIVATE_KEY),
+                range(16),
+            )
+        )
+
+    nonces = [
+        int(parse_qs(call.request.body.decode())["nonce"][0])
+        for call in mocked_responses.calls
+    ]
+    assert nonces == sorted(nonces)
@@ -0,0 +1,170 @@
+import pytest
+import dca
+import order_tracker
+from kraken_stub_server import StubConfig
+from repricer import ChasedOrder, Repricer, chase_ceiling, chase_price
+
+pytestmark = pytest.mark.enable_socket
+
+PRIVATE_KEY: str = (
+    "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg=="
+)
+
+
+class FakeClock:
+    def __init__(self, server, bids: list[str]):
+        self.now: float = 0.0
+        self.server = server
+        self.bids: list[str] = list(bids)
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        # The market moves while the repricer waits.
+        self.now += seconds
+        if self.bids:
+            self.server.config.bids["XBTAUD"] = self.bids.pop(0)
+
+
+def place_open_order(server, price: str = "50000", volume: str = "0.002") -> str:
+    response = dca.place_limit_order_on_kraken(
+        crypto_to_buy="BTC",
+        currency="ZAUD",
+        trading_pair="XBTAUD",
+        budget=float(price) * float(volume),
+        private_key=PRIVATE_KEY,
+        public_key="fake123",
+        order_expires="60",
+        bid_price=price,
+        server_time=1616492376,
+        post_only=True,
+    )
+    return response["result"]["txid"][0]
+
+
+def chased_order(txid: str, price: str = "50000", max_chase_percent=1.0):
+    (tracked,) = order_tracker.get_tracker().get([txid])
+    return ChasedOrder(
+        txid=txid,
+        pair="XBTAUD",
+        budget=100.0,
+        price=price,
+        volume="0.002",
+        ceiling=chase_ceiling(price, max_chase_percent),
+        expires_at=1616495916,
+        userref=tracked.userref,
+        scheduled_at=tracked.scheduled_at,
+    )
+
+
+def make_repricer(clock: FakeClock, method: str = "edit") -> Repricer:
+    return Repricer(
+        private_key=PRIVATE_KEY,
+        public_key="fake123",
+        fetch_bids=dca.get_bid_prices,
+        query_orders=lambda txids: dca.query_orders(txids, PRIVATE_KEY, "fake123"),
+        format_order=dca.format_order,
+        method=method,
+        place_order=lambda order, price, volume: dca.place_replacement_order(
+            order, price, volume, PRIVATE_KEY, "fake123"
+        ),
+        interval_seconds=1,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+
+def test_that_the_chase_price_is_capped_at_the_ceiling():
+    assert chase_price("100.5", chase_ceiling("100", 1.0)) == "100.5"
+    assert chase_price("102", chase_ceiling("100", 1.0)) == "101.0"
+
+
+@pytest.mark.parametrize("method", ["edit", "replace"])
+def test_that_an_open_order_follows_the_bid_up_to_the_ceiling(
+    start_stub_server, method
+):
+    server = start_stub_server(StubConfig(fill_orders=False, bids={"XBTAUD": "50000"}))
+    order = chased_order(place_open_order(server))
+    clock = FakeClock(server, bids=["50100", "50100", "51000"])
+
+    make_repricer(clock, method).run([order], deadline=3)
+
+    assert order.repriced == 2
+    assert order.price == "50500.0"
+    assert order.volume == dca.format_order("XBTAUD", 100.0, "50500.0")[1]
+    assert [o["status"] for o in server.orders] == ["canceled", "canceled", "open"]
+    assert all(o["oflags"] == "fciq,post" for o in server.orders)
+    assert len({o["userref"] for o in server.orders}) == 1
+    assert server.requests_by_path["/0/private/QueryOrders"] == 3
+
+
+def test_that_a_replacement_lost_to_a_gateway_error_is_found_by_its_userref(
+    start_stub_server,
+):
+    server = start_stub_server(StubConfig(fill_orders=False, bids={"XBTAUD": "50000"}))
+    order = chased_order(place_open_order(server))
+    server.config.ambiguous_add_orders = 1
+    clock = FakeClock(server, bids=["50100"])
+
+    make_repricer(clock, "replace").run([order], deadline=1)
+
+    assert [o["status"] for o in server.orders] == ["canceled", "open"]
+    assert server.requests_by_path["/0/private/AddOrder"] == 2
+    assert order.txid == server.orders[1]["txid"]
+    assert order.replaced_txids == [server.orders[0]["txid"]]
+
+
+def test_that_replacing_needs_a_way_to_place_orders():
+    with pytest.raises(ValueError):
+        Repricer(PRIVATE_KEY, "fake123", None, None, None, method="replace")
+
+
+def test_that_filled_orders_are_not_chased(start_stub_server):
+    server = start_stub_server(StubConfig(fill_orders=True, bids={"XBTAUD": "50000"}))
+    order = chased_order(place_open_order(server))
+    clock = FakeClock(server, bids=["50100"])
+
+    make_repricer(clock).run([order], deadline=10)
+
+    assert order.status == "closed"
+    assert order.repriced == 0
+    assert server.requests_by_path["/0/private/QueryOrders"] == 1
+    assert "/0/private/EditOrder" not in server.requests_by_path
+
+
+def test_that_a_post_only_rejection_stops_the_chase(start_stub_server):
+    server = start_stub_server(StubConfig(fill_orders=False, bids={"XBTAUD": "50000"}))
+    order = chased_order(place_open_order(server))
+    repricer = make_repricer(FakeClock(server, bids=[]))
+    # The bid has dropped back by the time the edit reaches the book.
+    repricer.fetch_bids = lambda pairs: {"XBTAUD": "50100"}
+
+    repricer.run([order], deadline=10)
+
+    assert order.chasing is False
+    assert order.repriced == 0
+    assert server.requests_by_path["/0/private/EditOrder"] == 1
+    assert server.orders[0]["status"] == "open"
+
+
+def test_that_a_reprice_event_places_post_only_orders(
+    start_stub_server,
+):
+    server = start_stub_server(StubConfig(fill_orders=False, bids={"XBTAUD": "50000"}))
+
+    response = dca.lambda_handler(
+        {
+            "trading_pair": "XBTAUD",
+            "crypto_to_buy": "BTC",
+            "currency": "ZAUD",
+            "order_expires": "60",
+            "reprice": {"window_seconds": 0.05, "interval_seconds": 0.01},
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    assert server.orders[0]["oflags"] == "fciq,post"
+    assert server.requests_by_path["/0/private/QueryOrders"] >= 1
+    assert order_tracker.get_tracker().open_txids() == ["OSTUB0000000000"]
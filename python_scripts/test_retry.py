@@ -0,0 +1,118 @@
+import pytest
+import requests
+from retry import RetryPolicy, call_with_retry, classify_exception
+
+
+class Calls:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.count = 0
+
+    def __call__(self):
+        self.count += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+def policy(**settings) -> RetryPolicy:
+    settings.setdefault("sleep", lambda seconds: None)
+    return RetryPolicy(**settings)
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+
+def test_that_retryable_kraken_errors_are_sent_again():
+    send = Calls(
+        {"error": ["EService:Unavailable"]},
+        {"error": ["EAPI:Invalid nonce"]},
+        {"error": [], "result": {"txid": ["O1"]}},
+    )
+
+    assert call_with_retry(send, policy())["result"] == {"txid": ["O1"]}
+    assert send.count == 3
+
+
+def test_that_terminal_errors_are_returned_without_retrying():
+    send = Calls({"error": ["EOrder:Insufficient funds"]})
+
+    assert call_with_retry(send, policy()) == {"error": ["EOrder:Insufficient funds"]}
+    assert send.count == 1
+
+
+def test_that_an_ambiguous_failure_returns_the_existing_order():
+    send = Calls(requests.ReadTimeout())
+    existing = {"error": [], "result": {"txid": ["O1"]}}
+
+    assert call_with_retry(send, policy(), find_existing=lambda: existing) == existing
+    assert send.count == 1
+
+
+def test_that_an_ambiguous_failure_is_resent_when_nothing_was_placed():
+    send = Calls(http_error(502), {"error": [], "result": {"txid": ["O2"]}})
+
+    result = call_with_retry(send, policy(), find_existing=lambda: None)
+
+    assert result["result"]["txid"] == ["O2"]
+
+
+def test_that_the_last_error_is_raised_once_out_of_attempts():
+    send = Calls(*[requests.ConnectTimeout()] * 3)
+
+    with pytest.raises(requests.ConnectTimeout):
+        call_with_retry(send, policy(max_attempts=3))
+    assert send.count == 3
+
+
+def test_that_no_retry_starts_past_the_deadline():
+    send = Calls({"error": ["EService:Busy"]}, {"error": []})
+    sleeps = []
+
+    result = call_with_retry(
+        send,
+        policy(
+            deadline=10.0,
+            reserve_seconds=2,
+            clock=lambda: 9.0,
+            sleep=sleeps.append,
+        ),
+    )
+
+    assert result == {"error": ["EService:Busy"]}
+    assert sleeps == []
+
+
+def test_that_the_default_reserve_fits_a_whole_attempt():
+    # A retry 8 s before a Lambda timeout could take connect and read timeouts.
+    send = Calls({"error": ["EService:Busy"]}, {"error": []})
+
+    result = call_with_retry(send, policy(deadline=10.0, clock=lambda: 2.0))
+
+    assert result == {"error": ["EService:Busy"]}
+    assert send.count == 1
+
+
+def test_that_backoff_is_jittered_up_to_an_exponential_cap():
+    ceilings = []
+    backoff = policy(
+        base_delay_seconds=0.25,
+        max_delay_seconds=1,
+        random_uniform=lambda low, high: ceilings.append(high) or high,
+    )
+
+    for retry in range(1, 5):
+        backoff.delay(retry)
+
+    assert ceilings == [0.25, 0.5, 1, 1]
+
+
+def test_that_only_refused_connections_and_4xx_are_not_ambiguous():
+    assert classify_exception(requests.ConnectTimeout()) == "retryable"
+    assert classify_exception(requests.ReadTimeout()) == "ambiguous"
+    assert classify_exception(http_error(503)) == "ambiguous"
+    assert classify_exception(http_error(403)) == "terminal"
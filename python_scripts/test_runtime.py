@@ -0,0 +1,29 @@
+import os
+import re
+
+ROOT: str = os.path.join(os.path.dirname(__file__), "..")
+
+
+def test_that_the_lambda_runtime_matches_the_pipfile():
+    # The handlers use 3.10 syntax and asyncio.to_thread, so the deployed
+    # runtime has to be the one the tests run on.
+    with open(os.path.join(ROOT, "terraform", "lambda.tf")) as file:
+        runtimes = re.findall(r'^\s*runtime = "python(.*)"', file.read(), re.M)
+    with open(os.path.join(ROOT, "Pipfile")) as file:
+        (python_version,) = re.findall(r'python_version = "(.*)"', file.read())
+
+    assert runtimes == [python_version]
+
+
+def test_that_the_lambda_shares_leases_through_a_dynamodb_table():
+    # Without the table leases, and with them the cooldown, only cover one
+    # sandbox.
+    with open(os.path.join(ROOT, "terraform", "lambda.tf")) as file:
+        (table,) = re.findall(
+            r"^\s*LEASE_TABLE = aws_dynamodb_table\.(\w+)\.name", file.read(), re.M
+        )
+    with open(os.path.join(ROOT, "terraform", "dynamodb.tf")) as file:
+        tables = file.read()
+
+    assert f'resource "aws_dynamodb_table" "{table}"' in tables
+    assert 'hash_key       = "lease_key"' in tables
@@ -0,0 +1,114 @@
+from datetime import datetime, timezone
+import pytest
+from service import CronSchedule, Job, Service, TickContext, parse_schedule
+
+
+def utc(*args) -> float:
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize(
+    "expression, now, expected",
+    [
+        # The first of the month at 09:00, as the withdraw rule in eventbridge.tf.
+        ("cron(0 9 1 * ? *)", utc(2021, 3, 23, 12), utc(2021, 4, 1, 9)),
+        ("cron(0 9 1 * ? *)", utc(2021, 4, 1, 8, 59, 30), utc(2021, 4, 1, 9)),
+        ("cron(*/15 * * * ? *)", utc(2021, 3, 23, 12, 7), utc(2021, 3, 23, 12, 15)),
+        ("cron(30 8 ? * MON-FRI *)", utc(2021, 3, 26, 9), utc(2021, 3, 29, 8, 30)),
+        ("cron(0 0 ? DEC 1 *)", utc(2021, 3, 23), utc(2021, 12, 5)),
+    ],
+)
+def test_that_cron_expressions_find_their_next_run(expression, now, expected):
+    assert parse_schedule(expression).next_after(now) == expected
+
+
+def test_that_rates_run_at_once_then_every_interval():
+    schedule = parse_schedule("rate(23 hours)")
+
+    assert schedule.next_after(100.0) == 100.0
+    assert schedule.next_after(5000.0, previous=100.0) == 100.0 + 23 * 3600
+
+
+def test_that_missed_rate_runs_are_skipped(caplog):
+    schedule = parse_schedule("rate(1 hour)")
+
+    assert schedule.next_after(100.0 + 3.5 * 3600, previous=100.0) == 100.0 + 4 * 3600
+    assert "Skipped 3 missed runs" in caplog.text
+
+
+def test_that_invalid_schedules_raise():
+    with pytest.raises(ValueError):
+        parse_schedule("every day")
+    with pytest.raises(ValueError):
+        CronSchedule("0 25 * * ? *")
+
+
+def test_that_jitter_does_not_accumulate_between_rate_runs():
+    job = Job("dca", "dca", "rate(60 minutes)", {}, jitter_minutes=10)
+
+    first = job.schedule_next(0.0, random_uniform=lambda low, high: high)
+    second = job.schedule_next(first, random_uniform=lambda low, high: 0.0)
+
+    assert (first, second) == (600.0, 3600.0)
+
+
+def test_that_jobs_are_scheduled_at_their_planned_time_without_jitter():
+    now = [utc(2021, 3, 23, 12)]
+    events = []
+    service = Service(
+        [Job("dca", "dca", "cron(30 12 * * ? *)", {}, jitter_minutes=10)],
+        handlers={"dca": lambda event, context: events.append(event) or service.stop()},
+        clock=lambda: now[0],
+        random_uniform=lambda low, high: high,
+    )
+    service.stopped.wait = lambda seconds: now.__setitem__(0, now[0] + seconds)
+
+    service.run()
+
+    assert events == [{"scheduled_at": utc(2021, 3, 23, 12, 30)}]
+    assert now[0] == utc(2021, 3, 23, 12, 40)
+
+
+def test_that_the_service_runs_due_jobs_with_a_deadline_context():
+    now = [utc(2021, 3, 23, 12)]
+    calls = []
+
+    def handle(event, context):
+        calls.append((event["name"], context.get_remaining_time_in_millis()))
+        now[0] += 60
+        return {"statusCode": 200}
+
+    service = Service(
+        [
+            Job("hourly", "dca", "rate(1 hour)", {"name": "hourly"}),
+            Job("withdraw", "withdraw", "cron(30 12 * * ? *)", {"name": "withdraw"}),
+        ],
+        handlers={"dca": handle, "withdraw": handle},
+        tick_timeout_seconds=30,
+        clock=lambda: now[0],
+    )
+    service.stopped.wait = lambda seconds: now.__setitem__(0, now[0] + seconds)
+
+    service.run(max_ticks=4)
+
+    assert [name for name, _ in calls] == ["hourly", "withdraw", "hourly", "hourly"]
+    assert all(25000 < remaining <= 30000 for _, remaining in calls)
+    assert service.jobs[0].runs == 3
+    assert service.jobs[1].last_status == 200
+
+
+def test_that_a_stop_ends_the_service_before_the_next_tick():
+    calls = []
+    service = Service(
+        [Job("dca", "dca", "rate(1 minute)", {})],
+        handlers={"dca": lambda event, context: calls.append(1) or service.stop()},
+    )
+
+    service.run()
+
+    assert calls == [1]
+
+
+def test_that_the_tick_context_counts_down():
+    assert TickContext(0).get_remaining_time_in_millis() == 0
+    assert 9000 < TickContext(10).get_remaining_time_in_millis() <= 10000
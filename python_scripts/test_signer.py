@@ -0,0 +1,68 @@
+import pytest
+from urllib.parse import urlencode
+from signer import KrakenSigner, get_signer, urlencode_body
+
+PRIVATE_KEY: str = (
+    "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg=="
+)
+
+
+@pytest.mark.parametrize(
+    "api_path, data, expected_body, expected_api_sign",
+    [
+        (
+            "/0/private/Balance",
+            {"nonce": "88880000"},
+            b"nonce=88880000",
+            "r1+x1ojiC9HCERFzs4vipXbrbM6IUG5s5OQMfL9Kld8rScsWsaoLwgbQcNh21TdQZpo06XgX+htsUbQGUYaIAg==",
+        ),
+        (
+            "/0/private/AddOrder",
+            {
+                "nonce": "1616492376594000",
+                "ordertype": "limit",
+                "pair": "ETHUSD",
+                "price": "192.125678",
+                "type": "buy",
+                "volume": "0.05725418962477259",
+                "oflags": "fciq",
+                "timeinforce": "GTD",
+                "expiretm": 1616495916,
+            },
+            b"nonce=1616492376594000&ordertype=limit&pair=ETHUSD&price=192.125678"
+            b"&type=buy&volume=0.05725418962477259&oflags=fciq&timeinforce=GTD"
+            b"&expiretm=1616495916",
+            "Kh5Gq73ygNsmbefL+sY3lK71tpuWbRIvwk4ATWsyXnrXqibwGDAbLx4OueciRzUL3npZT9eylyR8RGZzDQrCWA==",
+        ),
+    ],
+)
+def test_that_the_signature_covers_exactly_the_posted_body(
+    api_path, data, expected_body, expected_api_sign
+):
+    body, api_sign = KrakenSigner(PRIVATE_KEY).sign_request(api_path, data)
+
+    assert body == expected_body
+    assert api_sign == expected_api_sign
+
+
+def test_that_signing_twice_gives_the_same_signature():
+    signer = KrakenSigner(PRIVATE_KEY)
+
+    first = signer.sign("/0/private/Balance", b"nonce=1", "1")
+
+    assert signer.sign("/0/private/Balance", b"nonce=1", "1") == first
+
+
+def test_that_one_signer_is_kept_per_private_key():
+    assert get_signer(PRIVATE_KEY) is get_signer(PRIVATE_KEY)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        {"nonce": "1", "oflags": "fciq,post", "cl_ord_id": "a b+c/d"},
+        {"nonce": 2, "amount": 0.5, "key": "my wallet é"},
+    ],
+)
+def test_that_bodies_match_urllib_urlencode(data):
+    assert urlencode_body(data) == urlencode(data).encode()
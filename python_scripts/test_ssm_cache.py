@@ -0,0 +1,98 @@
+import os
+import subprocess
+import sys
+import boto3
+import pytest
+from botocore.stub import Stubber
+import ssm_cache
+from ssm_cache import get_parameter, get_parameters, invalidate
+
+
+@pytest.fixture
+def ssm_stub(monkeypatch):
+    client = boto3.client("ssm", region_name="us-east-1")
+    monkeypatch.setattr(ssm_cache, "_client", client)
+    monkeypatch.setattr(ssm_cache, "_cache", {})
+    with Stubber(client) as stubber:
+        yield stubber
+        stubber.assert_no_pending_responses()
+
+
+def add_get_parameters_response(stubber, values: dict, invalid: list = None):
+    response: dict = {
+        "Parameters": [
+            {"Name": name, "Value": value, "Type": "SecureString"}
+            for name, value in values.items()
+        ]
+    }
+    if invalid:
+        response["InvalidParameters"] = invalid
+    stubber.add_response(
+        "get_parameters",
+        response,
+        {"Names": list(values) + (invalid or []), "WithDecryption": True},
+    )
+
+
+def test_that_several_parameters_are_fetched_in_one_batch(ssm_stub):
+    add_get_parameters_response(ssm_stub, {"private": "abc", "public": "def"})
+
+    assert get_parameters(["private", "public"]) == {
+        "private": "abc",
+        "public": "def",
+    }
+
+
+def test_that_cached_parameters_are_not_fetched_again(ssm_stub):
+    add_get_parameters_response(ssm_stub, {"private": "abc"})
+
+    get_parameter("private")
+
+    assert get_parameter("private") == "abc"
+
+
+def test_that_expired_parameters_are_fetched_again(ssm_stub, mocker):
+    add_get_parameters_response(ssm_stub, {"private": "abc"})
+    add_get_parameters_response(ssm_stub, {"private": "rotated"})
+    monotonic = mocker.patch("time.monotonic", return_value=100.0)
+
+    get_parameter("private", ttl_seconds=60)
+    monotonic.return_value = 161.0
+
+    assert get_parameter("private", ttl_seconds=60) == "rotated"
+
+
+def test_that_invalidated_parameters_are_fetched_again(ssm_stub):
+    add_get_parameters_response(ssm_stub, {"private": "abc", "public": "def"})
+    add_get_parameters_response(ssm_stub, {"private": "rotated"})
+
+    get_parameters(["private", "public"])
+    invalidate(["private"])
+
+    assert get_parameters(["private", "public"]) == {
+        "private": "rotated",
+        "public": "def",
+    }
+
+
+def test_that_missing_parameters_raise_key_error(ssm_stub):
+    add_get_parameters_response(ssm_stub, {"private": "abc"}, invalid=["public"])
+
+    with pytest.raises(KeyError):
+        get_parameters(["private", "public"])
+
+
+def test_that_importing_the_handlers_does_not_import_boto3():
+    output: str = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, dca, withdraw; print('boto3' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    ).stdout
+
+    assert output.strip() == "False"
@@ -1,12 +1,13 @@
+import json
 import pytest
-from withdraw import withdraw_crypto_from_kraken
+from withdraw import decide_withdrawal, lambda_handler, withdraw_crypto_from_kraken
 
 
 @pytest.mark.parametrize(
     "current_time, expected_nonce, asset_to_withdraw, withdrawal_address_key, current_balance",
     [
-        (111.111, "111111", "XXBTZ", "btc_hardwallet", "44.44"),
-        (222.222, "222222", "ETH", "eth_hardwallet", "55.55"),
+        (111.111, "111111000", "XXBTZ", "btc_hardwallet", "44.44"),
+        (222.222, "222222000", "ETH", "eth_hardwallet", "55.55"),
     ],
 )
 def test_that_calls_to_kraken_balance_and_withdraw_endpoints_are_made_with_values_calculated_from_inputs(
@@ -42,7 +43,10 @@ def test_that_calls_to_kraken_balance_and_withdraw_endpoints_are_made_with_value
         "POST", "https://api.kraken.com/0/private/Withdraw"
     )
     assert len(withdraw_calls) == 1
-    assert withdraw_calls[0].request_urlencoded_body["nonce"] == [expected_nonce]
+    # Both calls happen in the same microsecond, the second nonce still grows.
+    assert withdraw_calls[0].request_urlencoded_body["nonce"] == [
+        str(int(expected_nonce) + 1)
+    ]
     assert withdraw_calls[0].request_urlencoded_body["asset"] == [asset_to_withdraw]
     assert withdraw_calls[0].request_urlencoded_body["key"] == [withdrawal_address_key]
     assert withdraw_calls[0].request_urlencoded_body["amount"] == [current_balance]
@@ -114,13 +118,13 @@ def test_that_calls_to_kraken_balance_and_withdraw_endpoints_are_made_with_diffe
             88.88,
             "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
             "fake333",
-            "bR2T+AbzdsepTMgJXnA8TInMDmqGvy6P+LmXdwmfjrdKj9b6HsJcAoNO4AZj4vn+NNZ72JITjgCTt1jhZonTxg==",
+            "r1+x1ojiC9HCERFzs4vipXbrbM6IUG5s5OQMfL9Kld8rScsWsaoLwgbQcNh21TdQZpo06XgX+htsUbQGUYaIAg==",
         ),
         (
             99.99,
             "111111/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
             "fake444",
-            "+xvi2JFr0s1f34mfyjXDYDj3YyXj3ZSvdIrGiCZolqwEes3zlGfhz+zKVlZvunalMtiE/6QNrxHkW73UGjM7oQ==",
+            "TifN6yCVoLRlKRnkLgswFg8k3IRz/eq6HOUCavBO33XJksxIuUrWatXNwqdVxJaVtnOkkD8t7dfDUr3LXejdbg==",
         ),
     ],
 )
@@ -164,7 +168,7 @@ def test_that_call_to_balances_endpoint_is_made_with_required_auth_headers(
             "BTC",
             "my_BTC_wallet",
             "44.44",
-            "JPWHyzVIOvQnbKdUwelvbAD0UxTz9sONLzRDeQhyZUQwEdzYu+qPG2t2dd4A3lziQq6zTOAcD90TjPOz2xf2VA==",
+            "H2vlzjoFmUc3KsbBRfZATHC7KpW1I3Fh+5HQzaeFH7sVrrokhOdB/xydJ2N0PJEKcZzB3hPsKIlSwsmjJbclxA==",
         ),
         (
             "fake222",
@@ -173,7 +177,7 @@ def test_that_call_to_balances_endpoint_is_made_with_required_auth_headers(
             "ETH",
             "my_ETH_wallet",
             "55.55",
-            "hiN7gz73W52QgY/m382VYLjuhFpLe78MgeQygig9DAze4xIztu8bi0spfDCjZFIkLIoSq2WHHSMMKeSahxLTaA==",
+            "8DMyHFOQ6h8+dGW4dk+gALuRALkQ25Dn6Z6jVt0WOjqXeQ0wkzYQmASHmfmrdshemy5nxPMVj5xgv0dQcgq8dQ==",
         ),
     ],
 )
@@ -209,3 +213,98 @@ def test_that_call_to_withdraw_endpoint_is_made_with_required_auth_headers(
     assert len(withdrawal_calls) == 1
     assert withdrawal_calls[0].request_headers["API-Key"] == public_key
     assert withdrawal_calls[0].request_headers["API-Sign"] == expected_api_sign
+
+
+@pytest.mark.parametrize(
+    "asset_settings, balance, fee, withdraws",
+    [
+        ({"ticker": "XXBT", "min_amount": "0.05"}, "0.06", "0.0002", True),
+        ({"ticker": "XXBT", "min_amount": "0.05"}, "0.04", "0.0002", False),
+        ({"ticker": "XXBT", "max_fee_ratio": "0.005"}, "0.04", "0.0002", True),
+        ({"ticker": "XXBT", "max_fee_ratio": "0.005"}, "0.03", "0.0002", False),
+        # Without settings of its own, WITHDRAW_MAX_FEE_RATIO of 1% applies.
+        ({"ticker": "XXBT"}, "0.02", "0.0002", True),
+        ({"ticker": "XXBT"}, "0.0002", "0.0002", False),
+    ],
+)
+def test_that_withdrawals_wait_for_the_threshold_or_fee_ratio(
+    asset_settings, balance, fee, withdraws
+):
+    decision = decide_withdrawal(
+        asset_settings, balance, {"limit": "10", "fee": fee, "amount": balance}
+    )
+
+    assert decision.withdraw == withdraws
+    assert decision.amount == balance
+
+
+def test_that_one_run_plans_withdrawals_for_every_asset(
+    mocked_responses, mocker, get_calls_to_responses
+):
+    mocked_responses.post(
+        url="https://api.kraken.com/0/private/Balance",
+        json={"result": {"XXBT": "0.5", "XETH": "0.01"}, "error": []},
+    )
+    mocked_responses.get(
+        url="https://api.kraken.com/0/public/Time",
+        json={"result": {"unixtime": 1616492376}, "error": []},
+    )
+    for fee in ("0.0002", "0.003"):
+        mocked_responses.post(
+            url="https://api.kraken.com/0/private/WithdrawInfo",
+            json={
+                "result": {"method": "x", "limit": "0.4", "amount": "0", "fee": fee},
+                "error": [],
+            },
+        )
+    mocked_responses.replace(
+        "POST",
+        "https://api.kraken.com/0/private/Withdraw",
+        json={"result": {"refid": "AGBSO6T-UFMTTQ-I7KGS6"}, "error": []},
+    )
+    mocker.patch(
+        "withdraw.get_parameters",
+        return_value={
+            "XXBT-hardwallet": "btc_wallet",
+            "eth-wallet": "eth_wallet",
+            "XXDG-hardwallet": "doge_wallet",
+            "kraken-private-withdraw-api-key": "kQH5HW/8p1uGOVjbgWA7FunAmGO8lsSUXNsu3eow76sz84Q18fWxnyRzBHCd3pd5nE9qa99HAZtuZuj6F1huXg==",
+            "kraken-public-withdraw-api-key": "fake123",
+        },
+    )
+
+    response = lambda_handler(
+        {
+            "assets": [
+                {"ticker": "XXBT", "min_amount": "0.1"},
+                {"ticker": "XETH", "wallet": "eth-wallet"},
+                {"ticker": "XXDG"},
+            ]
+        },
+        None,
+    )
+
+    assert response["statusCode"] == 200
+    assert (
+        len(get_calls_to_responses("POST", "https://api.kraken.com/0/private/Balance"))
+        == 1
+    )
+    withdraw_calls = get_calls_to_responses(
+        "POST", "https://api.kraken.com/0/private/Withdraw"
+    )
+    # XXBT is capped at the limit, XETH's fee is 30% of its balance.
+    assert [call.request_urlencoded_body for call in withdraw_calls] == [
+        {
+            "nonce": withdraw_calls[0].request_urlencoded_body["nonce"],
+            "asset": ["XXBT"],
+            "key": ["btc_wallet"],
+            "amount": ["0.4"],
+        }
+    ]
+    results = json.loads(response["body"])["results"]
+    assert [(r["asset"], r["withdraw"], r["refid"]) for r in results] == [
+        ("XXBT", True, "AGBSO6T-UFMTTQ-I7KGS6"),
+        ("XETH", False, None),
+        ("XXDG", False, None),
+    ]
+    assert {int(r["decided_at"]) for r in results} == {1616492376}
@@ -1,38 +1,34 @@
-import base64
-import hashlib
-import hmac
-import time
-import requests
-import boto3
+import json
+import os
+from dataclasses import asdict, dataclass
+from decimal import Decimal
+import clock_sync
+import lease
+import metrics
+from kraken_client import RequestException, is_auth_error, requests, signed_post
+from ssm_cache import get_parameter, get_parameters, invalidate
 
+PRIVATE_KEY_PARAMETER: str = "kraken-private-withdraw-api-key"
+PUBLIC_KEY_PARAMETER: str = "kraken-public-withdraw-api-key"
+# Used for assets without a min_amount or max_fee_ratio of their own.
+WITHDRAW_MAX_FEE_RATIO: str = os.environ.get("WITHDRAW_MAX_FEE_RATIO", "0.01")
 
-def get_api_sign(
-    api_path: str, urlencoded_body: str, nonce: str, private_key: str
-) -> str:
-
-    api_sha256: hashlib._Hash = hashlib.sha256(
-        nonce.encode() + urlencoded_body.encode()
-    )
-    api_hmac: hmac.HMAC = hmac.new(
-        base64.b64decode(private_key),
-        api_path.encode() + api_sha256.digest(),
-        hashlib.sha512,
-    )
-    api_signature: bytes = base64.b64encode(api_hmac.digest())
-    api_signature_decoded: str = api_signature.decode()
-    return api_signature_decoded
 
-
-def get_nonce() -> str:
-    return str(int(time.time() * 1000))
+@dataclass
+class WithdrawalDecision:
+    asset: str
+    amount: str
+    fee: str = None
+    withdraw: bool = False
+    reason: str = None
+    refid: str = None
+    error: list = None
+    # Kraken's time when the decision was made.
+    decided_at: float = None
 
 
 def get_aws_ssm_securestring_parameter(paramname: str) -> str:
-    client = boto3.client("ssm")
-    securestring: str = client.get_parameter(Name=paramname, WithDecryption=True)[
-        "Parameter"
-    ]["Value"]
-    return securestring
+    return get_parameter(paramname)
 
 
 def withdraw_crypto_from_kraken(
@@ -41,53 +37,204 @@ def withdraw_crypto_from_kraken(
     private_key: str,
     public_key: str,
 ) -> requests.Response:
-    nonce_for_first_api_call: str = get_nonce()
-    url_encoded_balance_body: str = f"nonce={nonce_for_first_api_call}"
-    balance_api_sign: str = get_api_sign(
-        api_path="/0/private/Balance",
-        urlencoded_body=url_encoded_balance_body,
-        nonce=nonce_for_first_api_call,
-        private_key=private_key,
-    )
-    balance_response: requests.Response = requests.post(
-        url="https://api.kraken.com/0/private/Balance",
-        data={"nonce": nonce_for_first_api_call},
-        headers={"API-Key": public_key, "API-Sign": balance_api_sign},
-    )
+    with metrics.phase("balance"):
+        balance_response: requests.Response = signed_post(
+            path="/0/private/Balance",
+            data={},
+            public_key=public_key,
+            private_key=private_key,
+        )
     current_balance = balance_response.json()["result"][asset_to_withdraw]
 
-    nonce_for_second_api_call: str = get_nonce()
-    url_encoded_withdraw_body: str = f"nonce={nonce_for_second_api_call}&asset={asset_to_withdraw}&key={withdrawal_address_key}&amount={current_balance}"
-    withdraw_api_sign: str = get_api_sign(
-        api_path="/0/private/Withdraw",
-        urlencoded_body=url_encoded_withdraw_body,
-        nonce=nonce_for_second_api_call,
-        private_key=private_key,
-    )
-    withdraw_response: requests.Response = requests.post(
-        url="https://api.kraken.com/0/private/Withdraw",
-        data={
-            "nonce": nonce_for_second_api_call,
-            "asset": asset_to_withdraw,
-            "key": withdrawal_address_key,
-            "amount": current_balance,
-        },
-        headers={"API-Key": public_key, "API-Sign": withdraw_api_sign},
-    )
+    with metrics.phase("withdraw"):
+        withdraw_response: requests.Response = signed_post(
+            path="/0/private/Withdraw",
+            data={
+                "asset": asset_to_withdraw,
+                "key": withdrawal_address_key,
+                "amount": current_balance,
+            },
+            public_key=public_key,
+            private_key=private_key,
+        )
     return withdraw_response
 
 
-def lambda_handler(event: dict, context) -> dict:
-    ticker: str = event["ticker"]
-    wallet_key: str = get_aws_ssm_securestring_parameter(f"{ticker}-hardwallet")
-    private_key: str = get_aws_ssm_securestring_parameter(
-        "kraken-private-withdraw-api-key"
+def kraken_post(path: str, data: dict, private_key: str, public_key: str) -> dict:
+    response: requests.Response = signed_post(
+        path=path, data=data, public_key=public_key, private_key=private_key
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+def decide_withdrawal(
+    asset_settings: dict, balance: str, withdraw_info: dict
+) -> WithdrawalDecision:
+    # Withdraws once the balance reaches min_amount, or once the fee is at most
+    # max_fee_ratio of the amount, so fees are paid on fewer, larger transfers.
+    asset: str = asset_settings["ticker"]
+    # Kraken caps a single withdrawal at the limit from WithdrawInfo.
+    amount: Decimal = min(Decimal(balance), Decimal(withdraw_info["limit"]))
+    fee: Decimal = Decimal(withdraw_info["fee"])
+    decision: WithdrawalDecision = WithdrawalDecision(
+        asset=asset, amount=format(amount, "f"), fee=format(fee, "f")
     )
-    public_key: str = get_aws_ssm_securestring_parameter(
-        "kraken-public-withdraw-api-key"
+    if amount <= 0 or amount <= fee:
+        decision.reason = "Balance does not cover the fee"
+        return decision
+    min_amount: str = asset_settings.get("min_amount")
+    max_fee_ratio: str = asset_settings.get("max_fee_ratio")
+    if min_amount is None and max_fee_ratio is None:
+        max_fee_ratio = WITHDRAW_MAX_FEE_RATIO
+    if min_amount is not None and amount >= Decimal(str(min_amount)):
+        decision.withdraw, decision.reason = True, f"At least {min_amount}"
+    elif max_fee_ratio is not None and fee / amount <= Decimal(str(max_fee_ratio)):
+        decision.withdraw, decision.reason = True, f"Fee ratio {fee / amount:.4f}"
+    else:
+        decision.reason = "Below the threshold"
+    return decision
+
+
+def plan_withdrawals(
+    assets: list[dict],
+    wallets: dict[str, str],
+    private_key: str,
+    public_key: str,
+    held: lease.Lease = None,
+) -> list[WithdrawalDecision]:
+    # One Balance call for every asset, then WithdrawInfo and Withdraw one
+    # asset at a time so the nonces arrive in order.
+    with metrics.phase("balance"):
+        balance_data: dict = kraken_post(
+            "/0/private/Balance", {}, private_key, public_key
+        )
+    if balance_data.get("error"):
+        if is_auth_error(balance_data["error"]):
+            invalidate([PRIVATE_KEY_PARAMETER, PUBLIC_KEY_PARAMETER])
+        raise ValueError(f"Error fetching balance: {balance_data['error']}")
+
+    decisions: list[WithdrawalDecision] = []
+    decided_at: float = clock_sync.server_time()
+    for asset_settings in assets:
+        asset: str = asset_settings["ticker"]
+        balance: str = balance_data["result"].get(asset, "0")
+        if Decimal(balance) <= 0:
+            decisions.append(
+                WithdrawalDecision(
+                    asset, balance, reason="No balance", decided_at=decided_at
+                )
+            )
+            continue
+        with metrics.phase("withdraw_info"):
+            info_data: dict = kraken_post(
+                "/0/private/WithdrawInfo",
+                {"asset": asset, "key": wallets[asset], "amount": balance},
+                private_key,
+                public_key,
+            )
+        if info_data.get("error"):
+            decisions.append(
+                WithdrawalDecision(
+                    asset, balance, error=info_data["error"], decided_at=decided_at
+                )
+            )
+            continue
+        decision: WithdrawalDecision = decide_withdrawal(
+            asset_settings, balance, info_data["result"]
+        )
+        decision.decided_at = decided_at
+        if decision.withdraw:
+            if held is not None:
+                lease.ensure_current(held)
+            with metrics.phase("withdraw"):
+                withdraw_data: dict = kraken_post(
+                    "/0/private/Withdraw",
+                    {"asset": asset, "key": wallets[asset], "amount": decision.amount},
+                    private_key,
+                    public_key,
+                )
+            if withdraw_data.get("error"):
+                decision.error = withdraw_data["error"]
+            else:
+                decision.refid = withdraw_data["result"]["refid"]
+        decisions.append(decision)
+    return decisions
+
+
+def handle_planned_withdrawals(event: dict, held: lease.Lease = None) -> dict:
+    assets: list[dict] = event["assets"]
+    wallet_parameters: dict[str, str] = {
+        asset["ticker"]: asset.get("wallet", f"{asset['ticker']}-hardwallet")
+        for asset in assets
+    }
+    with metrics.phase("ssm"):
+        credentials: dict = get_parameters(
+            list(wallet_parameters.values())
+            + [PRIVATE_KEY_PARAMETER, PUBLIC_KEY_PARAMETER]
+        )
+    try:
+        decisions: list[WithdrawalDecision] = plan_withdrawals(
+            assets,
+            {asset: credentials[name] for asset, name in wallet_parameters.items()},
+            credentials[PRIVATE_KEY_PARAMETER],
+            credentials[PUBLIC_KEY_PARAMETER],
+            held,
+        )
+    except ValueError as e:
+        return {"statusCode": 400, "body": json.dumps({"message": str(e)})}
+    except RequestException as e:
+        return {
+            "statusCode": 500,
+            "body": json.dumps({"message": "API request failed", "error": str(e)}),
+        }
+    if any(is_auth_error(decision.error or []) for decision in decisions):
+        invalidate([PRIVATE_KEY_PARAMETER, PUBLIC_KEY_PARAMETER])
+    metrics.set_properties(
+        withdrawals=sum(1 for decision in decisions if decision.refid)
     )
+    results: list[dict] = [asdict(decision) for decision in decisions]
+    print(f"withdrawals: {json.dumps(results)}")
+    failed: bool = any(decision.error for decision in decisions)
+    return {
+        "statusCode": 207 if failed else 200,
+        "body": json.dumps({"results": results}),
+    }
+
+
+def lambda_handler(event: dict, context) -> dict:
+    metrics.start_invocation("withdraw")
+    status_code: int = None
+    try:
+        with lease.hold(
+            f"withdraw:{PUBLIC_KEY_PARAMETER}", lease.run_owner(context)
+        ) as held:
+            if "assets" in event:
+                planned: dict = handle_planned_withdrawals(event, held)
+                status_code = planned["statusCode"]
+                return planned
+            status_code = withdraw_ticker(event["ticker"])
+    except (lease.LeaseHeld, lease.LeaseLost) as e:
+        status_code = 409
+        return {"statusCode": 409, "body": json.dumps({"message": str(e)})}
+    finally:
+        metrics.finish_invocation(statusCode=status_code)
+
+
+def withdraw_ticker(ticker: str) -> int:
+    wallet_parameter: str = f"{ticker}-hardwallet"
+    with metrics.phase("ssm"):
+        credentials: dict = get_parameters(
+            [wallet_parameter, PRIVATE_KEY_PARAMETER, PUBLIC_KEY_PARAMETER]
+        )
 
     response: requests.Response = withdraw_crypto_from_kraken(
-        ticker, wallet_key, private_key, public_key
+        ticker,
+        credentials[wallet_parameter],
+        credentials[PRIVATE_KEY_PARAMETER],
+        credentials[PUBLIC_KEY_PARAMETER],
     )
+    if is_auth_error(response.json().get("error", [])):
+        invalidate([PRIVATE_KEY_PARAMETER, PUBLIC_KEY_PARAMETER])
     print(f"status_code: {response.status_code} body: {response.json()}")
+    return response.status_code
@@ -5,16 +5,32 @@
 #   output_path = "./${path.module}/layer.zip"
 # }
 
+locals {
+  python_source_excludes = setunion(
+    fileset("./${path.module}/../python_scripts", "test_*.py"),
+    fileset("./${path.module}/../python_scripts", "conftest.py"),
+    fileset("./${path.module}/../python_scripts", "bench_*.py"),
+    fileset("./${path.module}/../python_scripts", "*_stub_server.py"),
+    fileset("./${path.module}/../python_scripts", "backtest.py"),
+    fileset("./${path.module}/../python_scripts", "history_store.py"),
+    fileset("./${path.module}/../python_scripts", "service.py"),
+    fileset("./${path.module}/../python_scripts", "**/__pycache__/**"),
+    fileset("./${path.module}/../python_scripts", ".pytest_cache/**"),
+  )
+}
+
 data "archive_file" "source_code_zip" {
   type = "zip"
 
-  source_file = "./${path.module}/../python_scripts/dca.py"
+  source_dir  = "./${path.module}/../python_scripts"
+  excludes    = local.python_source_excludes
   output_path = "./${path.module}/python_code.zip"
 }
 
 # data "archive_file" "withdraw_source_code_zip" {
 #   type = "zip"
 
-#   source_file = "./${path.module}/../python_scripts/withdraw.py"
+#   source_dir  = "./${path.module}/../python_scripts"
+#   excludes    = local.python_source_excludes
 #   output_path = "./${path.module}/kraken_withdraw_python_code.zip"
 # }
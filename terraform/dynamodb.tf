@@ -0,0 +1,15 @@
+# Leases shared by every Lambda sandbox, so a duplicate or retried delivery in
+# another sandbox is turned away too. Provisioned at one unit each to stay in
+# the free tier.
+resource "aws_dynamodb_table" "kraken_dca_leases" {
+  name           = "kraken-dca-leases"
+  billing_mode   = "PROVISIONED"
+  read_capacity  = 1
+  write_capacity = 1
+  hash_key       = "lease_key"
+
+  attribute {
+    name = "lease_key"
+    type = "S"
+  }
+}
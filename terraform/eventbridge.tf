@@ -14,19 +14,30 @@ resource "aws_cloudwatch_event_rule" "kraken_dca_lambda_event_rule" {
 
 locals {
  order_expires = random_integer.minutes.result - 60 
+ # Keeps the run's lease until shortly before the next tick, so a duplicate
+ # delivery of this tick does not buy again.
+ cooldown_minutes = random_integer.minutes.result - 60
 }
 
 resource "aws_cloudwatch_event_target" "kraken_dca_lambda_event_target" {
   arn   = aws_lambda_function.kraken-dca-lambda.arn
   rule  = aws_cloudwatch_event_rule.kraken_dca_lambda_event_rule.name
-  input = <<EOF
+  # The scheduled time ties every retry of one tick to the same order userref.
+  input_transformer {
+    input_paths = {
+      time = "$.time"
+    }
+    input_template = <<EOF
     {
         "trading_pair": "XBTAUD",
         "crypto_to_buy": "BTC",
         "currency": "ZAUD",
-        "order_expires": "${local.order_expires}"
+        "order_expires": "${local.order_expires}",
+        "cooldown_minutes": "${local.cooldown_minutes}",
+        "scheduled_at": <time>
     }
     EOF
+  }
 }
 
 resource "aws_lambda_permission" "allow_cloudwatch_to_call_lambda" {
@@ -31,4 +31,21 @@ resource "aws_iam_role_policy_attachment" "kraken_dca_lambda_access_to_ssm" {
 resource "aws_iam_role_policy_attachment" "iam_role_policy_attachment_lambda_vpc_access_execution" {
   role       = aws_iam_role.iam-for-lambda.name
   policy_arn = "arn:aws:iam::aws:policy/service-role/AWSLambdaVPCAccessExecutionRole"
-}
\ No newline at end of file
+}
+resource "aws_iam_role_policy" "kraken_dca_lambda_access_to_leases" {
+  name = "kraken-dca-lambda-access-to-leases"
+  role = aws_iam_role.iam-for-lambda.id
+
+  policy = <<EOF
+    {
+      "Version": "2012-10-17",
+      "Statement": [
+        {
+          "Action": ["dynamodb:GetItem", "dynamodb:UpdateItem"],
+          "Effect": "Allow",
+          "Resource": "${aws_dynamodb_table.kraken_dca_leases.arn}"
+        }
+      ]
+    }
+    EOF
+}
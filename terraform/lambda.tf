@@ -10,7 +10,7 @@ resource "aws_lambda_function" "kraken-dca-lambda" {
 
   filename = "python_code.zip"
 
-  runtime = "python3.8"
+  runtime = "python3.10"
   handler = "dca.lambda_handler"
 
   # layers = [aws_lambda_layer_version.kraken_dca_dependencies.arn]
@@ -19,7 +19,15 @@ resource "aws_lambda_function" "kraken-dca-lambda" {
 
   role = aws_iam_role.iam-for-lambda.arn
 
-  timeout = 10
+  # Room for a drain of queued intents or a re-pricing window after the
+  # orders, each AddOrder can take a connect and a read timeout.
+  timeout = 30
+
+  environment {
+    variables = {
+      LEASE_TABLE = aws_dynamodb_table.kraken_dca_leases.name
+    }
+  }
 
 }
 
@@ -28,7 +36,7 @@ resource "aws_lambda_function" "kraken-dca-lambda" {
 
 #   filename = "kraken_withdraw_python_code.zip"
 
-#   runtime = "python3.8"
+#   runtime = "python3.10"
 #   handler = "withdraw.lambda_handler"
 
 #   #layers = [aws_lambda_layer_version.kraken_dca_dependencies.arn]
@@ -37,6 +45,12 @@ resource "aws_lambda_function" "kraken-dca-lambda" {
 
 #   role = aws_iam_role.iam-for-lambda.arn
 
-#   timeout = 10
+#   timeout = 30
+
+#   environment {
+#     variables = {
+#       LEASE_TABLE = aws_dynamodb_table.kraken_dca_leases.name
+#     }
+#   }
 
 # }